@@ -2,22 +2,42 @@
 #  app.py (Versión de Alto Rendimiento)
 # =========================================================================
 import os
+import re
+import json
 import click
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request
+import atexit
+import base64
+import shutil
+import tempfile
+import hashlib
+import threading
+import time
+import random
+from io import BytesIO
+from bisect import bisect_left
+from itertools import chain
+from functools import lru_cache, wraps
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from datetime import datetime, timedelta, timezone
+from flask import Flask, Request, jsonify, request, abort, send_from_directory, session, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import or_, and_, desc, distinct
-from sqlalchemy.orm import joinedload # OPTIMIZACIÓN: Importamos para carga eficiente
+from sqlalchemy import or_, and_, desc, distinct, bindparam, tuple_, case, event, inspect, literal_column, DDL, Engine
+from sqlalchemy.orm import joinedload, Session # OPTIMIZACIÓN: Importamos para carga eficiente
+from sqlalchemy.dialects import postgresql, sqlite
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_jwt_extended import (
     JWTManager, jwt_required, create_access_token, 
     get_jwt_identity, decode_token
 )
-from flask_socketio import SocketIO, emit, join_room
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 from supabase import create_client, Client
+from PIL import Image, ImageFilter, ImageOps
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,6 +50,46 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "").replace("postgres://", "postgr
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY")
+# Contador de vistas diferido: cada cuántos segundos se vuelcan las vistas acumuladas
+# y cuántas vistas pendientes se toleran como máximo antes de forzar un volcado.
+app.config['VIEW_COUNTER_FLUSH_INTERVAL'] = float(os.environ.get('VIEW_COUNTER_FLUSH_INTERVAL', 10))
+app.config['VIEW_COUNTER_MAX_LAG'] = int(os.environ.get('VIEW_COUNTER_MAX_LAG', 500))
+# Contadores fragmentados de likes/guardados para álbumes muy activos: número de fragmentos (0 = desactivado),
+# a partir de cuántos likes/guardados se usan y cada cuántos segundos se fusionan en la fila del álbum.
+app.config['ALBUM_COUNTER_SHARDS'] = int(os.environ.get('ALBUM_COUNTER_SHARDS', 0))
+app.config['ALBUM_COUNTER_HOT_THRESHOLD'] = int(os.environ.get('ALBUM_COUNTER_HOT_THRESHOLD', 1000))
+app.config['ALBUM_COUNTER_MERGE_INTERVAL'] = float(os.environ.get('ALBUM_COUNTER_MERGE_INTERVAL', 30))
+# Presencia de usuarios: cada cuántos segundos se vuelcan is_active/last_seen a la BD
+app.config['PRESENCE_FLUSH_INTERVAL'] = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', 30))
+# Varios workers: cola de mensajes de Socket.IO (p. ej. redis://localhost:6379/0) para que los emit
+# lleguen a sockets conectados en otro proceso, y dónde se guardan los sids de cada usuario.
+# Con más de un worker la presencia debe ser 'redis'; 'memory' solo sirve para un proceso.
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+app.config['PRESENCE_BACKEND'] = os.environ.get('PRESENCE_BACKEND', 'redis' if (app.config['SOCKETIO_MESSAGE_QUEUE'] or '').startswith('redis') else 'memory')
+app.config['PRESENCE_REDIS_URL'] = os.environ.get('PRESENCE_REDIS_URL', app.config['SOCKETIO_MESSAGE_QUEUE'])
+# Con presencia 'redis' cada worker renueva un latido con este TTL (segundos). Si un worker cae sin cerrar sus
+# sockets, otro worker retira sus sids cuando el latido caduca y esos usuarios pasan a offline.
+app.config['PRESENCE_WORKER_TTL'] = float(os.environ.get('PRESENCE_WORKER_TTL', 90))
+# Segundos que una caché compartida (CDN) puede servir una respuesta pública sin revalidarla
+app.config['HTTP_CACHE_SHARED_MAX_AGE'] = int(os.environ.get('HTTP_CACHE_SHARED_MAX_AGE', 30))
+# Caché de respuestas JSON de GET anónimos: 'memory' (por proceso), 'redis' (compartida entre workers) o 'none'
+app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_MB', 32)) * 1024 * 1024
+app.config['RESPONSE_CACHE_REDIS_URL'] = os.environ.get('RESPONSE_CACHE_REDIS_URL', app.config['PRESENCE_REDIS_URL'])
+# Feed de seguidos (/api/me/feed): timelines por usuario en 'memory' (por proceso) o 'redis', cuántos álbumes
+# guarda cada uno, cuántos timelines caben en memoria y su TTL. Los autores con más de
+# TIMELINE_FANOUT_MAX_FOLLOWERS seguidores no reparten sus álbumes al publicar: se mezclan al leer el feed.
+app.config['TIMELINE_BACKEND'] = os.environ.get('TIMELINE_BACKEND', 'redis' if app.config['RESPONSE_CACHE_BACKEND'] == 'redis' else 'memory')
+app.config['TIMELINE_REDIS_URL'] = os.environ.get('TIMELINE_REDIS_URL', app.config['RESPONSE_CACHE_REDIS_URL'])
+app.config['TIMELINE_MAX_ITEMS'] = int(os.environ.get('TIMELINE_MAX_ITEMS', 300))
+app.config['TIMELINE_MAX_USERS'] = int(os.environ.get('TIMELINE_MAX_USERS', 10000))
+app.config['TIMELINE_TTL'] = int(os.environ.get('TIMELINE_TTL', 3600))
+app.config['TIMELINE_FANOUT_MAX_FOLLOWERS'] = int(os.environ.get('TIMELINE_FANOUT_MAX_FOLLOWERS', 1000))
+# Métricas por ruta (/api/admin/metrics): latencia, consultas SQL y tiempo en BD. Una petición se marca
+# como posible N+1 si repite la misma sentencia más de METRICS_N_PLUS_ONE_THRESHOLD veces.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 10))
 
 origins = [
     "http://127.0.0.1:5500",
@@ -37,7 +97,7 @@ origins = [
     "https://exponiendotacna.onrender.com"
 ]
 CORS(app, resources={r"/api/*": {"origins": origins}})
-socketio = SocketIO(app, cors_allowed_origins=origins)
+socketio = SocketIO(app, cors_allowed_origins=origins, message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'])
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
@@ -48,14 +108,46 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY) if SUPABASE_URL and SUPABASE_KEY else None
 BUCKET_NAME = "database"
 
+# Resolución de URLs públicas: 'supabase' (por defecto), 'local' (servidor estático, p. ej. para pruebas) o 'cdn'
+app.config['MEDIA_URL_BACKEND'] = os.environ.get('MEDIA_URL_BACKEND', 'supabase')
+app.config['MEDIA_LOCAL_URL'] = os.environ.get('MEDIA_LOCAL_URL', 'http://localhost:5000/media')
+app.config['MEDIA_CDN_URL'] = os.environ.get('MEDIA_CDN_URL')
+app.config['PUBLIC_URL_CACHE_SIZE'] = int(os.environ.get('PUBLIC_URL_CACHE_SIZE', 8192))
+
+# Almacenamiento de archivos: 'supabase' (por defecto) o 'local' (disco, para pruebas sin conexión)
+app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'supabase')
+app.config['LOCAL_STORAGE_DIR'] = os.environ.get('LOCAL_STORAGE_DIR', os.path.join(app.instance_path, 'media'))
+app.config['UPLOAD_TMP_DIR'] = os.environ.get('UPLOAD_TMP_DIR')  # None = directorio temporal del sistema
+app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_SIZE_MB', 200)) * 1024 * 1024
+# Werkzeug corta la lectura del cuerpo en cuanto se supera este tamaño (margen para el resto del multipart)
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_SIZE'] + 1024 * 1024
+
+# Variantes redimensionadas de cada imagen subida (anchos en px) y el ancho usado en las tarjetas de álbum
+app.config['IMAGE_VARIANT_WIDTHS'] = tuple(int(w) for w in os.environ.get('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(','))
+app.config['CARD_IMAGE_WIDTH'] = int(os.environ.get('CARD_IMAGE_WIDTH', 640))
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+
+# Notificaciones: ventana (s) en la que eventos iguales se agrupan en una sola y espera (s) antes de avisar por socket
+app.config['NOTIFICATION_COALESCE_WINDOW'] = int(os.environ.get('NOTIFICATION_COALESCE_WINDOW', 3600))
+app.config['NOTIFICATION_EMIT_DEBOUNCE'] = float(os.environ.get('NOTIFICATION_EMIT_DEBOUNCE', 2))
+
 # --- 3. Modelos de la Base de Datos ---
+# Los índices de búsqueda (GIN con pg_trgm / tsvector) solo existen en PostgreSQL
+event.listen(db.metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+ALBUM_SEARCH_DOCUMENT = "to_tsvector('simple', coalesce(album.title, '') || ' ' || coalesce(album.description, ''))"
+
 album_tags = db.Table('album_tags',
     db.Column('album_id', db.Integer, db.ForeignKey('album.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # La PK empieza por album_id; este índice sirve para recorrer los álbumes de una etiqueta
+    db.Index('ix_album_tags_tag_album', 'tag_id', 'album_id')
 )
 
 class User(db.Model):
     __tablename__ = 'user'
+    __table_args__ = (
+        db.Index('ix_user_username_trgm', 'username', postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -63,10 +155,17 @@ class User(db.Model):
     bio = db.Column(db.Text, nullable=True)
     profile_picture_path = db.Column(db.String(255), nullable=True)
     banner_image_path = db.Column(db.String(255), nullable=True)
+    profile_picture_variants = db.Column(db.JSON, nullable=True)
+    banner_image_variants = db.Column(db.JSON, nullable=True)
     is_admin = db.Column(db.Boolean, default=False)
     is_approved = db.Column(db.Boolean, default=False, nullable=False) # <-- NUEVO
     is_active = db.Column(db.Boolean, default=False, nullable=False)   # <-- NUEVO
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)       # <-- NUEVO
+    # Contadores desnormalizados de la tabla Follow (ver toggle_follow y `flask recompute-follow-counts`)
+    followers_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    following_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Versión de la fila para ETag/Last-Modified (no cambia con is_active/last_seen)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     albums = db.relationship('Album', back_populates='owner', cascade="all, delete-orphan")
     comments = db.relationship('Comment', back_populates='author', cascade="all, delete-orphan")
     reported_albums = db.relationship('Report', back_populates='reporter', cascade="all, delete-orphan")
@@ -76,6 +175,14 @@ class User(db.Model):
 
 class Album(db.Model):
     __tablename__ = 'album'
+    __table_args__ = (
+        db.Index('ix_album_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_album_search_document', db.text(ALBUM_SEARCH_DOCUMENT.replace('album.', '')), postgresql_using='gin').ddl_if(dialect='postgresql'),
+        # Álbumes de un usuario (perfil, feed) y listados por cursor sobre (columna de orden, id)
+        db.Index('ix_album_user_id', 'user_id', 'id'),
+        db.Index('ix_album_created_at_id', 'created_at', 'id'),
+        db.Index('ix_album_views_count_id', 'views_count', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -86,32 +193,48 @@ class Album(db.Model):
     saves_count = db.Column(db.Integer, default=0, nullable=False)
     shares_count = db.Column(db.Integer, default=0, nullable=False)
     thumbnail_path = db.Column(db.String(255), nullable=True)
+    # Versión de la fila para ETag/Last-Modified; también cambia con sus archivos, comentarios y
+    # etiquetas (ver _touch_changed_albums), pero no con el volcado de vistas
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     owner = db.relationship('User', back_populates='albums')
     media = db.relationship('Media', back_populates='album', lazy='dynamic', cascade="all, delete-orphan")
     tags = db.relationship('Tag', secondary=album_tags, back_populates='albums')
     comments = db.relationship('Comment', back_populates='album', lazy='dynamic', cascade="all, delete-orphan")
     likes = db.relationship('AlbumLike', back_populates='album', cascade="all, delete-orphan")
     saved_by = db.relationship('SavedAlbum', back_populates='album', cascade="all, delete-orphan")
+    counter_shards = db.relationship('AlbumCounterShard', cascade="all, delete-orphan")
     reports = db.relationship('Report', back_populates='album', cascade="all, delete-orphan")
 
 class Media(db.Model):
     __tablename__ = 'media'
+    __table_args__ = (db.Index('ix_media_album_position', 'album_id', 'position', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     file_path = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     album_id = db.Column(db.Integer, db.ForeignKey('album.id'), nullable=False)
     position = db.Column(db.Integer, default=0, nullable=False)
+    # {'webp': {'320': ruta, ...}, 'jpeg': {...}, 'placeholder': 'data:image/webp;base64,...'}
+    variants = db.Column(db.JSON, nullable=True)
     album = db.relationship('Album', back_populates='media')
 
 class Tag(db.Model):
     __tablename__ = 'tag'
+    __table_args__ = (
+        db.Index('ix_tag_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
+    # Contador desnormalizado de album_tags (ver set_album_tags y `flask recompute-tag-counts`)
+    albums_count = db.Column(db.Integer, default=0, server_default='0', nullable=False, index=True)
     albums = db.relationship('Album', secondary=album_tags, back_populates='tags')
 
 class Comment(db.Model):
     __tablename__ = 'comment'
+    __table_args__ = (
+        db.Index('ix_comment_album_parent_created', 'album_id', 'parent_id', 'created_at'),
+        db.Index('ix_comment_parent_created', 'parent_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -125,21 +248,33 @@ class Comment(db.Model):
 
 class Follow(db.Model):
     __tablename__ = 'follow'
+    # La PK (follower_id, followed_id) no sirve para buscar los seguidores de un usuario
+    __table_args__ = (db.Index('ix_follow_followed_follower', 'followed_id', 'follower_id'),)
     follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     followed_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
 
 class AlbumLike(db.Model):
     __tablename__ = 'album_like'
+    __table_args__ = (db.Index('ix_album_like_album_user', 'album_id', 'user_id'),)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     album_id = db.Column(db.Integer, db.ForeignKey('album.id'), primary_key=True)
     album = db.relationship('Album', back_populates='likes')
 
 class SavedAlbum(db.Model):
     __tablename__ = 'saved_album'
+    __table_args__ = (db.Index('ix_saved_album_album_user', 'album_id', 'user_id'),)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
     album_id = db.Column(db.Integer, db.ForeignKey('album.id'), primary_key=True)
     album = db.relationship('Album', back_populates='saved_by')
 
+class AlbumCounterShard(db.Model):
+    # Deltas de likes/guardados aún sin fusionar en Album (ver AlbumCounterShards)
+    __tablename__ = 'album_counter_shard'
+    album_id = db.Column(db.Integer, db.ForeignKey('album.id'), primary_key=True)
+    shard = db.Column(db.SmallInteger, primary_key=True)
+    likes_count = db.Column(db.Integer, default=0, nullable=False)
+    saves_count = db.Column(db.Integer, default=0, nullable=False)
+
 class Report(db.Model):
     __tablename__ = 'report'
     id = db.Column(db.Integer, primary_key=True)
@@ -161,6 +296,10 @@ class CommentReport(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notification'
+    __table_args__ = (
+        db.Index('ix_notification_coalesce', 'recipient_id', 'notification_type', 'related_entity_id'),
+        db.Index('ix_notification_recipient_created', 'recipient_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     actor_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -168,11 +307,20 @@ class Notification(db.Model):
     related_entity_id = db.Column(db.Integer, nullable=True)
     is_read = db.Column(db.Boolean, default=False, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    actor_count = db.Column(db.Integer, default=1, server_default='1', nullable=False)  # actores agrupados en esta notificación
     recipient = db.relationship('User', foreign_keys=[recipient_id])
     actor = db.relationship('User', foreign_keys=[actor_id])
+    actors = db.relationship('NotificationActor', cascade='all, delete-orphan', passive_deletes=True)
+
+class NotificationActor(db.Model):
+    # Actores distintos de una notificación agrupada: actor_count solo sube cuando entra uno nuevo
+    __tablename__ = 'notification_actor'
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id', ondelete='CASCADE'), primary_key=True)
+    actor_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
 
 class Message(db.Model):
     __tablename__ = 'message'
+    __table_args__ = (db.Index('ix_message_pair_created', 'sender_id', 'recipient_id', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -183,37 +331,1433 @@ class Message(db.Model):
     sender = db.relationship('User', foreign_keys=[sender_id])
     recipient = db.relationship('User', foreign_keys=[recipient_id])
 
+class Conversation(db.Model):
+    """Resumen de cada conversación (par de usuarios, user_low_id < user_high_id) para la bandeja de /api/chats."""
+    __tablename__ = 'conversation'
+    __table_args__ = (
+        db.Index('ix_conversation_low_last_message', 'user_low_id', 'last_message_at'),
+        db.Index('ix_conversation_high_last_message', 'user_high_id', 'last_message_at'),
+    )
+    user_low_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id', ondelete='SET NULL'), nullable=True)
+    last_message_preview = db.Column(db.String(255), nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=True)
+    last_sender_id = db.Column(db.Integer, nullable=True)
+    unread_low = db.Column(db.Integer, default=0, server_default='0', nullable=False)   # mensajes sin leer por user_low_id
+    unread_high = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # mensajes sin leer por user_high_id
+
 # --- 4. FUNCIONES DE AYUDA (HELPERS) ---
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'avi', 'mov'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_public_url(path):
-    return supabase.storage.from_(BUCKET_NAME).get_public_url(path) if path and supabase else None
+class PublicUrlResolver:
+    """Construye URLs públicas concatenando la ruta a una base precalculada, con memoización acotada.
+
+    Reemplaza la llamada a supabase.storage.from_(...).get_public_url() por cada archivo.
+    """
+    def __init__(self, base_url, cache_size):
+        self.base_url = base_url.rstrip('/') + '/' if base_url else None
+        self._build = lru_cache(maxsize=cache_size)(self._build_uncached)
+
+    def _build_uncached(self, path):
+        return self.base_url + quote(path.lstrip('/'), safe='/')
+
+    def __call__(self, path):
+        return self._build(path) if path and self.base_url else None
 
-def handle_supabase_upload(user_username, file, object_path):
-    if not (file and allowed_file(file.filename) and supabase): return None
-    file_content = file.read()
+URL_BACKENDS = {
+    'supabase': lambda: f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{BUCKET_NAME}" if supabase else None,
+    'local': lambda: app.config['MEDIA_LOCAL_URL'],
+    'cdn': lambda: app.config['MEDIA_CDN_URL'],
+}
+
+def create_url_resolver(backend=None):
+    backend = backend or app.config['MEDIA_URL_BACKEND']
+    if backend not in URL_BACKENDS: raise ValueError(f"Backend de URLs desconocido: {backend}")
+    return PublicUrlResolver(URL_BACKENDS[backend](), app.config['PUBLIC_URL_CACHE_SIZE'])
+
+public_url_resolver = create_url_resolver()
+
+def get_public_url(path):
+    return public_url_resolver(path)
+
+class SizeLimitedUploadFile:
+    """Archivo temporal en disco en el que Werkzeug escribe cada archivo subido a medida que llega.
+
+    Nunca se guarda el archivo completo en memoria y la subida se corta en cuanto supera MAX_UPLOAD_SIZE.
+    """
+    def __init__(self, limit):
+        self._file = tempfile.NamedTemporaryFile(prefix='upload_', dir=app.config['UPLOAD_TMP_DIR'])
+        self.limit, self.size = limit, 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f"El archivo supera el máximo de {self.limit // (1024 * 1024)} MB")
+        return self._file.write(data)
+
+    def __iter__(self): return iter(self._file)
+    def __getattr__(self, name): return getattr(self._file, name)
+
+class StreamingUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SizeLimitedUploadFile(app.config['MAX_UPLOAD_SIZE'])
+
+app.request_class = StreamingUploadRequest
+
+class SupabaseStorage:
+    def upload(self, object_path, source_path, content_type):
+        # Con un archivo abierto (BufferedReader), httpx envía el cuerpo por bloques sin leerlo entero
+        with open(source_path, 'rb') as source:
+            supabase.storage.from_(BUCKET_NAME).upload(file=source, path=object_path, file_options={"content-type": content_type})
+
+    def remove(self, object_paths):
+        supabase.storage.from_(BUCKET_NAME).remove(object_paths)
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def full_path(self, object_path):
+        path = os.path.abspath(os.path.join(self.root, object_path))
+        if not path.startswith(self.root + os.sep): raise ValueError(f"Ruta fuera del almacenamiento: {object_path}")
+        return path
+
+    def upload(self, object_path, source_path, content_type):
+        destination = self.full_path(object_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(source_path, destination)
+
+    def remove(self, object_paths):
+        for object_path in object_paths:
+            try: os.remove(self.full_path(object_path))
+            except FileNotFoundError: pass
+
+STORAGE_BACKENDS = {
+    'supabase': lambda: SupabaseStorage() if supabase else None,
+    'local': lambda: LocalStorage(app.config['LOCAL_STORAGE_DIR']),
+}
+storage = STORAGE_BACKENDS[app.config['STORAGE_BACKEND']]()
+
+def handle_upload(user_username, file, object_path):
+    if not (file and allowed_file(file.filename) and storage): return None
     filename = secure_filename(file.filename)
     unique_filename = f"{user_username}/{object_path}/{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{filename}"
-    supabase.storage.from_(BUCKET_NAME).upload(file=file_content, path=unique_filename, file_options={"content-type": file.content_type})
+    file.stream.flush()
+    storage.upload(unique_filename, file.stream.name, file.content_type)
     return unique_filename
 
-def delete_from_supabase(path):
-    if path and supabase:
+def delete_from_storage(paths):
+    paths = [p for p in (paths if isinstance(paths, list) else [paths]) if p]
+    if paths and storage:
         try:
-            supabase.storage.from_(BUCKET_NAME).remove([path])
+            storage.remove(paths)
         except Exception as e:
-            print(f"Error al eliminar de Supabase: {e}")
+            print(f"Error al eliminar del almacenamiento: {e}")
+
+# --- Variantes de imagen (miniaturas y tamaños responsivos) ---
+VARIANT_FORMATS = (('webp', 'WEBP', 'image/webp'), ('jpeg', 'JPEG', 'image/jpeg'))
+image_executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix='image-variants')
+
+def run_cpu_bound(fn, *args):
+    # Con eventlet los hilos son green threads: el trabajo pesado se manda a hilos reales del sistema
+    try:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched('thread'): return tpool.execute(fn, *args)
+    except ImportError:
+        pass
+    return fn(*args)
+
+def render_image_variants(source_path, widths):
+    """Devuelve {(formato, ancho): bytes} y un placeholder diminuto y desenfocado en data URI."""
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    rendered = {}
+    # No ampliamos: solo anchos menores que el original (o el original si es más pequeño que todos)
+    target_widths = sorted({min(width, image.width) for width in widths})
+    for width in target_widths:
+        resized = image if width == image.width else image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for key, pil_format, _ in VARIANT_FORMATS:
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, quality=80)
+            rendered[(key, width)] = buffer.getvalue()
+    tiny = image.copy()
+    tiny.thumbnail((16, 16))
+    buffer = BytesIO()
+    tiny.filter(ImageFilter.GaussianBlur(1)).save(buffer, 'WEBP', quality=30)
+    placeholder = 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    return rendered, placeholder
+
+def generate_variants(source_path, object_path):
+    rendered, placeholder = run_cpu_bound(render_image_variants, source_path, app.config['IMAGE_VARIANT_WIDTHS'])
+    variants = {'placeholder': placeholder}
+    base_path = os.path.splitext(object_path)[0]
+    content_types = {key: content_type for key, _, content_type in VARIANT_FORMATS}
+    for (key, width), data in rendered.items():
+        variant_path = f"{base_path}_w{width}.{'jpg' if key == 'jpeg' else key}"
+        with tempfile.NamedTemporaryFile(prefix='variant_', dir=app.config['UPLOAD_TMP_DIR']) as tmp:
+            tmp.write(data)
+            tmp.flush()
+            storage.upload(variant_path, tmp.name, content_types[key])
+        variants.setdefault(key, {})[str(width)] = variant_path
+    return variants
+
+def _process_variants(model, row_id, path_column, variants_column, source_path, object_path):
+    try:
+        variants = generate_variants(source_path, object_path)
+        with app.app_context():
+            # Solo se guardan si el archivo sigue siendo el actual (p. ej. el avatar no se ha vuelto a cambiar)
+            updated = model.query.filter(model.id == row_id, getattr(model, path_column) == object_path)\
+                .update({variants_column: variants}, synchronize_session=False)
+            if updated and model is Media:
+                album_id = db.session.query(Media.album_id).filter(Media.id == row_id).scalar()
+                touch_albums(db.session.connection(), [album_id])
+                invalidate_responses(*album_response_tags(album_id))
+            elif updated and model is User:
+                invalidate_responses(f"profile:{db.session.query(User.username).filter(User.id == row_id).scalar()}")
+            db.session.commit()
+        if not updated: delete_from_storage(variant_paths(variants))
+    except Exception as e:
+        print(f"Error al generar variantes de {object_path}: {e}")
+    finally:
+        os.remove(source_path)
+
+def schedule_image_variants(model, row_id, path_column, variants_column, file, object_path):
+    """Genera las variantes de una imagen recién subida en el pool de trabajo, fuera del hilo de la petición."""
+    if not (storage and file.content_type and file.content_type.startswith('image')): return None
+    # El temporal de la subida se borra al terminar la petición: el trabajo usa su propia copia
+    fd, job_path = tempfile.mkstemp(prefix='variants_', dir=app.config['UPLOAD_TMP_DIR'])
+    os.close(fd)
+    file.stream.flush()
+    shutil.copyfile(file.stream.name, job_path)
+    return image_executor.submit(_process_variants, model, row_id, path_column, variants_column, job_path, object_path)
+
+def variant_paths(variants):
+    return [path for key, _, _ in VARIANT_FORMATS for path in ((variants or {}).get(key) or {}).values()]
+
+def serialize_variants(variants):
+    """srcset por formato, URL al ancho de tarjeta y placeholder, listos para <img>/<picture>."""
+    if not variants: return None
+    srcsets = {key: ', '.join(f"{get_public_url(path)} {width}w" for width, path in sorted(variants[key].items(), key=lambda item: int(item[0])))
+               for key, _, _ in VARIANT_FORMATS if variants.get(key)}
+    webp = variants.get('webp') or {}
+    card_width = min(webp, key=lambda width: abs(int(width) - app.config['CARD_IMAGE_WIDTH']), default=None)
+    return {'srcset': srcsets, 'card_url': get_public_url(webp[card_width]) if card_width else None, 'placeholder': variants.get('placeholder')}
+
+class ViewCounterBuffer:
+    """Acumula las vistas de cada álbum en memoria y las vuelca a la BD en lotes.
+
+    Evita un UPDATE + commit con bloqueo de fila en cada GET /api/albums/<id>.
+    """
+    def __init__(self, flush_interval, max_lag):
+        self.flush_interval = flush_interval
+        self.max_lag = max_lag
+        self._pending = {}   # album_id -> vistas aún no volcadas
+        self._inflight = {}  # album_id -> vistas que se están escribiendo ahora mismo
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._started = False
+
+    def increment(self, album_id):
+        with self._lock:
+            self._pending[album_id] = self._pending.get(album_id, 0) + 1
+            self._pending_total += 1
+            must_flush = self._pending_total >= self.max_lag
+        self._ensure_started()
+        if must_flush: self.flush()
+
+    def pending(self, album_id):
+        # Vistas registradas que todavía no se reflejan en album.views_count
+        with self._lock:
+            return self._pending.get(album_id, 0) + self._inflight.get(album_id, 0)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending: return
+                batch, self._pending, self._pending_total = self._pending, {}, 0
+                self._inflight = batch
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    album_table = Album.__table__
+                    conn.execute(
+                        album_table.update()
+                            .where(album_table.c.id == bindparam('b_album_id'))
+                            .values(views_count=db.func.coalesce(album_table.c.views_count, 0) + bindparam('b_increment'), updated_at=album_table.c.updated_at),
+                        [{'b_album_id': album_id, 'b_increment': count} for album_id, count in batch.items()]
+                    )
+            except Exception as e:
+                print(f"Error al volcar el contador de vistas: {e}")
+                # Devolvemos las vistas al buffer para reintentarlas en el siguiente volcado
+                with self._lock:
+                    for album_id, count in batch.items():
+                        self._pending[album_id] = self._pending.get(album_id, 0) + count
+                        self._pending_total += count
+            finally:
+                with self._lock: self._inflight = {}
+
+    def _ensure_started(self):
+        if self._started: return
+        with self._lock:
+            if self._started: return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.flush_interval)
+            self.flush()
+
+view_counter = ViewCounterBuffer(app.config['VIEW_COUNTER_FLUSH_INTERVAL'], app.config['VIEW_COUNTER_MAX_LAG'])
+atexit.register(view_counter.flush)
+
+class AlbumCounterShards:
+    """Reparte los ±1 de likes/guardados de los álbumes muy activos entre varias filas de album_counter_shard.
+
+    Los clics simultáneos sobre el mismo álbum caen en fragmentos distintos en vez de hacer cola sobre
+    la fila del álbum. La lectura suma los fragmentos pendientes y `merge` los fusiona periódicamente.
+    """
+    def __init__(self, shards, hot_threshold, merge_interval):
+        self.shards = shards
+        self.hot_threshold = hot_threshold
+        self.merge_interval = merge_interval
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def enabled(self): return self.shards > 0
+
+    def is_hot(self, current_count): return self.enabled and current_count >= self.hot_threshold
+
+    def add(self, album_id, counter, delta):
+        # Dentro de la transacción de quien llama, junto al INSERT/DELETE del like o guardado
+        stmt = dialect_insert(AlbumCounterShard).values({'album_id': album_id, 'shard': random.randrange(self.shards), 'likes_count': 0, 'saves_count': 0, counter: delta})
+        column = AlbumCounterShard.__table__.c[counter]
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['album_id', 'shard'], set_={counter: column + stmt.excluded[counter]}))
+        self._ensure_started()
+
+    def pending(self, album_id, counter):
+        # Subconsulta escalar con el delta de `counter` que aún no está en la fila del álbum
+        return db.session.query(db.func.coalesce(db.func.sum(getattr(AlbumCounterShard, counter)), 0))\
+            .filter(AlbumCounterShard.album_id == album_id).scalar_subquery()
+
+    def merge(self):
+        """Vacía los fragmentos con DELETE ... RETURNING y suma sus deltas al álbum en la misma transacción."""
+        with app.app_context(), db.engine.begin() as conn:
+            shard_table, album_table = AlbumCounterShard.__table__, Album.__table__
+            totals = {}
+            for album_id, likes, saves in conn.execute(shard_table.delete().returning(shard_table.c.album_id, shard_table.c.likes_count, shard_table.c.saves_count)):
+                total = totals.setdefault(album_id, [0, 0])
+                total[0] += likes
+                total[1] += saves
+            if not totals: return 0
+            conn.execute(
+                album_table.update()
+                    .where(album_table.c.id == bindparam('b_album_id'))
+                    .values(likes_count=album_table.c.likes_count + bindparam('b_likes'), saves_count=album_table.c.saves_count + bindparam('b_saves')),
+                [{'b_album_id': album_id, 'b_likes': likes, 'b_saves': saves} for album_id, (likes, saves) in totals.items()]
+            )
+            return len(totals)
+
+    def _ensure_started(self):
+        if self._started: return
+        with self._lock:
+            if self._started: return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.merge_interval)
+            try: self.merge()
+            except Exception as e: print(f"Error al fusionar los contadores de álbumes: {e}")
+
+counter_shards = AlbumCounterShards(app.config['ALBUM_COUNTER_SHARDS'], app.config['ALBUM_COUNTER_HOT_THRESHOLD'], app.config['ALBUM_COUNTER_MERGE_INTERVAL'])
+
+class RequestMetrics:
+    """Métricas por ruta de este proceso: histograma de latencia, consultas SQL, tiempo en BD y posibles N+1.
+
+    Cada sentencia solo suma un contador en `g`; el bloqueo se toma una vez por petición, al cerrarla.
+    Con varios workers cada uno expone las suyas (Prometheus las suma por instancia).
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, n_plus_one_threshold, recent_flags=50):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._endpoints = {}  # (método, ruta) -> acumulados
+        self._n_plus_one = deque(maxlen=recent_flags)
+        self._lock = threading.Lock()
+
+    def record(self, method, endpoint, status, duration, statements, db_time):
+        repeated_statement, repeats = max(statements.items(), key=lambda item: item[1], default=(None, 0))
+        flagged = repeats > self.n_plus_one_threshold
+        with self._lock:
+            stats = self._endpoints.get((method, endpoint))
+            if stats is None:
+                stats = self._endpoints[method, endpoint] = {'count': 0, 'duration': 0.0, 'buckets': [0] * (len(self.LATENCY_BUCKETS) + 1),
+                                                             'statements': 0, 'db_time': 0.0, 'n_plus_one': 0, 'status': {}}
+            stats['count'] += 1
+            stats['duration'] += duration
+            stats['buckets'][bisect_left(self.LATENCY_BUCKETS, duration)] += 1
+            stats['statements'] += sum(statements.values())
+            stats['db_time'] += db_time
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+            if flagged:
+                stats['n_plus_one'] += 1
+                self._n_plus_one.append({'method': method, 'endpoint': endpoint, 'path': request.full_path, 'statement': repeated_statement[:500],
+                                         'repeats': repeats, 'at': datetime.utcnow().isoformat()})
+        if flagged: print(f"Posible N+1 en {method} {endpoint}: {repeats} ejecuciones de la misma sentencia")
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {**stats, 'buckets': list(stats['buckets']), 'status': dict(stats['status'])} for key, stats in self._endpoints.items()}, list(self._n_plus_one)
+
+    def to_json(self):
+        endpoints, n_plus_one = self.snapshot()
+        return {
+            'endpoints': [{
+                'method': method, 'endpoint': endpoint, 'count': stats['count'],
+                'avg_ms': round(stats['duration'] / stats['count'] * 1000, 2),
+                'p50_ms': self._quantile_ms(stats, 0.5), 'p95_ms': self._quantile_ms(stats, 0.95), 'p99_ms': self._quantile_ms(stats, 0.99),
+                'avg_statements': round(stats['statements'] / stats['count'], 2),
+                'avg_db_ms': round(stats['db_time'] / stats['count'] * 1000, 2),
+                'n_plus_one': stats['n_plus_one'], 'status': stats['status'],
+            } for (method, endpoint), stats in sorted(endpoints.items(), key=lambda item: -item[1]['duration'])],
+            'recent_n_plus_one': n_plus_one[::-1],
+            'n_plus_one_threshold': self.n_plus_one_threshold,
+        }
+
+    def to_prometheus(self):
+        endpoints, _ = self.snapshot()
+        lines = []
+        def family(name, kind, help_text, samples):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'])
+            for suffix, sample_labels, value in samples:
+                rendered = ','.join('%s="%s"' % (key, str(label).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')) for key, label in sample_labels.items())
+                lines.append(f'{name}{suffix}{{{rendered}}} {value}')
+        def labels(method, endpoint, **extra): return {'method': method, 'endpoint': endpoint, **extra}
+        histogram = []
+        for (method, endpoint), stats in endpoints.items():
+            cumulative = 0
+            for bound, bucket in zip((*self.LATENCY_BUCKETS, '+Inf'), stats['buckets']):
+                cumulative += bucket
+                histogram.append(('_bucket', labels(method, endpoint, le=bound), cumulative))
+            histogram += [('_sum', labels(method, endpoint), stats['duration']), ('_count', labels(method, endpoint), stats['count'])]
+        family('http_request_duration_seconds', 'histogram', 'Latencia de las peticiones por ruta.', histogram)
+        family('http_requests_total', 'counter', 'Peticiones por ruta y código de estado.',
+               [('', labels(method, endpoint, status=status), count) for (method, endpoint), stats in endpoints.items() for status, count in stats['status'].items()])
+        family('db_statements_total', 'counter', 'Sentencias SQL ejecutadas por ruta.', [('', labels(*key), stats['statements']) for key, stats in endpoints.items()])
+        family('db_duration_seconds_total', 'counter', 'Tiempo total en la base de datos por ruta.', [('', labels(*key), stats['db_time']) for key, stats in endpoints.items()])
+        family('db_n_plus_one_requests_total', 'counter', f'Peticiones que repitieron una sentencia más de {self.n_plus_one_threshold} veces.',
+               [('', labels(*key), stats['n_plus_one']) for key, stats in endpoints.items()])
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def _quantile_ms(cls, stats, quantile):
+        # Cota superior del cuantil según el histograma (None si cae por encima del último límite)
+        target, cumulative = quantile * stats['count'], 0
+        for bound, bucket in zip(cls.LATENCY_BUCKETS, stats['buckets']):
+            cumulative += bucket
+            if cumulative >= target: return bound * 1000
+        return None
+
+request_metrics = RequestMetrics(app.config['METRICS_N_PLUS_ONE_THRESHOLD'])
+
+if app.config['METRICS_ENABLED']:
+    @app.before_request
+    def _start_request_metrics():
+        g.request_metrics = {'start': time.perf_counter(), 'statements': {}, 'db_time': 0.0, 'status': 500}
+
+    @app.after_request
+    def _request_metrics_status(response):
+        if 'request_metrics' in g: g.request_metrics['status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        current = g.pop('request_metrics', None)
+        if current is None: return
+        endpoint = request.url_rule.rule if request.url_rule else '<sin ruta>'
+        request_metrics.record(request.method, endpoint, current['status'], time.perf_counter() - current['start'], current['statements'], current['db_time'])
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _start_statement_metrics(conn, cursor, statement, parameters, context, executemany):
+        conn.info['statement_start'] = time.perf_counter()
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _finish_statement_metrics(conn, cursor, statement, parameters, context, executemany):
+        # Sentencias fuera de una petición (volcados en segundo plano, sockets, CLI) no se atribuyen a ninguna ruta
+        if not has_request_context(): return
+        current = g.get('request_metrics')
+        if current is None: return
+        current['statements'][statement] = current['statements'].get(statement, 0) + 1
+        current['db_time'] += time.perf_counter() - conn.info.pop('statement_start', time.perf_counter())
+
+class MemoryPresenceStore:
+    """sids por usuario en la memoria del proceso (un solo worker)."""
+    def __init__(self):
+        self._sids = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id, sid):
+        with self._lock:
+            sids = self._sids.setdefault(user_id, set())
+            sids.add(sid)
+            return len(sids) == 1
+
+    def remove(self, user_id, sid):
+        with self._lock:
+            sids = self._sids.get(user_id)
+            if not sids or sid not in sids: return False
+            sids.discard(sid)
+            if sids: return False
+            del self._sids[user_id]
+            return True
+
+    def is_online(self, user_id):
+        with self._lock:
+            return user_id in self._sids
+
+    # Un solo proceso: no hay latido ni workers caídos de los que limpiar sids
+    heartbeat_interval = None
+    def beat(self, sid_user): return []
+    def reap(self): return []
+
+class RedisPresenceStore:
+    """sids por usuario en un SET de Redis compartido por todos los workers.
+
+    Cada sid se guarda como '<worker>:<sid>' y el worker lo anota además en su propio SET. Mientras vive,
+    el worker renueva un latido con TTL; cuando el de otro worker caduca, `reap` retira sus sids.
+    """
+    WORKERS_KEY = 'presence:workers'
+
+    def __init__(self, url, worker_ttl):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.worker_id = f'{os.getpid()}-{os.urandom(4).hex()}'
+        self._ttl_ms = int(worker_ttl * 1000)
+        self.heartbeat_interval = worker_ttl / 3
+
+    @staticmethod
+    def _key(user_id):
+        return f'presence:sids:{user_id}'
+
+    @staticmethod
+    def _alive_key(worker_id):
+        return f'presence:worker:{worker_id}'
+
+    @staticmethod
+    def _owned_key(worker_id):
+        return f'presence:worker:{worker_id}:sids'
+
+    def _register(self, pipe):
+        return pipe.set(self._alive_key(self.worker_id), 1, px=self._ttl_ms).sadd(self.WORKERS_KEY, self.worker_id)
+
+    def add(self, user_id, sid):
+        # MULTI/EXEC: solo un worker puede ver el conjunto pasar de 0 a 1 sid
+        pipe = self._register(self._redis.pipeline()).sadd(self._owned_key(self.worker_id), f'{user_id}:{sid}')
+        *_, added, size = pipe.sadd(self._key(user_id), f'{self.worker_id}:{sid}').scard(self._key(user_id)).execute()
+        return bool(added) and size == 1
+
+    def remove(self, user_id, sid):
+        pipe = self._redis.pipeline().srem(self._owned_key(self.worker_id), f'{user_id}:{sid}')
+        _, removed, size = pipe.srem(self._key(user_id), f'{self.worker_id}:{sid}').scard(self._key(user_id)).execute()
+        return bool(removed) and size == 0
+
+    def is_online(self, user_id):
+        return bool(self._redis.exists(self._key(user_id)))
+
+    def beat(self, sid_user):
+        """Renueva el latido. Si había caducado (proceso detenido más que el TTL), otro worker pudo retirar
+        nuestros sids: se vuelven a añadir. Devuelve los user_id que pasan a online por ello."""
+        if self._redis.set(self._alive_key(self.worker_id), 1, px=self._ttl_ms, xx=True): return []
+        self._register(self._redis.pipeline()).execute()
+        return [user_id for sid, user_id in sid_user.items() if self.add(user_id, sid)]
+
+    def reap(self):
+        """Retira los sids de los workers sin latido. Devuelve los user_id que se quedan sin sids."""
+        workers = [worker.decode() for worker in self._redis.smembers(self.WORKERS_KEY)]
+        pipe = self._redis.pipeline(transaction=False)
+        for worker_id in workers: pipe.exists(self._alive_key(worker_id))
+        went_offline = []
+        for worker_id, alive in zip(workers, pipe.execute()):
+            if alive: continue
+            for owned in self._redis.smembers(self._owned_key(worker_id)):
+                user_id, sid = owned.decode().split(':', 1)
+                removed, size = self._redis.pipeline().srem(self._key(user_id), f'{worker_id}:{sid}').scard(self._key(user_id)).execute()
+                if removed and size == 0: went_offline.append(int(user_id))
+            self._redis.pipeline().delete(self._owned_key(worker_id)).srem(self.WORKERS_KEY, worker_id).execute()
+        return went_offline
+
+PRESENCE_BACKENDS = {
+    'memory': lambda: MemoryPresenceStore(),
+    'redis': lambda: RedisPresenceStore(app.config['PRESENCE_REDIS_URL'], app.config['PRESENCE_WORKER_TTL']),
+}
+
+class PresenceRegistry:
+    """Presencia de usuarios: varias pestañas (o workers) = varios sids por usuario.
+
+    Un usuario pasa a online con su primer socket y a offline al cerrarse el último; el conteo
+    de sids vive en `store` (compartido entre workers con Redis). Cada worker recuerda solo a qué
+    usuario pertenecen sus propios sids y vuelca is_active/last_seen a la BD en lotes periódicos
+    en lugar de un commit por conexión.
+    """
+    def __init__(self, store, flush_interval):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._sid_user = {}  # sid -> user_id (sockets de este worker)
+        self._pending = {}   # user_id -> (is_active, last_seen) aún no volcados
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._started = False
+
+    def connect(self, user_id, sid):
+        """Asocia `sid` a `user_id`. Devuelve True si el usuario acaba de pasar a online."""
+        with self._lock:
+            previous = self._sid_user.get(sid)
+            if previous == user_id: return False
+            self._sid_user[sid] = user_id
+        if previous is not None: self._leave(previous, sid)
+        came_online = self.store.add(user_id, sid)
+        if came_online: self._mark(user_id, True)
+        self._ensure_started()
+        return came_online
+
+    def disconnect(self, sid):
+        """Devuelve (user_id, went_offline) para el sid que se desconecta; (None, False) si no estaba autenticado."""
+        with self._lock:
+            user_id = self._sid_user.pop(sid, None)
+        if user_id is None: return None, False
+        return user_id, self._leave(user_id, sid)
+
+    def _leave(self, user_id, sid):
+        went_offline = self.store.remove(user_id, sid)
+        if went_offline: self._mark(user_id, False)
+        return went_offline
+
+    def _mark(self, user_id, is_active):
+        with self._lock:
+            self._pending[user_id] = (is_active, datetime.utcnow())
+
+    def user_for(self, sid):
+        with self._lock:
+            return self._sid_user.get(sid)
+
+    def is_online(self, user_id):
+        return self.store.is_online(user_id)
+
+    def heartbeat(self):
+        """Late en el store y aplica las transiciones que provoca: sids retirados de workers caídos o recuperados."""
+        with self._lock:
+            # Bajo el candado: un disconnect simultáneo no puede retirar un sid que beat vuelva a añadir después
+            came_online = self.store.beat(self._sid_user)
+        went_offline = self.store.reap()
+        for user_id, is_active in chain(((user_id, True) for user_id in came_online), ((user_id, False) for user_id in went_offline)):
+            self._mark(user_id, is_active)
+            socketio.emit('user_status_changed', {'user_id': user_id, 'is_active': is_active}, room='admin_room')
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending: return
+                batch, self._pending = self._pending, {}
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    user_table = User.__table__
+                    # Otro worker puede haber registrado un cambio más reciente: no lo pisamos
+                    conn.execute(
+                        user_table.update()
+                            .where(user_table.c.id == bindparam('b_user_id'))
+                            .where(or_(user_table.c.last_seen == None, user_table.c.last_seen <= bindparam('b_last_seen')))
+                            .values(is_active=bindparam('b_is_active'), last_seen=bindparam('b_last_seen'), updated_at=user_table.c.updated_at),
+                        [{'b_user_id': user_id, 'b_is_active': is_active, 'b_last_seen': last_seen} for user_id, (is_active, last_seen) in batch.items()]
+                    )
+            except Exception as e:
+                print(f"Error al volcar la presencia de usuarios: {e}")
+                # Reintentamos en el siguiente volcado sin pisar cambios más recientes
+                with self._lock:
+                    for user_id, state in batch.items(): self._pending.setdefault(user_id, state)
+
+    def _ensure_started(self):
+        if self._started: return
+        with self._lock:
+            if self._started: return
+            self._started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        # El primer latido va al arrancar: un worker reiniciado limpia enseguida los sids de los caídos
+        interval = min(self.flush_interval, self.store.heartbeat_interval or self.flush_interval)
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Error al renovar la presencia del worker: {e}")
+            if time.monotonic() >= next_flush:
+                next_flush += self.flush_interval
+                self.flush()
+            socketio.sleep(interval)
+
+presence = PresenceRegistry(PRESENCE_BACKENDS[app.config['PRESENCE_BACKEND']](), app.config['PRESENCE_FLUSH_INTERVAL'])
+atexit.register(presence.flush)
+# Con Redis el worker late desde que arranca y no desde su primer socket: uno sin clientes también
+# debe retirar los sids de los workers caídos
+if app.config['PRESENCE_BACKEND'] == 'redis': presence._ensure_started()
+
+def encode_cursor(*values):
+    """Cursor opaco para paginación por clave (keyset): JSON en base64 url-safe."""
+    raw = json.dumps(values, separators=(',', ':'), default=lambda v: v.isoformat())
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Devuelve la lista de valores del cursor o None si no es válido."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return values if isinstance(values, list) else None
+    except (ValueError, TypeError):
+        return None
+
+def touch_albums(connection, album_ids):
+    """Marca álbumes como modificados (updated_at) para que cambien sus validadores HTTP."""
+    album_table = Album.__table__
+    connection.execute(album_table.update().where(album_table.c.id.in_(album_ids)).values(updated_at=datetime.utcnow()))
+
+@event.listens_for(Session, 'after_flush')
+def _touch_changed_albums(session, flush_context):
+    # Archivos, comentarios y etiquetas forman parte del detalle del álbum pero viven en otras tablas
+    album_ids = {obj.album_id for obj in chain(session.new, session.dirty, session.deleted) if isinstance(obj, (Media, Comment)) and obj.album_id}
+    album_ids.update(obj.id for obj in session.dirty if isinstance(obj, Album) and obj not in session.deleted)
+    if album_ids: touch_albums(session.connection(), album_ids)
+
+def conditional_get(validator, on_not_modified=None, revalidate=False):
+    """Responde 304 a los GET anónimos cuyo contenido no cambió, sin ejecutar la vista.
+
+    `validator` recibe los argumentos de la ruta y devuelve (last_modified, version) con una
+    consulta barata sobre updated_at y contadores, o None para saltarse la validación (p. ej. si el
+    recurso no existe). Las respuestas a peticiones con Authorization dependen del visitante: se
+    marcan como privadas y no se validan. Con `revalidate`, la vista cambia lo que se valida (p. ej.
+    cuenta una vista) y el ETag de un 200 se calcula de nuevo después de ejecutarla.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if request.method != 'GET': return fn(*args, **kwargs)
+            if 'Authorization' in request.headers:
+                response = app.make_response(fn(*args, **kwargs))
+                response.headers['Cache-Control'] = 'private, no-cache'
+                response.vary.add('Authorization')
+                return response
+            validators = validator(*args, **kwargs)
+            if validators is None: return fn(*args, **kwargs)
+            def entity_tag(validators):
+                last_modified, version = validators
+                etag = hashlib.sha1(repr((request.full_path, version)).encode()).hexdigest()
+                return etag, last_modified and last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+            etag, last_modified = entity_tag(validators)
+            # If-None-Match manda sobre If-Modified-Since (RFC 9110)
+            if request.if_none_match: not_modified = request.if_none_match.contains_weak(etag)
+            else: not_modified = bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+            if not_modified:
+                if on_not_modified: on_not_modified(*args, **kwargs)
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(fn(*args, **kwargs))
+                if revalidate and response.status_code == 200:
+                    validators = validator(*args, **kwargs)
+                    if validators is not None: etag, last_modified = entity_tag(validators)
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if last_modified: response.last_modified = last_modified
+                response.headers['Cache-Control'] = f"public, max-age=0, s-maxage={app.config['HTTP_CACHE_SHARED_MAX_AGE']}"
+            response.vary.add('Authorization')
+            return response
+        return decorator
+    return wrapper
+
+def album_feed_keyset():
+    """Orden y filtro del modo cursor de GET /api/albums: (sort_by, sort_order, per_page, filtros, orden) o None si el cursor no es válido."""
+    sort_by = request.args.get('sort_by', 'created_at')
+    sort_order = request.args.get('sort_order', 'desc')
+    if sort_by not in ('created_at', 'views_count'): sort_by = 'created_at'
+    sort_column = {'created_at': Album.created_at, 'views_count': Album.views_count}[sort_by]
+    per_page = max(1, min(request.args.get('per_page', 15, type=int), 100))
+    filters = []
+    if request.args.get('cursor'):
+        values = decode_cursor(request.args['cursor'])
+        if not values or len(values) != 4 or values[:2] != [sort_by, sort_order]: return None
+        try:
+            last_id = int(values[3])
+            last_value = datetime.fromisoformat(values[2]) if sort_by == 'created_at' else int(values[2])
+        except (TypeError, ValueError): return None
+        key, last_key = tuple_(sort_column, Album.id), tuple_(last_value, last_id)
+        filters.append(key < last_key if sort_order == 'desc' else key > last_key)
+    order = (sort_column.desc(), Album.id.desc()) if sort_order == 'desc' else (sort_column.asc(), Album.id.asc())
+    return sort_by, sort_order, per_page, filters, order
+
+def album_list_validator():
+    # Versión sacada de las filas de la propia página (índice de orden + id, con LIMIT), no de toda la tabla.
+    # El modo por páginas necesita COUNT(*) para total_pages: no se valida y lo absorbe la caché de respuestas.
+    if 'cursor' not in request.args: return None
+    keyset = album_feed_keyset()
+    if keyset is None: return None
+    _, _, per_page, filters, order = keyset
+    rows = db.session.query(Album.id, Album.updated_at, Album.views_count, User.updated_at).join(User, User.id == Album.user_id)\
+        .filter(*filters).order_by(*order).limit(per_page + 1).all()
+    last_modified = max((value for row in rows for value in (row[1], row[3]) if value), default=None)
+    return last_modified, tuple(tuple(row) for row in rows)
+
+def album_detail_validator(album_id):
+    # Con contadores fragmentados, los deltas aún sin fusionar también forman parte de la versión; las vistas
+    # cuentan con las que siguen en el buffer (como en el cuerpo), así que volcarlas no cambia la versión
+    # Tras un 200 conditional_get la vuelve a pedir: la vista solo añadió una al buffer, la fila de la BD es la misma
+    cached = g.get('album_detail_validator_row')
+    if cached and cached[0] == album_id: row = cached[1]
+    else:
+        pending = [counter_shards.pending(album_id, 'likes_count'), counter_shards.pending(album_id, 'saves_count')] if counter_shards.enabled else []
+        row = db.session.query(Album.updated_at, Album.views_count, User.updated_at, *pending).join(User, User.id == Album.user_id).filter(Album.id == album_id).first()
+        g.album_detail_validator_row = (album_id, row)
+    if row is None: return None
+    return max(filter(None, (row[0], row[2])), default=None), (row[0], (row[1] or 0) + view_counter.pending(album_id), *row[2:])
+
+def album_live_counters(album_id):
+    """Contadores del detalle que cambian sin invalidar su caché: vistas y likes/guardados, con lo aún no volcado."""
+    pending = [counter_shards.pending(album_id, 'likes_count'), counter_shards.pending(album_id, 'saves_count')] if counter_shards.enabled else []
+    row = db.session.query(Album.views_count, Album.likes_count, Album.saves_count, *pending).filter(Album.id == album_id).first()
+    if row is None: return {}
+    pending_likes, pending_saves = row[3:5] if counter_shards.enabled else (0, 0)
+    return {'views_count': (row[0] or 0) + view_counter.pending(album_id), 'likes_count': row[1] + pending_likes, 'saves_count': row[2] + pending_saves}
+
+def profile_validator(username):
+    row = db.session.query(User.updated_at, db.func.count(Album.id), db.func.max(Album.updated_at), db.func.coalesce(db.func.sum(Album.views_count), 0))\
+        .outerjoin(Album, Album.user_id == User.id).filter(User.username == username).group_by(User.id, User.updated_at).first()
+    if row is None: return None
+    return max(filter(None, (row[0], row[2])), default=None), tuple(row)
+
+class MemoryResponseCache:
+    """Caché LRU en la memoria del proceso, acotada a `max_bytes` de cuerpos guardados."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # clave -> (expira_en, cuerpo); el final es lo más reciente
+        self._versions = {}            # etiqueta -> versión
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def versions(self, tags):
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, body, ttl):
+        if len(key) + len(body) > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, body)
+            self._size += len(key) + len(body)
+            while self._size > self.max_bytes: self._drop(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        # Las entradas antiguas quedan inalcanzables y las expulsa el LRU o el TTL
+        with self._lock:
+            for tag in tags: self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def _drop(self, key):
+        _, body = self._entries.pop(key)
+        self._size -= len(key) + len(body)
+
+class RedisResponseCache:
+    """Caché compartida entre workers; el límite de memoria lo impone Redis (maxmemory + allkeys-lru)."""
+    PREFIX = 'response-cache:'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def versions(self, tags):
+        if not tags: return []
+        return [int(version or 0) for version in self._redis.mget([f'{self.PREFIX}version:{tag}' for tag in tags])]
+
+    def get(self, key):
+        return self._redis.get(self.PREFIX + key)
+
+    def set(self, key, body, ttl):
+        self._redis.set(self.PREFIX + key, body, ex=ttl)
+
+    def invalidate(self, *tags):
+        pipeline = self._redis.pipeline()
+        for tag in tags: pipeline.incr(f'{self.PREFIX}version:{tag}')
+        pipeline.execute()
+
+RESPONSE_CACHE_BACKENDS = {
+    'memory': lambda: MemoryResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES']),
+    'redis': lambda: RedisResponseCache(app.config['RESPONSE_CACHE_REDIS_URL']),
+    'none': lambda: None,
+}
+response_cache = RESPONSE_CACHE_BACKENDS[app.config['RESPONSE_CACHE_BACKEND']]()
+
+def cached_response(tags, on_hit=None, live=None):
+    """Sirve desde `response_cache` las respuestas 200 de GET anónimos.
+
+    `tags` recibe los argumentos de la ruta y devuelve las etiquetas de las que depende la
+    respuesta; la clave incluye la versión de cada una, así que invalidate_responses() las retira
+    sin recorrer la caché. Además expiran tras RESPONSE_CACHE_TTL segundos. `live` devuelve los
+    campos que cambian sin invalidar la caché (contadores); se leen y sobrescriben en cada acierto.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if response_cache is None or request.method != 'GET' or 'Authorization' in request.headers:
+                return fn(*args, **kwargs)
+            route_tags = tags(*args, **kwargs)
+            key = f"{request.full_path}|{'.'.join(map(str, response_cache.versions(route_tags)))}"
+            body = response_cache.get(key)
+            if body is not None:
+                if on_hit: on_hit(*args, **kwargs)
+                if live: return jsonify({**json.loads(body), **live(*args, **kwargs)})
+                return app.response_class(body, mimetype='application/json')
+            response = app.make_response(fn(*args, **kwargs))
+            if response.status_code == 200: response_cache.set(key, response.get_data(), app.config['RESPONSE_CACHE_TTL'])
+            return response
+        return decorator
+    return wrapper
+
+def album_response_tags(album_id):
+    # Listados (portada, feed, perfiles) y el detalle del álbum
+    return ('albums', f'album:{album_id}')
+
+def owner_album_tags(user_id):
+    # El detalle de cada álbum repite datos del dueño (avatar, seguidores y seguidos)
+    return [f'album:{album_id}' for album_id, in db.session.query(Album.id).filter(Album.user_id == user_id)]
+
+def invalidate_responses(*tags):
+    """Retira de la caché las respuestas con esas etiquetas cuando se confirme la transacción actual."""
+    db.session.info.setdefault('response_cache_tags', set()).update(tags)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_cached_responses(session):
+    tags = session.info.pop('response_cache_tags', None)
+    if tags and response_cache is not None: response_cache.invalidate(*tags)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cached_response_invalidations(session):
+    session.info.pop('response_cache_tags', None)
+
+# Marca al final de un timeline que contiene todos los álbumes (no hay más antiguos en la BD)
+TIMELINE_END = 0
+
+class MemoryTimelineStore:
+    """Timelines en la memoria del proceso: LRU de como mucho `max_users` usuarios."""
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._timelines = OrderedDict()  # user_id -> (expira_en, [album_id, ...] de más reciente a más antiguo)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._timelines.get(user_id)
+            if entry is None: return None
+            if entry[0] < time.monotonic():
+                del self._timelines[user_id]
+                return None
+            self._timelines.move_to_end(user_id)
+            return list(entry[1])
+
+    def set(self, user_id, album_ids, ttl):
+        with self._lock:
+            self._timelines[user_id] = (time.monotonic() + ttl, list(album_ids))
+            self._timelines.move_to_end(user_id)
+            while len(self._timelines) > self.max_users: self._timelines.popitem(last=False)
+
+    def push(self, user_ids, album_id, max_items):
+        # Solo a los timelines ya cacheados; el resto se construye completo al leerlo
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._timelines.get(user_id)
+                if entry is None: continue
+                entry[1].insert(0, album_id)
+                del entry[1][max_items:]
+
+    def drop(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids: self._timelines.pop(user_id, None)
+
+class RedisTimelineStore:
+    """Timelines compartidos entre workers, una lista por usuario (LPUSHX solo añade a las que existen)."""
+    PREFIX = 'timeline:'
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, user_id):
+        # Un timeline guardado nunca está vacío (los completos llevan TIMELINE_END)
+        return [int(album_id) for album_id in self._redis.lrange(f'{self.PREFIX}{user_id}', 0, -1)] or None
+
+    def set(self, user_id, album_ids, ttl):
+        key = f'{self.PREFIX}{user_id}'
+        pipeline = self._redis.pipeline()
+        pipeline.delete(key)
+        if album_ids: pipeline.rpush(key, *album_ids)
+        pipeline.expire(key, ttl)
+        pipeline.execute()
+
+    def push(self, user_ids, album_id, max_items):
+        pipeline = self._redis.pipeline()
+        for user_id in user_ids:
+            pipeline.lpushx(f'{self.PREFIX}{user_id}', album_id)
+            pipeline.ltrim(f'{self.PREFIX}{user_id}', 0, max_items - 1)
+        pipeline.execute()
+
+    def drop(self, *user_ids):
+        if user_ids: self._redis.delete(*(f'{self.PREFIX}{user_id}' for user_id in user_ids))
+
+TIMELINE_BACKENDS = {
+    'memory': lambda: MemoryTimelineStore(app.config['TIMELINE_MAX_USERS']),
+    'redis': lambda: RedisTimelineStore(app.config['TIMELINE_REDIS_URL']),
+}
+timelines = TIMELINE_BACKENDS[app.config['TIMELINE_BACKEND']]()
+
+def followed_album_ids(user_id, limit, before=None, large_audience=None):
+    """Ids de álbumes de los usuarios que sigue `user_id`, del más reciente al más antiguo.
+
+    Con `large_audience` solo los de autores por encima (True) o por debajo (False) de
+    TIMELINE_FANOUT_MAX_FOLLOWERS seguidores.
+    """
+    query = db.session.query(Album.id).join(Follow, Follow.followed_id == Album.user_id).filter(Follow.follower_id == user_id)
+    if large_audience is not None:
+        threshold = app.config['TIMELINE_FANOUT_MAX_FOLLOWERS']
+        query = query.join(User, User.id == Album.user_id)\
+            .filter(User.followers_count > threshold if large_audience else User.followers_count <= threshold)
+    if before is not None: query = query.filter(Album.id < before)
+    return [album_id for album_id, in query.order_by(Album.id.desc()).limit(limit)]
+
+def get_timeline(user_id):
+    # Los TIMELINE_MAX_ITEMS álbumes más recientes de autores con pocos seguidores; se construye al leerlo
+    album_ids = timelines.get(user_id)
+    if album_ids is None:
+        max_items = app.config['TIMELINE_MAX_ITEMS']
+        album_ids = followed_album_ids(user_id, max_items, large_audience=False)
+        if len(album_ids) < max_items: album_ids.append(TIMELINE_END)
+        timelines.set(user_id, album_ids, app.config['TIMELINE_TTL'])
+    return album_ids
+
+def feed_album_ids(user_id, limit, before=None):
+    """Hasta `limit` ids del feed de `user_id` anteriores a `before`: su timeline cacheado más, leídos
+    de la BD, los álbumes de los autores con mucha audiencia (y los más antiguos que el timeline)."""
+    timeline = get_timeline(user_id)
+    album_ids = [album_id for album_id in timeline if album_id != TIMELINE_END and (before is None or album_id < before)][:limit]
+    if len(album_ids) < limit and TIMELINE_END not in timeline:
+        album_ids += followed_album_ids(user_id, limit - len(album_ids), album_ids[-1] if album_ids else before)
+    album_ids += followed_album_ids(user_id, limit, before, large_audience=True)
+    return sorted(set(album_ids), reverse=True)[:limit]
+
+def fan_out_album(album):
+    """Añade un álbum recién publicado a los timelines cacheados de los seguidores de su autor,
+    salvo que tenga demasiados seguidores (entonces se mezcla al leer cada feed)."""
+    followers_count = db.session.query(User.followers_count).filter(User.id == album.user_id).scalar()
+    if not followers_count or followers_count > app.config['TIMELINE_FANOUT_MAX_FOLLOWERS']: return
+    timelines.push(follower_ids(album.user_id), album.id, app.config['TIMELINE_MAX_ITEMS'])
+
+def follower_ids(*user_ids):
+    return [follower_id for follower_id, in db.session.query(Follow.follower_id).filter(Follow.followed_id.in_(user_ids)).distinct()]
+
+def crossed_fanout_threshold(user_id, delta):
+    """True si sumar `delta` seguidores a `user_id` (ya aplicado en la transacción actual) le hizo cruzar
+    TIMELINE_FANOUT_MAX_FOLLOWERS: sus álbumes dejan de estar (o empiezan a estar) en los timelines cacheados."""
+    threshold = app.config['TIMELINE_FANOUT_MAX_FOLLOWERS']
+    followers_count = db.session.query(User.followers_count).filter(User.id == user_id).scalar() or 0
+    return (followers_count - delta > threshold) != (followers_count > threshold)
+
+def serialize_album_cards(albums):
+    """Serializa una página de álbumes como tarjetas con un número constante de consultas.
+
+    Carga los nombres de los dueños en una consulta; para los álbumes sin portada, el primer
+    archivo multimedia de todos ellos en otra (ROW_NUMBER por álbum); y las variantes de las
+    portadas elegidas en una tercera.
+    """
+    if not albums: return []
+    owner_ids = {album.user_id for album in albums}
+    owners = dict(db.session.query(User.id, User.username).filter(User.id.in_(owner_ids)).all())
+
+    cover_paths = {album.id: album.thumbnail_path for album in albums if album.thumbnail_path}
+    fallback_ids = [album.id for album in albums if not album.thumbnail_path]
+    cover_variants = {}
+    if fallback_ids:
+        ranked_media = db.session.query(
+            Media.album_id, Media.file_path, Media.variants,
+            db.func.row_number().over(
+                partition_by=Media.album_id,
+                order_by=(Media.position.asc(), Media.created_at.asc(), Media.id.asc())
+            ).label('rank')
+        ).filter(Media.album_id.in_(fallback_ids)).subquery()
+        for album_id, file_path, variants in db.session.query(ranked_media.c.album_id, ranked_media.c.file_path, ranked_media.c.variants).filter(ranked_media.c.rank == 1):
+            cover_paths[album_id], cover_variants[album_id] = file_path, variants
+    explicit_ids = [album.id for album in albums if album.thumbnail_path]
+    if explicit_ids:
+        for album_id, file_path, variants in db.session.query(Media.album_id, Media.file_path, Media.variants)\
+                .filter(Media.album_id.in_(explicit_ids), Media.file_path.in_({cover_paths[i] for i in explicit_ids})):
+            if cover_paths.get(album_id) == file_path: cover_variants[album_id] = variants
+
+    cards = []
+    for album in albums:
+        cover = serialize_variants(cover_variants.get(album.id))
+        cards.append({
+            'id': album.id, 'title': album.title,
+            'owner_username': owners.get(album.user_id), 'user_id': album.user_id,
+            'views_count': (album.views_count or 0) + view_counter.pending(album.id),
+            # Las tarjetas usan la variante reducida cuando existe; el original queda para la vista de detalle
+            'thumbnail_url': (cover and cover['card_url']) or get_public_url(cover_paths.get(album.id)),
+            'thumbnail_srcset': cover and cover['srcset'],
+            'thumbnail_placeholder': cover and cover['placeholder'],
+        })
+    return cards
+
+COMMENT_REPLIES_PREVIEW = 3
+
+def serialize_comment_page(comments, replying_to=None):
+    """Serializa una página de comentarios con su número de respuestas y las primeras respuestas.
+
+    Usa un número constante de consultas: las primeras COMMENT_REPLIES_PREVIEW respuestas de cada
+    comentario (ROW_NUMBER por padre) y un COUNT agrupado para comentarios y respuestas. Si quedan
+    más respuestas, `replies_cursor` sirve para pedirlas a /api/comments/<id>/replies.
+    """
+    if not comments: return []
+    ids = [c.id for c in comments]
+    ranked_replies = db.session.query(
+        Comment.id,
+        db.func.row_number().over(partition_by=Comment.parent_id, order_by=(Comment.created_at.asc(), Comment.id.asc())).label('rank')
+    ).filter(Comment.parent_id.in_(ids)).subquery()
+    previews = Comment.query.options(joinedload(Comment.author))\
+        .join(ranked_replies, ranked_replies.c.id == Comment.id)\
+        .filter(ranked_replies.c.rank <= COMMENT_REPLIES_PREVIEW)\
+        .order_by(Comment.created_at.asc(), Comment.id.asc()).all()
+    replies_by_parent = {}
+    for reply in previews: replies_by_parent.setdefault(reply.parent_id, []).append(reply)
+    reply_counts = dict(db.session.query(Comment.parent_id, db.func.count(Comment.id))
+                        .filter(Comment.parent_id.in_(ids + [r.id for r in previews])).group_by(Comment.parent_id).all())
+
+    def format_comment(comment, parent_author):
+        return {
+            'id': comment.id, 'text': comment.text,
+            'author_username': comment.author.username if comment.author else "[usuario eliminado]",
+            'author_id': comment.user_id, 'created_at': comment.created_at.isoformat(),
+            'replying_to': parent_author, 'parent_id': comment.parent_id,
+            'reply_count': reply_counts.get(comment.id, 0)
+        }
+
+    page = []
+    for comment in comments:
+        data = format_comment(comment, replying_to)
+        author = comment.author.username if comment.author else None
+        replies = replies_by_parent.get(comment.id, [])
+        data['replies'] = [dict(format_comment(reply, author), replies=[], replies_cursor=None) for reply in replies]
+        data['replies_cursor'] = encode_cursor(replies[-1].created_at, replies[-1].id) if len(replies) < data['reply_count'] else None
+        page.append(data)
+    return page
+
+def paginate_comments(query):
+    """Aplica `cursor`/`limit` (keyset sobre created_at, id ascendente). Devuelve (comentarios, next_cursor) o None si el cursor no es válido."""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    if request.args.get('cursor'):
+        values = decode_cursor(request.args['cursor'])
+        try: last_created_at, last_id = datetime.fromisoformat(values[0]), int(values[1])
+        except (TypeError, ValueError, IndexError): return None
+        query = query.filter(tuple_(Comment.created_at, Comment.id) > tuple_(last_created_at, last_id))
+    comments = query.options(joinedload(Comment.author)).order_by(Comment.created_at.asc(), Comment.id.asc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(comments[limit - 1].created_at, comments[limit - 1].id) if len(comments) > limit else None
+    return comments[:limit], next_cursor
+
+def adjust_follow_counts(follower_id, followed_id, delta):
+    # UPDATE atómico (col = col ± 1) dentro de la transacción de quien llama
+    User.query.filter_by(id=followed_id).update({User.followers_count: User.followers_count + delta}, synchronize_session=False)
+    User.query.filter_by(id=follower_id).update({User.following_count: User.following_count + delta}, synchronize_session=False)
+
+def remove_user_follows(user_id):
+    """Borra las relaciones de seguimiento de un usuario y descuenta los contadores de la otra parte."""
+    followed_ids = db.session.query(Follow.followed_id).filter(Follow.follower_id == user_id)
+    follower_ids = db.session.query(Follow.follower_id).filter(Follow.followed_id == user_id)
+    User.query.filter(User.id.in_(followed_ids)).update({User.followers_count: User.followers_count - 1}, synchronize_session=False)
+    User.query.filter(User.id.in_(follower_ids)).update({User.following_count: User.following_count - 1}, synchronize_session=False)
+    Follow.query.filter(or_(Follow.follower_id == user_id, Follow.followed_id == user_id)).delete(synchronize_session=False)
+
+def recompute_follow_counts():
+    """Recalcula todos los contadores de seguidores desde la tabla Follow (repara desajustes)."""
+    followers = db.select(db.func.count()).where(Follow.followed_id == User.id).scalar_subquery()
+    following = db.select(db.func.count()).where(Follow.follower_id == User.id).scalar_subquery()
+    User.query.update({User.followers_count: followers, User.following_count: following}, synchronize_session=False)
+    db.session.commit()
+
+def dialect_insert(model):
+    """INSERT con soporte de ON CONFLICT del motor en uso (PostgreSQL en producción, SQLite en pruebas)."""
+    return (postgresql if db.engine.dialect.name == 'postgresql' else sqlite).insert(model)
+
+def toggle_album_mark(model, counter, album_id, user_id):
+    """Alterna un AlbumLike/SavedAlbum con sentencias atómicas y ajusta album.<counter> en la misma transacción.
+
+    DELETE ... RETURNING y, si no había nada que borrar, INSERT ... ON CONFLICT DO NOTHING RETURNING:
+    solo la petición que realmente borra o crea la fila mueve el contador, y lo hace con
+    `counter = counter ± 1` (o en un fragmento si el álbum está muy activo), nunca leyendo y escribiendo
+    el valor desde Python. Devuelve (delta, contador actual, dueño del álbum); delta 0 significa que
+    otra petición simultánea ya había creado la fila.
+    """
+    album = db.session.query(Album.user_id, getattr(Album, counter)).filter(Album.id == album_id).first()
+    if album is None: abort(404)
+    owner_id, count = album
+    table = model.__table__
+    key = and_(table.c.user_id == user_id, table.c.album_id == album_id)
+    if db.session.execute(table.delete().where(key).returning(table.c.album_id)).first(): delta = -1
+    else:
+        inserted = db.session.execute(dialect_insert(model).values(user_id=user_id, album_id=album_id).on_conflict_do_nothing().returning(table.c.album_id)).first()
+        delta = 1 if inserted else 0
+    if delta and counter_shards.is_hot(count): counter_shards.add(album_id, counter, delta)
+    elif delta:
+        column = getattr(Album, counter)
+        count = db.session.execute(db.update(Album).where(Album.id == album_id).values({column: column + delta}).returning(column)).scalar()
+    if counter_shards.enabled: count += db.session.scalar(db.select(counter_shards.pending(album_id, counter)))
+    return delta, count, owner_id
+
+def parse_tag_names(raw):
+    # "Foto, Tacna ,foto" -> ['foto', 'tacna'] (sin vacíos ni duplicados, en orden)
+    return list(dict.fromkeys(tag.strip().lower()[:50] for tag in raw.split(',') if tag.strip()))
+
+def resolve_tags(names):
+    """Devuelve los Tag de `names` con un SELECT y, solo si faltan, un INSERT ... ON CONFLICT DO NOTHING.
+
+    El ON CONFLICT evita el error de clave única cuando dos peticiones crean a la vez la misma etiqueta.
+    """
+    if not names: return []
+    tags = {tag.name: tag for tag in Tag.query.filter(Tag.name.in_(names))}
+    missing = [name for name in names if name not in tags]
+    if missing:
+        db.session.execute(dialect_insert(Tag).values([{'name': name} for name in missing]).on_conflict_do_nothing(index_elements=['name']))
+        tags.update((tag.name, tag) for tag in Tag.query.filter(Tag.name.in_(missing)))
+    return [tags[name] for name in names]
+
+def set_album_tags(album, names):
+    """Reemplaza las etiquetas del álbum y ajusta Tag.albums_count de las añadidas y quitadas."""
+    tags = resolve_tags(names)
+    current = set(album.tags)
+    added = [tag.id for tag in tags if tag not in current]
+    removed = [tag.id for tag in current if tag not in tags]
+    album.tags = tags
+    if added: Tag.query.filter(Tag.id.in_(added)).update({Tag.albums_count: Tag.albums_count + 1}, synchronize_session=False)
+    if removed: Tag.query.filter(Tag.id.in_(removed)).update({Tag.albums_count: Tag.albums_count - 1}, synchronize_session=False)
+
+def release_album_tags(album_ids):
+    """Descuenta de Tag.albums_count los álbumes que se van a borrar (ids o subconsulta de ids)."""
+    links = db.select(db.func.count()).where(album_tags.c.tag_id == Tag.id, album_tags.c.album_id.in_(album_ids)).scalar_subquery()
+    Tag.query.filter(Tag.id.in_(db.select(album_tags.c.tag_id).where(album_tags.c.album_id.in_(album_ids))))\
+        .update({Tag.albums_count: Tag.albums_count - links}, synchronize_session=False)
+
+def recompute_tag_counts():
+    """Recalcula Tag.albums_count desde album_tags (repara desajustes)."""
+    Tag.query.update({Tag.albums_count: db.select(db.func.count()).where(album_tags.c.tag_id == Tag.id).scalar_subquery()}, synchronize_session=False)
+    db.session.commit()
+
+def record_conversation_message(message):
+    """Actualiza el resumen de la conversación con un mensaje nuevo (upsert en la transacción de quien llama)."""
+    low, high = sorted((message.sender_id, message.recipient_id))
+    unread_column = 'unread_high' if message.recipient_id == high else 'unread_low'
+    summary = {
+        'last_message_id': message.id, 'last_message_preview': message.content[:255],
+        'last_message_at': message.created_at, 'last_sender_id': message.sender_id
+    }
+    stmt = dialect_insert(Conversation).values(user_low_id=low, user_high_id=high, **summary, **{unread_column: 1})
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['user_low_id', 'user_high_id'],
+        set_={**summary, unread_column: getattr(Conversation, unread_column) + 1}
+    ))
+
+def mark_conversation_read(user_id, other_user_id, count):
+    """Descuenta `count` mensajes leídos del contador de no leídos de `user_id` (sin bajar de 0)."""
+    low, high = sorted((user_id, other_user_id))
+    unread_column = Conversation.unread_low if user_id == low else Conversation.unread_high
+    Conversation.query.filter_by(user_low_id=low, user_high_id=high).update({unread_column: case((unread_column > count, unread_column - count), else_=0)}, synchronize_session=False)
+
+# --- Búsqueda ---
+SEARCH_FIELDS = {User: ('username',), Album: ('title', 'description', 'tags'), Tag: ('name',)}
+
+def tokenize(text):
+    return re.findall(r'[^\W_]+', (text or '').lower())
+
+class InvertedSearchIndex:
+    """Índice invertido en memoria para /api/search cuando la BD no es PostgreSQL (p. ej. SQLite en pruebas).
+
+    Se reconstruye de forma perezosa tras cualquier commit que cambie usuarios, álbumes o etiquetas.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stale = True
+        self._postings = {'users': {}, 'albums': {}}  # tipo -> token -> {id: peso}
+        self._tokens = {'users': [], 'albums': []}    # tokens ordenados para buscar por prefijo
+
+    def invalidate(self):
+        self._stale = True
+
+    def _rebuild(self):
+        self._stale = False
+        postings = {'users': {}, 'albums': {}}
+        def add(kind, entity_id, tokens, weight):
+            for token in set(tokens):
+                entry = postings[kind].setdefault(token, {})
+                entry[entity_id] = entry.get(entity_id, 0) + weight
+        for user_id, username in db.session.query(User.id, User.username):
+            add('users', user_id, tokenize(username) + [username.lower()], 3.0)
+        for album_id, title, description in db.session.query(Album.id, Album.title, Album.description):
+            add('albums', album_id, tokenize(title), 3.0)
+            add('albums', album_id, tokenize(description), 1.0)
+        for album_id, tag_name in db.session.query(album_tags.c.album_id, Tag.name).join(Tag, Tag.id == album_tags.c.tag_id):
+            add('albums', album_id, tokenize(tag_name), 2.0)
+        with self._lock:
+            self._postings = postings
+            self._tokens = {kind: sorted(entries) for kind, entries in postings.items()}
+
+    def search(self, kind, query, limit, offset=0):
+        if self._stale: self._rebuild()
+        with self._lock:
+            postings, tokens = self._postings[kind], self._tokens[kind]
+        scores = None
+        for word in tokenize(query):
+            # Cada palabra coincide por prefijo (búsqueda mientras se escribe); todas deben coincidir
+            matches = {}
+            i = bisect_left(tokens, word)
+            while i < len(tokens) and tokens[i].startswith(word):
+                exactness = 1.0 if tokens[i] == word else 0.5
+                for entity_id, weight in postings[tokens[i]].items():
+                    matches[entity_id] = max(matches.get(entity_id, 0), weight * exactness)
+                i += 1
+            scores = matches if scores is None else {eid: scores[eid] + score for eid, score in matches.items() if eid in scores}
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], -item[0]))
+        return [entity_id for entity_id, _ in ranked[offset:offset + limit]]
+
+search_index = InvertedSearchIndex()
+
+@event.listens_for(Session, 'after_flush')
+def _track_search_changes(session, flush_context):
+    for obj in chain(session.new, session.deleted, session.dirty):
+        fields = SEARCH_FIELDS.get(type(obj))
+        if fields and (obj not in session.dirty or any(inspect(obj).attrs[f].history.has_changes() for f in fields)):
+            session.info['search_index_dirty'] = True
+            return
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_search_index(session):
+    if session.info.pop('search_index_dirty', False): search_index.invalidate()
+
+def _prefix_tsquery(query):
+    words = tokenize(query)
+    return ' & '.join(f"{word}:*" for word in words) if words else None
+
+def _like_term(query):
+    # Escapa los comodines de LIKE para que '%' o '_' escritos por el usuario sean literales
+    return '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def _order_by_ids(model, ids):
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ids)).all()} if ids else {}
+    return [rows[i] for i in ids if i in rows]
+
+def search_users(query, limit, offset=0):
+    if db.engine.dialect.name != 'postgresql':
+        return _order_by_ids(User, search_index.search('users', query, limit, offset))
+    term = _like_term(query)
+    return User.query.filter(User.username.ilike(term, escape='\\'))\
+        .order_by(db.func.similarity(User.username, query).desc(), User.username.asc())\
+        .offset(offset).limit(limit).all()
+
+def search_albums(query, limit, offset=0):
+    if db.engine.dialect.name != 'postgresql':
+        return _order_by_ids(Album, search_index.search('albums', query, limit, offset))
+    term = _like_term(query)
+    tag_match = Album.id.in_(
+        db.session.query(album_tags.c.album_id).join(Tag, Tag.id == album_tags.c.tag_id).filter(Tag.name.ilike(term, escape='\\'))
+    )
+    conditions = [Album.title.ilike(term, escape='\\'), tag_match]
+    rank = db.func.similarity(Album.title, query) + case((tag_match, 0.5), else_=0.0)
+    tsquery = _prefix_tsquery(query)
+    if tsquery:
+        document, ts_query = literal_column(ALBUM_SEARCH_DOCUMENT), db.func.to_tsquery('simple', tsquery)
+        conditions.append(document.op('@@')(ts_query))
+        rank = rank + db.func.ts_rank(document, ts_query)
+    return Album.query.filter(or_(*conditions)).order_by(rank.desc(), Album.id.desc()).offset(offset).limit(limit).all()
+
+class NotificationEmitDebouncer:
+    """Agrupa los avisos 'new_notification' por destinatario: como mucho uno cada NOTIFICATION_EMIT_DEBOUNCE segundos."""
+    def __init__(self, delay):
+        self.delay = delay
+        self._scheduled = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, recipient_id):
+        with self._lock:
+            if recipient_id in self._scheduled: return
+            self._scheduled.add(recipient_id)
+        socketio.start_background_task(self._emit_later, recipient_id)
+
+    def _emit_later(self, recipient_id):
+        socketio.sleep(self.delay)
+        with self._lock: self._scheduled.discard(recipient_id)
+        socketio.emit('new_notification', {'message': 'Tienes una nueva notificación'}, room=f'user_{recipient_id}')
+
+notification_emitter = NotificationEmitDebouncer(app.config['NOTIFICATION_EMIT_DEBOUNCE'])
+
+# Tipos que se agrupan por (destinatario, tipo, entidad relacionada); en 'new_message' la entidad es el remitente
+COALESCED_NOTIFICATION_TYPES = {'new_like', 'new_comment', 'new_reply', 'new_follower', 'new_message'}
 
 def create_notification(recipient_id, actor_id, ntype, related_id=None):
+    """Registra una notificación dentro de la transacción de quien llama (no hace commit).
+
+    Si hay una notificación sin leer del mismo tipo y objetivo dentro de la ventana, la actualiza
+    ("ana y 12 más...") en lugar de crear otra fila. actor_count cuenta actores distintos (tabla
+    notification_actor): quien repite la acción no suma. El aviso por socket se envía tras el commit.
+    """
     if recipient_id == actor_id: return
-    notification = Notification(recipient_id=recipient_id, actor_id=actor_id, notification_type=ntype, related_entity_id=related_id)
-    db.session.add(notification)
-    db.session.commit()
-    socketio.emit('new_notification', {'message': 'Tienes una nueva notificación'}, room=f'user_{recipient_id}')
+    now = datetime.utcnow()
+    notification_id = None
+    if ntype in COALESCED_NOTIFICATION_TYPES:
+        # Solo la más reciente: actualizar varias filas a la vez las bloquea en un orden que puede cruzarse con
+        # el de otra transacción simultánea (interbloqueo) si dos peticiones llegaron a crear una cada una
+        latest = db.select(Notification.id).where(
+            Notification.recipient_id == recipient_id, Notification.notification_type == ntype,
+            Notification.related_entity_id == related_id if related_id is not None else Notification.related_entity_id.is_(None),
+            Notification.is_read == False,
+            Notification.created_at >= now - timedelta(seconds=app.config['NOTIFICATION_COALESCE_WINDOW'])
+        ).order_by(Notification.id.desc()).limit(1).scalar_subquery()
+        notification_id = db.session.execute(db.update(Notification).where(Notification.id == latest).values(actor_id=actor_id, created_at=now).returning(Notification.id)).scalar()
+    if notification_id:
+        new_actor = db.session.execute(dialect_insert(NotificationActor).values(notification_id=notification_id, actor_id=actor_id)
+                                       .on_conflict_do_nothing().returning(NotificationActor.notification_id)).first()
+        if new_actor: db.session.execute(db.update(Notification).where(Notification.id == notification_id).values(actor_count=Notification.actor_count + 1))
+    else:
+        db.session.add(Notification(recipient_id=recipient_id, actor_id=actor_id, notification_type=ntype, related_entity_id=related_id, created_at=now,
+                                    actors=[NotificationActor(actor_id=actor_id)]))
+    db.session.info.setdefault('notify_recipients', set()).add(recipient_id)
+
+@event.listens_for(Session, 'after_commit')
+def _emit_pending_notifications(session):
+    for recipient_id in session.info.pop('notify_recipients', ()):
+        notification_emitter.schedule(recipient_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_notifications(session):
+    session.info.pop('notify_recipients', None)
 
 # --- 5. RUTAS DE API ---
+@app.errorhandler(RequestEntityTooLarge)
+def handle_upload_too_large(e):
+    return jsonify({'error': e.description}), 413
+
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -253,6 +1797,8 @@ def login():
     return jsonify({"error": "Usuario o contraseña inválidos"}), 401
     
 @app.route('/api/profiles/<username>', methods=['GET'])
+@conditional_get(profile_validator)
+@cached_response(lambda username: ('albums', f'profile:{username}'))
 def get_user_profile(username):
     user = User.query.filter_by(username=username).first_or_404()
     is_followed = False
@@ -265,26 +1811,17 @@ def get_user_profile(username):
                 is_followed = True
         except Exception: pass 
     
-    albums_list = []
-    for album in user.albums:
-        thumbnail_url = get_public_url(album.thumbnail_path)
-        if not thumbnail_url:
-            first_media = album.media.order_by(Media.position.asc(), Media.created_at.asc()).first()
-            thumbnail_url = get_public_url(first_media.file_path) if first_media else None
-        
-        albums_list.append({
-            'id': album.id, 'title': album.title, 
-            'thumbnail_url': thumbnail_url, 'views_count': album.views_count,
-            'owner_username': user.username
-        })
+    albums_list = serialize_album_cards(user.albums)
 
     return jsonify({
         'id': user.id, 'username': user.username, 'bio': user.bio, 
         'profile_picture_url': get_public_url(user.profile_picture_path), 
         'banner_image_url': get_public_url(user.banner_image_path), 
+        'profile_picture_variants': serialize_variants(user.profile_picture_variants),
+        'banner_image_variants': serialize_variants(user.banner_image_variants),
         'albums': albums_list,
-        'followers_count': Follow.query.filter_by(followed_id=user.id).count(),
-        'following_count': Follow.query.filter_by(follower_id=user.id).count(),
+        'followers_count': user.followers_count,
+        'following_count': user.following_count,
         'is_followed': is_followed
     })
 
@@ -294,6 +1831,7 @@ def update_my_profile():
     user = User.query.get(int(get_jwt_identity()))
     data = request.get_json()
     if 'bio' in data: user.bio = data['bio']
+    invalidate_responses(f'profile:{user.username}')
     db.session.commit()
     return jsonify({'message': 'Perfil actualizado'})
 
@@ -301,19 +1839,21 @@ def update_my_profile():
 @jwt_required()
 def handle_profile_picture():
     user = User.query.get(int(get_jwt_identity()))
+    invalidate_responses(f'profile:{user.username}', *owner_album_tags(user.id))
     if request.method == 'POST':
         file = request.files.get('file')
         if not file: return jsonify({'error': 'No se encontró el archivo'}), 400
-        delete_from_supabase(user.profile_picture_path)
-        new_path = handle_supabase_upload(user.username, file, 'avatar')
+        delete_from_storage([user.profile_picture_path] + variant_paths(user.profile_picture_variants))
+        new_path = handle_upload(user.username, file, 'avatar')
         if new_path:
-            user.profile_picture_path = new_path
+            user.profile_picture_path, user.profile_picture_variants = new_path, None
             db.session.commit()
+            schedule_image_variants(User, user.id, 'profile_picture_path', 'profile_picture_variants', file, new_path)
             return jsonify({'message': 'Foto de perfil actualizada', 'url': get_public_url(new_path)})
         return jsonify({'error': 'Tipo de archivo no permitido'}), 400
     if request.method == 'DELETE':
-        delete_from_supabase(user.profile_picture_path)
-        user.profile_picture_path = None
+        delete_from_storage([user.profile_picture_path] + variant_paths(user.profile_picture_variants))
+        user.profile_picture_path, user.profile_picture_variants = None, None
         db.session.commit()
         return jsonify({'message': 'Foto de perfil eliminada'})
 
@@ -321,19 +1861,21 @@ def handle_profile_picture():
 @jwt_required()
 def handle_banner_image():
     user = User.query.get(int(get_jwt_identity()))
+    invalidate_responses(f'profile:{user.username}')
     if request.method == 'POST':
         file = request.files.get('file')
         if not file: return jsonify({'error': 'No se encontró el archivo'}), 400
-        delete_from_supabase(user.banner_image_path)
-        new_path = handle_supabase_upload(user.username, file, 'banner')
+        delete_from_storage([user.banner_image_path] + variant_paths(user.banner_image_variants))
+        new_path = handle_upload(user.username, file, 'banner')
         if new_path:
-            user.banner_image_path = new_path
+            user.banner_image_path, user.banner_image_variants = new_path, None
             db.session.commit()
+            schedule_image_variants(User, user.id, 'banner_image_path', 'banner_image_variants', file, new_path)
             return jsonify({'message': 'Banner actualizado', 'url': get_public_url(new_path)})
         return jsonify({'error': 'Tipo de archivo no permitido'}), 400
     if request.method == 'DELETE':
-        delete_from_supabase(user.banner_image_path)
-        user.banner_image_path = None
+        delete_from_storage([user.banner_image_path] + variant_paths(user.banner_image_variants))
+        user.banner_image_path, user.banner_image_variants = None, None
         db.session.commit()
         return jsonify({'message': 'Banner eliminado'})
 
@@ -341,60 +1883,46 @@ def handle_banner_image():
 @jwt_required()
 def get_my_albums():
     user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
-    
-    albums_list = []
-    for album in user.albums:
-        thumbnail_url = get_public_url(album.thumbnail_path)
-        if not thumbnail_url:
-            first_media = album.media.order_by(Media.position.asc(), Media.created_at.asc()).first()
-            thumbnail_url = get_public_url(first_media.file_path) if first_media else None
-        
-        albums_list.append({
-            'id': album.id, 'title': album.title, 
-            'thumbnail_url': thumbnail_url, 'views_count': album.views_count,
-            'owner_username': user.username, 'user_id': user.id
-        })
-    return jsonify({'albums': albums_list})
+    albums = Album.query.filter_by(user_id=user_id).all()
+    return jsonify({'albums': serialize_album_cards(albums)})
+
+@app.route('/api/me/feed', methods=['GET'])
+@jwt_required()
+def get_my_feed():
+    """Álbumes de los usuarios que sigo, del más reciente al más antiguo, paginados por cursor sobre album_id."""
+    user_id = int(get_jwt_identity())
+    per_page = max(1, min(request.args.get('per_page', 15, type=int), 100))
+    before = None
+    if request.args.get('cursor'):
+        values = decode_cursor(request.args['cursor'])
+        if not values or not isinstance(values[0], int): return jsonify({'error': 'Cursor inválido'}), 400
+        before = values[0]
+    album_ids = feed_album_ids(user_id, per_page + 1, before)
+    next_cursor = encode_cursor(album_ids[per_page - 1]) if len(album_ids) > per_page else None
+    albums = _order_by_ids(Album, album_ids[:per_page])
+    return jsonify({'albums': serialize_album_cards(albums), 'next_cursor': next_cursor})
 
 @app.route('/api/search', methods=['GET'])
 def search():
-    query = request.args.get('q', '').strip()
-    if not query: return jsonify({'users': [], 'albums': []})
-    search_term = f"%{query}%"
-    users = User.query.filter(User.username.ilike(search_term)).limit(10).all()
-    albums = Album.query.filter(Album.title.ilike(search_term)).limit(10).all()
-    users_list = [{'id': u.id, 'username': u.username, 'profile_picture_url': get_public_url(u.profile_picture_path)} for u in users]
-    albums_list = [{'id': a.id, 'title': a.title, 'owner_username': a.owner.username, 'thumbnail_url': get_public_url(a.thumbnail_path)} for a in albums]
-    return jsonify({'users': users_list, 'albums': albums_list})
+    query = request.args.get('q', '').strip()[:100]
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = max(1, min(request.args.get('per_page', 10, type=int), 50))
+    search_type = request.args.get('type', 'all')  # 'all', 'users' (selector del chat) o 'albums'
+    if not query: return jsonify({'users': [], 'albums': [], 'page': page, 'has_more': False})
+    offset = (page - 1) * per_page
+    # Pedimos un elemento extra para saber si hay más páginas sin contar filas
+    users = search_users(query, per_page + 1, offset) if search_type in ('all', 'users') else []
+    albums = search_albums(query, per_page + 1, offset) if search_type in ('all', 'albums') else []
+    has_more = len(users) > per_page or len(albums) > per_page
+    users_list = [{'id': u.id, 'username': u.username, 'profile_picture_url': get_public_url(u.profile_picture_path)} for u in users[:per_page]]
+    return jsonify({'users': users_list, 'albums': serialize_album_cards(albums[:per_page]), 'page': page, 'has_more': has_more})
 
 @app.route('/api/me/saved-albums', methods=['GET'])
 @jwt_required()
 def get_saved_albums_route():
     user_id = int(get_jwt_identity())
-    saved_album_relations = SavedAlbum.query.filter_by(user_id=user_id).all()
-    albums_list = []
-    for rel in saved_album_relations:
-        album = rel.album
-        
-        # --- INICIO DE LA CORRECCIÓN ---
-        # Añadimos la misma lógica de respaldo que en las otras secciones
-        thumbnail_url = get_public_url(album.thumbnail_path)
-        if not thumbnail_url:
-            # Si no hay thumbnail, busca el primer archivo multimedia del álbum
-            first_media = album.media.order_by(Media.position.asc(), Media.created_at.asc()).first()
-            thumbnail_url = get_public_url(first_media.file_path) if first_media else None
-        # --- FIN DE LA CORRECCIÓN ---
-
-        albums_list.append({
-            'id': album.id,
-            'title': album.title,
-            'owner_username': album.owner.username,
-            'user_id': album.user_id,
-            'views_count': album.views_count, 
-            'thumbnail_url': thumbnail_url # Ahora usamos la URL corregida
-        })
-    return jsonify({'albums': albums_list})
+    albums = Album.query.join(SavedAlbum, SavedAlbum.album_id == Album.id).filter(SavedAlbum.user_id == user_id).all()
+    return jsonify({'albums': serialize_album_cards(albums)})
 
 @app.route('/api/notifications', methods=['GET'])
 @jwt_required()
@@ -417,18 +1945,23 @@ def get_notifications():
         actor_user = notif.actor
         if not actor_user: continue
 
-        data = { 'id': notif.id, 'actor_username': actor_user.username, 'actor_profile_picture': get_public_url(actor_user.profile_picture_path), 'is_read': notif.is_read, 'created_at': notif.created_at.isoformat() }
+        data = { 'id': notif.id, 'actor_username': actor_user.username, 'actor_profile_picture': get_public_url(actor_user.profile_picture_path), 'actor_count': notif.actor_count, 'is_read': notif.is_read, 'created_at': notif.created_at.isoformat() }
         message, link = "", "#"
+        others = notif.actor_count - 1
+        actors = f"<strong>{actor_user.username}</strong>" + (f" y {others} {'persona' if others == 1 else 'personas'} más" if others > 0 else "")
 
         if notif.notification_type == 'new_follower':
-            message = f"<strong>{actor_user.username}</strong> ha comenzado a seguirte."
+            message = f"{actors} {'han' if others > 0 else 'ha'} comenzado a seguirte."
             link = f"/profile.html?user={actor_user.username}"
         
         elif notif.notification_type in ['new_like', 'new_comment', 'new_reply']:
             album_title = albums_data.get(notif.related_entity_id)
             if album_title:
-                action_text = {'new_like': 'le ha gustado', 'new_comment': 'ha comentado en', 'new_reply': 'ha respondido a tu comentario en'}.get(notif.notification_type)
-                message = f"<strong>{actor_user.username}</strong> {action_text} tu álbum <strong>{album_title}</strong>."
+                if others > 0:
+                    action_text = {'new_like': 'les ha gustado', 'new_comment': 'han comentado en', 'new_reply': 'han respondido a tu comentario en'}.get(notif.notification_type)
+                else:
+                    action_text = {'new_like': 'le ha gustado', 'new_comment': 'ha comentado en', 'new_reply': 'ha respondido a tu comentario en'}.get(notif.notification_type)
+                message = f"{actors} {action_text} tu álbum <strong>{album_title}</strong>."
                 link = f"/album.html?id={notif.related_entity_id}"
 
         elif notif.notification_type == 'new_message':
@@ -453,6 +1986,8 @@ def mark_notifications_as_read():
     return jsonify({'message': 'Notificaciones marcadas como leídas'})
 
 @app.route('/api/albums', methods=['GET', 'POST'])
+@conditional_get(album_list_validator)
+@cached_response(lambda: ('albums',))
 @jwt_required(optional=True)
 def handle_albums():
     if request.method == 'POST':
@@ -462,101 +1997,111 @@ def handle_albums():
         data = request.get_json()
         if not data or not data.get('title', '').strip(): return jsonify({'error': 'El título es obligatorio'}), 400
         new_album = Album(title=data['title'], description=data.get('description'), user_id=user_id)
-        if 'tags' in data:
-            tag_names = [tag.strip().lower() for tag in data['tags'].split(',') if tag.strip()]
-            for name in tag_names:
-                tag = Tag.query.filter_by(name=name).first() or Tag(name=name)
-                if tag not in new_album.tags: new_album.tags.append(tag)
-        db.session.add(new_album)
+        db.session.add(new_album)  # antes de las etiquetas: set_album_tags hace autoflush al actualizar los contadores
+        if 'tags' in data: set_album_tags(new_album, parse_tag_names(data['tags']))
+        invalidate_responses('albums')
         db.session.commit()
+        fan_out_album(new_album)
         return jsonify({'message': 'Álbum creado exitosamente', 'album_id': new_album.id}), 201
 
+    # Modo cursor (keyset): sin OFFSET ni COUNT(*). Se activa enviando `cursor` (vacío en la primera página).
+    if 'cursor' in request.args:
+        keyset = album_feed_keyset()
+        if keyset is None: return jsonify({'error': 'Cursor inválido'}), 400
+        sort_by, sort_order, per_page, filters, order = keyset
+        albums = Album.query.filter(*filters).order_by(*order).limit(per_page + 1).all()
+        has_more = len(albums) > per_page
+        albums = albums[:per_page]
+        next_cursor = None
+        if has_more:
+            last = albums[-1]
+            next_cursor = encode_cursor(sort_by, sort_order, getattr(last, sort_by), last.id)
+        return jsonify({'albums': serialize_album_cards(albums), 'next_cursor': next_cursor})
+
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 15, type=int)
     sort_by = request.args.get('sort_by', 'created_at')
     sort_order = request.args.get('sort_order', 'desc')
-    sort_column = {'created_at': Album.created_at, 'views_count': Album.views_count}.get(sort_by, Album.created_at)
+    if sort_by not in ('created_at', 'views_count'): sort_by = 'created_at'
+    sort_column = {'created_at': Album.created_at, 'views_count': Album.views_count}[sort_by]
     query_order = sort_column.desc() if sort_order == 'desc' else sort_column.asc()
     pagination = Album.query.order_by(query_order).paginate(page=page, per_page=per_page, error_out=False)
-    albums_list = []
-    for album in pagination.items:
-        thumbnail_url = get_public_url(album.thumbnail_path)
-        if not thumbnail_url:
-            first_media = album.media.order_by(Media.position.asc(), Media.created_at.asc()).first()
-            thumbnail_url = get_public_url(first_media.file_path) if first_media else None
-        albums_list.append({'id': album.id, 'title': album.title, 'owner_username': album.owner.username, 'user_id': album.user_id, 'views_count': album.views_count, 'thumbnail_url': thumbnail_url})
-    return jsonify({'albums': albums_list, 'total_pages': pagination.pages, 'current_page': pagination.page})
+    return jsonify({'albums': serialize_album_cards(pagination.items), 'total_pages': pagination.pages, 'current_page': pagination.page})
+
+@app.route('/api/tags/popular', methods=['GET'])
+@cached_response(lambda: ('albums',))
+def get_popular_tags():
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    tags = Tag.query.filter(Tag.albums_count > 0).order_by(Tag.albums_count.desc(), Tag.name.asc()).limit(limit).all()
+    return jsonify([{'name': tag.name, 'albums_count': tag.albums_count} for tag in tags])
+
+@app.route('/api/tags/<name>/albums', methods=['GET'])
+@cached_response(lambda name: ('albums',))
+def get_tag_albums(name):
+    """Álbumes de una etiqueta, del más reciente al más antiguo, paginados por cursor sobre album_id."""
+    tag = Tag.query.filter_by(name=name.strip().lower()).first_or_404()
+    per_page = max(1, min(request.args.get('per_page', 15, type=int), 100))
+    album_ids = db.session.query(album_tags.c.album_id).filter(album_tags.c.tag_id == tag.id)
+    if request.args.get('cursor'):
+        values = decode_cursor(request.args['cursor'])
+        if not values or not isinstance(values[0], int): return jsonify({'error': 'Cursor inválido'}), 400
+        album_ids = album_ids.filter(album_tags.c.album_id < values[0])
+    album_ids = [album_id for album_id, in album_ids.order_by(album_tags.c.album_id.desc()).limit(per_page + 1)]
+    next_cursor = encode_cursor(album_ids[per_page - 1]) if len(album_ids) > per_page else None
+    albums = _order_by_ids(Album, album_ids[:per_page])
+    return jsonify({'tag': tag.name, 'albums_count': tag.albums_count, 'albums': serialize_album_cards(albums), 'next_cursor': next_cursor})
 
 @app.route('/api/albums/<int:album_id>', methods=['GET'])
+# Una respuesta 304 también cuenta como vista; la de un 200 cambia views_count, que forma parte del ETag
+@conditional_get(album_detail_validator, on_not_modified=lambda album_id: view_counter.increment(album_id), revalidate=True)
+@cached_response(lambda album_id: (f'album:{album_id}',), on_hit=lambda album_id: view_counter.increment(album_id), live=album_live_counters)
 def get_album(album_id):
-    album = Album.query.get_or_404(album_id)
-    album.views_count += 1
-    db.session.commit()
-    
-    all_comments = Comment.query.options(joinedload(Comment.author))\
-        .filter_by(album_id=album_id)\
-        .order_by(Comment.created_at.asc())\
-        .all()
-    
-    comments_by_id = {c.id: c for c in all_comments}
-    replies_map = {}
-    top_level_comments = []
-    for comment in all_comments:
-        if comment.parent_id:
-            if comment.parent_id not in replies_map:
-                replies_map[comment.parent_id] = []
-            replies_map[comment.parent_id].append(comment)
-        else:
-            top_level_comments.append(comment)
-
-    def format_comment_optimized(comment):
-        author_username = comment.author.username if comment.author else "[usuario eliminado]"
-        parent_author_username = None
-        if comment.parent_id and comment.parent_id in comments_by_id:
-            parent_comment = comments_by_id[comment.parent_id]
-            parent_author_username = parent_comment.author.username if parent_comment.author else None
-        
-        replies = replies_map.get(comment.id, [])
+    """Detalle del álbum en tres consultas: álbum con dueño y etiquetas, lista de archivos y un
+    único SELECT con el total de comentarios y, si hay sesión, las relaciones del visitante."""
+    album = Album.query.options(joinedload(Album.owner), joinedload(Album.tags)).filter_by(id=album_id).first_or_404()
+    view_counter.increment(album.id)
 
-        return {
-            'id': comment.id, 'text': comment.text, 'author_username': author_username,
-            'author_id': comment.user_id, 'created_at': comment.created_at.isoformat(),
-            'replying_to': parent_author_username,
-            'parent_id': comment.parent_id,
-            'replies': [format_comment_optimized(reply) for reply in replies]
-        }
-    comments_list = [format_comment_optimized(c) for c in top_level_comments]
-
-    photos_count = album.media.filter(Media.file_type.startswith('image')).count()
-    videos_count = album.media.filter(Media.file_type.startswith('video')).count()
     media_items = album.media.order_by(Media.position.asc(), Media.created_at.asc()).all()
-    media_list = [{'id': item.id, 'file_path': get_public_url(item.file_path), 'file_type': item.file_type} for item in media_items]
+    media_list = [{'id': item.id, 'file_path': get_public_url(item.file_path), 'file_type': item.file_type, 'variants': serialize_variants(item.variants)} for item in media_items]
+    # Los tipos se cuentan sobre la lista ya cargada en vez de con dos COUNT más
+    photos_count = sum(1 for item in media_items if item.file_type.startswith('image'))
+    videos_count = sum(1 for item in media_items if item.file_type.startswith('video'))
     tags_list = [tag.name for tag in album.tags]
-    
-    is_followed, is_liked, is_saved, current_user_profile_picture = False, False, False, None
-    user_is_logged_in = False
+
+    current_user_id = None
     auth_header = request.headers.get('Authorization')
     if auth_header and auth_header.startswith('Bearer '):
-        try:
-            token = auth_header.split(None, 1)[1]
-            current_user_id = int(decode_token(token)['sub'])
-            user_is_logged_in = True
-            is_followed = Follow.query.filter_by(follower_id=current_user_id, followed_id=album.user_id).first() is not None
-            is_liked = AlbumLike.query.filter_by(user_id=current_user_id, album_id=album.id).first() is not None
-            is_saved = SavedAlbum.query.filter_by(user_id=current_user_id, album_id=album.id).first() is not None
-            current_user = User.query.get(current_user_id)
-            current_user_profile_picture = get_public_url(current_user.profile_picture_path)
-        except Exception:
-            pass
+        try: current_user_id = int(decode_token(auth_header.split(None, 1)[1])['sub'])
+        except Exception: pass
+
+    # Los comentarios se piden aparte y paginados en /api/albums/<id>/comments
+    stats = [db.session.query(db.func.count(Comment.id)).filter(Comment.album_id == album.id).scalar_subquery()]
+    if counter_shards.enabled: stats += [counter_shards.pending(album.id, 'likes_count'), counter_shards.pending(album.id, 'saves_count')]
+    viewer_stats = []
+    if current_user_id:
+        viewer_stats = [
+            db.session.query(Follow).filter_by(follower_id=current_user_id, followed_id=album.user_id).exists(),
+            db.session.query(AlbumLike).filter_by(user_id=current_user_id, album_id=album.id).exists(),
+            db.session.query(SavedAlbum).filter_by(user_id=current_user_id, album_id=album.id).exists(),
+            db.session.query(User.profile_picture_path).filter(User.id == current_user_id).scalar_subquery(),
+        ]
+    row = db.session.query(*stats, *viewer_stats).one()
+    comments_count = row[0]
+    pending_likes, pending_saves = row[1:3] if counter_shards.enabled else (0, 0)
+    viewer = row[len(stats):]
+    user_is_logged_in = current_user_id is not None
+    is_followed, is_liked, is_saved = (bool(viewer[0]), bool(viewer[1]), bool(viewer[2])) if user_is_logged_in else (False, False, False)
+    current_user_profile_picture = get_public_url(viewer[3]) if user_is_logged_in else None
 
     return jsonify({
         'id': album.id, 'title': album.title, 'description': album.description, 'user_id': album.user_id,
         'owner_username': album.owner.username, 'owner_profile_picture': get_public_url(album.owner.profile_picture_path),
-        'owner_followers_count': Follow.query.filter_by(followed_id=album.user_id).count(),
-        'owner_following_count': Follow.query.filter_by(follower_id=album.user_id).count(),
-        'media': media_list, 'tags': tags_list, 'comments': comments_list, 'views_count': album.views_count,
-        'photos_count': photos_count, 'videos_count': videos_count, 'likes_count': album.likes_count,
-        'saves_count': album.saves_count, 'shares_count': album.shares_count,
+        'owner_followers_count': album.owner.followers_count,
+        'owner_following_count': album.owner.following_count,
+        'media': media_list, 'tags': tags_list, 'comments_count': comments_count,
+        'views_count': (album.views_count or 0) + view_counter.pending(album.id),
+        'photos_count': photos_count, 'videos_count': videos_count, 'likes_count': album.likes_count + pending_likes,
+        'saves_count': album.saves_count + pending_saves, 'shares_count': album.shares_count,
         'user_is_logged_in': user_is_logged_in, 'is_followed': is_followed, 
         'is_liked': is_liked, 'is_saved': is_saved,
         'current_user_profile_picture': current_user_profile_picture, 'thumbnail_path': get_public_url(album.thumbnail_path)
@@ -568,22 +2113,22 @@ def handle_album_update_delete(album_id):
     user_id = int(get_jwt_identity())
     album = Album.query.get_or_404(album_id)
     if album.user_id != user_id: return jsonify({'error': 'No tienes permiso'}), 403
+    invalidate_responses(*album_response_tags(album.id))
     if request.method == 'PUT':
         data = request.get_json()
         if 'title' in data: album.title = data['title']
         if 'description' in data: album.description = data['description']
-        if 'tags' in data:
-            album.tags.clear()
-            tag_names = [tag.strip().lower() for tag in data['tags'].split(',') if tag.strip()]
-            for name in tag_names:
-                tag = Tag.query.filter_by(name=name).first() or Tag(name=name)
-                if tag not in album.tags: album.tags.append(tag)
+        if 'tags' in data: set_album_tags(album, parse_tag_names(data['tags']))
         db.session.commit()
         return jsonify({'message': 'Álbum actualizado'})
     if request.method == 'DELETE':
-        for media in album.media: delete_from_supabase(media.file_path)
+        for media in album.media: delete_from_storage([media.file_path] + variant_paths(media.variants))
+        release_album_tags([album.id])
+        # Su id sigue en los timelines cacheados de los seguidores: se reconstruyen al leerlos
+        stale_timelines = follower_ids(album.user_id)
         db.session.delete(album)
         db.session.commit()
+        timelines.drop(*stale_timelines)
         return jsonify({'message': 'Álbum eliminado'})
 
 @app.route('/api/albums/<int:album_id>/media', methods=['POST'])
@@ -594,11 +2139,13 @@ def upload_media_to_album(album_id):
     if album.user_id != user_id: return jsonify(error="No tienes permiso"), 403
     file = request.files.get('file')
     if not file: return jsonify(error="No se encontró el archivo"), 400
-    path = handle_supabase_upload(album.owner.username, file, f"album_{album.id}")
+    path = handle_upload(album.owner.username, file, f"album_{album.id}")
     if path:
         new_media = Media(album_id=album.id, file_path=path, file_type=file.content_type)
         db.session.add(new_media)
+        invalidate_responses(*album_response_tags(album.id))
         db.session.commit()
+        schedule_image_variants(Media, new_media.id, 'file_path', 'variants', file, path)
         return jsonify(message="Archivo subido exitosamente"), 201
     return jsonify(error="Tipo de archivo no permitido"), 400
 
@@ -608,24 +2155,35 @@ def delete_media_item(media_id):
     user_id = int(get_jwt_identity())
     media = Media.query.get_or_404(media_id)
     if media.album.user_id != user_id: return jsonify(error="No tienes permiso"), 403
-    delete_from_supabase(media.file_path)
+    delete_from_storage([media.file_path] + variant_paths(media.variants))
     db.session.delete(media)
+    invalidate_responses(*album_response_tags(media.album_id))
     db.session.commit()
     return jsonify(message="Archivo multimedia eliminado")
 
 @app.route('/api/albums/<int:album_id>/reorder', methods=['PUT'])
 @jwt_required()
 def reorder_media(album_id):
+    """Aplica el nuevo orden con un solo UPDATE (CASE id ...) y pone como portada el primer archivo.
+
+    `media_ids` debe contener exactamente los archivos del álbum; si falta alguno, se repite o es
+    de otro álbum, se rechaza la petición sin modificar nada.
+    """
     user_id = int(get_jwt_identity())
     album = Album.query.get_or_404(album_id)
     if album.user_id != user_id: return jsonify({'error': 'No tienes permiso'}), 403
     media_ids = request.get_json().get('media_ids', [])
     if not media_ids: return jsonify({'error': 'Falta la lista de IDs de media'}), 400
-    for index, media_id in enumerate(media_ids):
-        media_item = Media.query.get(media_id)
-        if media_item and media_item.album_id == album_id: media_item.position = index
-    first_media_in_order = Media.query.get(media_ids[0])
-    if first_media_in_order: album.thumbnail_path = first_media_in_order.file_path
+    try: media_ids = [int(media_id) for media_id in media_ids]
+    except (TypeError, ValueError): return jsonify({'error': 'IDs de media inválidos'}), 400
+    album_media = dict(db.session.query(Media.id, Media.file_path).filter(Media.album_id == album_id).all())
+    if len(media_ids) != len(album_media) or set(media_ids) != set(album_media):
+        return jsonify({'error': 'La lista debe contener exactamente los archivos del álbum'}), 400
+    Media.query.filter(Media.album_id == album_id)\
+        .update({Media.position: case({media_id: index for index, media_id in enumerate(media_ids)}, value=Media.id)}, synchronize_session=False)
+    album.thumbnail_path = album_media[media_ids[0]]
+    touch_albums(db.session.connection(), [album.id])
+    invalidate_responses(*album_response_tags(album.id))
     db.session.commit()
     return jsonify({'message': 'Orden de los archivos y portada actualizados'})
 
@@ -639,9 +2197,27 @@ def set_album_cover(album_id):
     media_item = Media.query.get(media_id)
     if not media_item or media_item.album_id != album_id: return jsonify({'error': 'Archivo no válido'}), 404
     album.thumbnail_path = media_item.file_path
+    invalidate_responses(*album_response_tags(album.id))
     db.session.commit()
     return jsonify({'message': 'Portada del álbum actualizada'})
 
+@app.route('/api/albums/<int:album_id>/comments', methods=['GET'])
+def get_album_comments(album_id):
+    Album.query.get_or_404(album_id)
+    result = paginate_comments(Comment.query.filter(Comment.album_id == album_id, Comment.parent_id == None))
+    if result is None: return jsonify({'error': 'Cursor inválido'}), 400
+    comments, next_cursor = result
+    return jsonify({'comments': serialize_comment_page(comments), 'next_cursor': next_cursor})
+
+@app.route('/api/comments/<int:comment_id>/replies', methods=['GET'])
+def get_comment_replies(comment_id):
+    parent_comment = Comment.query.options(joinedload(Comment.author)).get_or_404(comment_id)
+    result = paginate_comments(Comment.query.filter(Comment.parent_id == comment_id))
+    if result is None: return jsonify({'error': 'Cursor inválido'}), 400
+    replies, next_cursor = result
+    parent_author = parent_comment.author.username if parent_comment.author else None
+    return jsonify({'replies': serialize_comment_page(replies, replying_to=parent_author), 'next_cursor': next_cursor})
+
 @app.route('/api/albums/<int:album_id>/comments', methods=['POST'])
 @jwt_required()
 def post_comment(album_id):
@@ -651,21 +2227,25 @@ def post_comment(album_id):
     if not data or not data.get('text', '').strip(): return jsonify({'error': 'El comentario no puede estar vacío'}), 400
     new_comment = Comment(text=data['text'], user_id=user_id, album_id=album_id)
     db.session.add(new_comment)
-    db.session.commit()
+    invalidate_responses(f'album:{album_id}')
     create_notification(recipient_id=album.user_id, actor_id=user_id, ntype='new_comment', related_id=album.id)
+    db.session.commit()
     return jsonify({'message': 'Comentario añadido'}), 201
     
 @app.route('/api/comments/<int:comment_id>/reply', methods=['POST'])
 @jwt_required()
 def reply_to_comment(comment_id):
     parent_comment = Comment.query.get_or_404(comment_id)
+    # Un solo nivel de respuestas: cada hilo cuelga de un comentario de primer nivel y se pagina por él
+    if parent_comment.parent_id is not None: return jsonify({'error': 'No se puede responder a una respuesta'}), 400
     user_id = int(get_jwt_identity())
     data = request.get_json()
     if not data or not data.get('text', '').strip(): return jsonify({'error': 'La respuesta no puede estar vacía'}), 400
     reply = Comment(text=data['text'], user_id=user_id, album_id=parent_comment.album_id, parent_id=parent_comment.id)
     db.session.add(reply)
-    db.session.commit()
+    invalidate_responses(f'album:{parent_comment.album_id}')
     create_notification(recipient_id=parent_comment.user_id, actor_id=user_id, ntype='new_reply', related_id=parent_comment.album_id)
+    db.session.commit()
     return jsonify({'message': 'Respuesta añadida'}), 201
 
 @app.route('/api/comments/<int:comment_id>', methods=['DELETE'])
@@ -675,6 +2255,7 @@ def delete_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
     if current_user_id == comment.user_id or current_user_id == comment.album.user_id:
         db.session.delete(comment)
+        invalidate_responses(f'album:{comment.album_id}')
         db.session.commit()
         return jsonify({'message': 'Comentario eliminado'}), 200
     return jsonify({'error': 'No tienes permiso para eliminar este comentario'}), 403
@@ -703,10 +2284,9 @@ def report_comment(comment_id):
         reason=reason
     )
     db.session.add(new_report)
-    db.session.commit()
-
     # Notificar al usuario que su reporte fue recibido
     create_notification(recipient_id=reporter_id, actor_id=1, ntype='report_received')
+    db.session.commit()
 
     return jsonify({'message': 'Comentario reportado con éxito. Gracias por tu colaboración.'}), 201
 
@@ -715,54 +2295,45 @@ def report_comment(comment_id):
 def toggle_follow(user_id):
     follower_id = int(get_jwt_identity())
     if follower_id == user_id: return jsonify({'error': 'No puedes seguirte a ti mismo.'}), 400
+    followed = User.query.get_or_404(user_id)
+    invalidate_responses(f'profile:{followed.username}', f'profile:{db.session.get(User, follower_id).username}', *owner_album_tags(user_id), *owner_album_tags(follower_id))
     follow = Follow.query.filter_by(follower_id=follower_id, followed_id=user_id).first()
     if follow:
         db.session.delete(follow)
-        message, is_followed = 'Has dejado de seguir a este usuario.', False
+        delta, message, is_followed = -1, 'Has dejado de seguir a este usuario.', False
     else:
         new_follow = Follow(follower_id=follower_id, followed_id=user_id)
         db.session.add(new_follow)
         create_notification(recipient_id=user_id, actor_id=follower_id, ntype='new_follower')
-        message, is_followed = 'Ahora sigues a este usuario.', True
+        delta, message, is_followed = 1, 'Ahora sigues a este usuario.', True
+    adjust_follow_counts(follower_id, user_id, delta)
+    # Si el seguido cruza el umbral de reparto, los timelines de sus seguidores ya no reflejan sus álbumes
+    stale_timelines = follower_ids(user_id) if crossed_fanout_threshold(user_id, delta) else []
     db.session.commit()
+    # Su feed cambia de autores: se reconstruye en la próxima lectura
+    timelines.drop(follower_id, *stale_timelines)
     return jsonify({'message': message, 'is_followed': is_followed}), 200
 
 @app.route('/api/albums/<int:album_id>/like', methods=['POST'])
 @jwt_required()
 def toggle_like(album_id):
     user_id = int(get_jwt_identity())
-    album = Album.query.get_or_404(album_id)
-    like = AlbumLike.query.filter_by(user_id=user_id, album_id=album_id).first()
-    if like:
-        db.session.delete(like)
-        album.likes_count = max(0, album.likes_count - 1)
-        message, is_liked = 'Se ha quitado el "Me gusta".', False
-    else:
-        new_like = AlbumLike(user_id=user_id, album_id=album_id)
-        db.session.add(new_like)
-        album.likes_count += 1
-        create_notification(recipient_id=album.user_id, actor_id=user_id, ntype='new_like', related_id=album.id)
-        message, is_liked = '¡Me gusta añadido!', True
+    delta, likes_count, owner_id = toggle_album_mark(AlbumLike, 'likes_count', album_id, user_id)
+    invalidate_responses(f'album:{album_id}')
+    if delta > 0: create_notification(recipient_id=owner_id, actor_id=user_id, ntype='new_like', related_id=album_id)
+    message, is_liked = ('Se ha quitado el "Me gusta".', False) if delta < 0 else ('¡Me gusta añadido!', True)
     db.session.commit()
-    return jsonify({'message': message, 'is_liked': is_liked, 'likes_count': album.likes_count}), 200
+    return jsonify({'message': message, 'is_liked': is_liked, 'likes_count': likes_count}), 200
 
 @app.route('/api/albums/<int:album_id>/save', methods=['POST'])
 @jwt_required()
 def toggle_save(album_id):
     user_id = int(get_jwt_identity())
-    album = Album.query.get_or_404(album_id)
-    saved = SavedAlbum.query.filter_by(user_id=user_id, album_id=album_id).first()
-    if saved:
-        db.session.delete(saved)
-        album.saves_count = max(0, album.saves_count - 1)
-        message, is_saved = 'Álbum quitado de guardados.', False
-    else:
-        new_save = SavedAlbum(user_id=user_id, album_id=album_id)
-        db.session.add(new_save)
-        album.saves_count += 1
-        message, is_saved = 'Álbum guardado.', True
+    delta, saves_count, _ = toggle_album_mark(SavedAlbum, 'saves_count', album_id, user_id)
+    invalidate_responses(f'album:{album_id}')
+    message, is_saved = ('Álbum quitado de guardados.', False) if delta < 0 else ('Álbum guardado.', True)
     db.session.commit()
-    return jsonify({'message': message, 'is_saved': is_saved, 'saves_count': album.saves_count}), 200
+    return jsonify({'message': message, 'is_saved': is_saved, 'saves_count': saves_count}), 200
 
 @app.route('/api/albums/<int:album_id>/report', methods=['POST'])
 @jwt_required()
@@ -774,8 +2345,8 @@ def report_album(album_id):
     if Report.query.filter_by(reporter_id=reporter_id, album_id=album_id).first(): return jsonify({'message': 'Ya has reportado este álbum.'}), 409
     new_report = Report(album_id=album_id, reporter_id=reporter_id, reason=reason, description=description)
     db.session.add(new_report)
-    db.session.commit()
     create_notification(recipient_id=reporter_id, actor_id=1, ntype='report_received')
+    db.session.commit()
     return jsonify({'message': 'Álbum reportado. Gracias.'}), 201
 
 # --- NUEVAS RUTAS PARA GESTIÓN DE NOTIFICACIONES ---
@@ -786,6 +2357,8 @@ def delete_notification(notification_id):
     user_id = int(get_jwt_identity())
     notification = Notification.query.filter_by(id=notification_id, recipient_id=user_id).first_or_404()
     
+    # SQLite no aplica el ON DELETE CASCADE de notification_actor (sin PRAGMA foreign_keys)
+    NotificationActor.query.filter_by(notification_id=notification.id).delete()
     db.session.delete(notification)
     db.session.commit()
     
@@ -797,55 +2370,76 @@ def delete_read_notifications():
     user_id = int(get_jwt_identity())
     
     # Eliminar todas las notificaciones que están marcadas como leídas para el usuario actual
+    read = db.select(Notification.id).where(Notification.recipient_id == user_id, Notification.is_read == True)
+    NotificationActor.query.filter(NotificationActor.notification_id.in_(read)).delete(synchronize_session=False)
     Notification.query.filter_by(recipient_id=user_id, is_read=True).delete()
     db.session.commit()
     
     return jsonify({'message': 'Notificaciones leídas han sido eliminadas'}), 200
 
+@app.route('/media/<path:object_path>', methods=['GET'])
+def serve_local_media(object_path):
+    # Solo con STORAGE_BACKEND=local: sirve los archivos guardados en disco
+    if app.config['STORAGE_BACKEND'] != 'local': abort(404)
+    return send_from_directory(app.config['LOCAL_STORAGE_DIR'], object_path)
+
 # --- RUTAS DE CHAT (HTTP) ---
 # (Rutas de chat sin cambios)
 @app.route('/api/chats', methods=['GET'])
 @jwt_required()
 def get_chats():
     user_id = int(get_jwt_identity())
-    subquery = db.session.query(
-        db.func.greatest(Message.sender_id, Message.recipient_id).label('user1'),
-        db.func.least(Message.sender_id, Message.recipient_id).label('user2'),
-        db.func.max(Message.created_at).label('max_created_at')
-    ).filter(or_(Message.sender_id == user_id, Message.recipient_id == user_id)).group_by('user1', 'user2').subquery()
-    latest_messages_query = db.session.query(Message).join(subquery, and_(
-            db.func.greatest(Message.sender_id, Message.recipient_id) == subquery.c.user1,
-            db.func.least(Message.sender_id, Message.recipient_id) == subquery.c.user2,
-            Message.created_at == subquery.c.max_created_at
-    ))
+    conversations = Conversation.query.filter(or_(Conversation.user_low_id == user_id, Conversation.user_high_id == user_id))\
+        .order_by(Conversation.last_message_at.desc()).all()
+    other_ids = [c.user_high_id if c.user_low_id == user_id else c.user_low_id for c in conversations]
+    users = {u.id: u for u in User.query.filter(User.id.in_(other_ids)).all()} if other_ids else {}
     chats_list = []
-    for last_message in latest_messages_query.all():
-        other_user_id = last_message.sender_id if last_message.recipient_id == user_id else last_message.recipient_id
-        other_user = User.query.get(other_user_id)
-        unread_count = Message.query.filter_by(sender_id=other_user_id, recipient_id=user_id, is_read=False).count()
+    for conversation in conversations:
+        other_user_id, unread_count = (conversation.user_high_id, conversation.unread_low) if conversation.user_low_id == user_id else (conversation.user_low_id, conversation.unread_high)
+        other_user = users.get(other_user_id)
+        if not other_user: continue
         chats_list.append({
             'other_user': {'id': other_user.id, 'username': other_user.username, 'profile_picture_url': get_public_url(other_user.profile_picture_path)},
-            'last_message': {'content': last_message.content, 'created_at': last_message.created_at.isoformat(), 'is_read': last_message.is_read or last_message.sender_id == user_id},
+            'last_message': {'content': conversation.last_message_preview, 'created_at': conversation.last_message_at.isoformat(), 'is_read': unread_count == 0 or conversation.last_sender_id == user_id},
             'unread_count': unread_count
         })
-    chats_list.sort(key=lambda x: x['last_message']['created_at'], reverse=True)
     return jsonify(chats_list)
 
 @app.route('/api/chats/<int:other_user_id>', methods=['GET'])
 @jwt_required()
 def get_chat_history(other_user_id):
+    """Página de mensajes con `other_user_id`, de la más reciente hacia atrás.
+
+    `before` es el cursor devuelto como `next_cursor` en la página anterior; `limit` acota el
+    tamaño de página. Los mensajes se devuelven en orden cronológico y solo se marcan como
+    leídos los que se entregan en esta página.
+    """
     user_id = int(get_jwt_identity())
-    Message.query.filter(or_(and_(Message.sender_id == user_id, Message.recipient_id == other_user_id), and_(Message.sender_id == other_user_id, Message.recipient_id == user_id))).filter(Message.expires_at != None, Message.expires_at < datetime.utcnow()).delete(synchronize_session=False)
-    messages = Message.query.filter(or_(and_(Message.sender_id == user_id, Message.recipient_id == other_user_id), and_(Message.sender_id == other_user_id, Message.recipient_id == user_id))).order_by(Message.created_at.asc()).all()
-    Message.query.filter_by(sender_id=other_user_id, recipient_id=user_id, is_read=False).update({'is_read': True})
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    pair_filter = or_(and_(Message.sender_id == user_id, Message.recipient_id == other_user_id), and_(Message.sender_id == other_user_id, Message.recipient_id == user_id))
+    Message.query.filter(pair_filter).filter(Message.expires_at != None, Message.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+    query = Message.query.filter(pair_filter)
+    if request.args.get('before'):
+        values = decode_cursor(request.args['before'])
+        try: before_created_at, before_id = datetime.fromisoformat(values[0]), int(values[1])
+        except (TypeError, ValueError, IndexError): return jsonify({'error': 'Cursor inválido'}), 400
+        query = query.filter(tuple_(Message.created_at, Message.id) < tuple_(before_created_at, before_id))
+    messages = query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit][::-1]
+    next_cursor = encode_cursor(messages[0].created_at, messages[0].id) if has_more else None
+    # Se serializa antes del commit: el commit expira los mensajes y cada uno se volvería a consultar
+    payload = [{'id': msg.id, 'sender_id': msg.sender_id, 'recipient_id': msg.recipient_id, 'content': msg.content, 'created_at': msg.created_at.isoformat()} for msg in messages]
+    delivered_unread = [msg.id for msg in messages if msg.sender_id == other_user_id and not msg.is_read]
+    if delivered_unread:
+        marked = Message.query.filter(Message.id.in_(delivered_unread), Message.is_read == False).update({'is_read': True}, synchronize_session=False)
+        mark_conversation_read(user_id, other_user_id, marked)
     db.session.commit()
-    return jsonify([{'id': msg.id, 'sender_id': msg.sender_id, 'recipient_id': msg.recipient_id, 'content': msg.content, 'created_at': msg.created_at.isoformat()} for msg in messages])
+    return jsonify({'messages': payload, 'next_cursor': next_cursor})
 
 # =========================================================================
 #  RUTAS EXCLUSIVAS PARA ADMINISTRADORES
 # =========================================================================
-from functools import wraps
-
 def admin_required():
     def wrapper(fn):
         @wraps(fn)
@@ -860,6 +2454,14 @@ def admin_required():
         return decorator
     return wrapper
 
+@app.route('/api/admin/metrics', methods=['GET'])
+@admin_required()
+def get_metrics():
+    """Métricas por ruta de este worker; en formato de texto de Prometheus con ?format=prometheus."""
+    if request.args.get('format') == 'prometheus':
+        return app.response_class(request_metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify(request_metrics.to_json())
+
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required()
 def get_all_users():
@@ -892,44 +2494,28 @@ def delete_user(user_id):
     if user.id == int(current_admin_id):
         return jsonify({'error': 'No puedes eliminar tu propia cuenta de administrador.'}), 400
     
+    # Timelines afectados: los de sus seguidores (tienen sus álbumes) y los de quienes siguen a un usuario
+    # que, al perderlo como seguidor, baja hasta TIMELINE_FANOUT_MAX_FOLLOWERS
+    followed_ids = db.session.query(Follow.followed_id).filter(Follow.follower_id == user.id)
+    crossed_ids = [user_id for user_id, in db.session.query(User.id).filter(User.id.in_(followed_ids), User.followers_count == app.config['TIMELINE_FANOUT_MAX_FOLLOWERS'] + 1)]
+    stale_timelines = follower_ids(user.id, *crossed_ids)
+    remove_user_follows(user.id)
+    # Sus notificaciones (recibidas o causadas): la FK a user no tiene ON DELETE y PostgreSQL rechazaría el borrado
+    notifications = db.select(Notification.id).where(or_(Notification.recipient_id == user.id, Notification.actor_id == user.id))
+    NotificationActor.query.filter(NotificationActor.notification_id.in_(notifications)).delete(synchronize_session=False)
+    Notification.query.filter(Notification.id.in_(notifications)).delete(synchronize_session=False)
+    release_album_tags(db.select(Album.id).where(Album.user_id == user.id))
     db.session.delete(user)
+    invalidate_responses('albums', f'profile:{user.username}')
     db.session.commit()
+    timelines.drop(*stale_timelines)
     return jsonify({'message': f'Usuario {user.username} ha sido eliminado.'})
 
 # --- Lógica de Socket.IO para estado de actividad ---
-@socketio.on('connect')
-@jwt_required(optional=True)
-def handle_connect():
-    user_id_str = get_jwt_identity()
-    if user_id_str:
-        user = User.query.get(int(user_id_str))
-        if user:
-            user.is_active = True
-            user.last_seen = datetime.utcnow()
-            db.session.commit()
-            # Notificar al panel de admin en tiempo real
-            socketio.emit('user_status_changed', {'user_id': user.id, 'is_active': True}, room='admin_room')
-    print(f"Cliente conectado con sid={request.sid}")
-
-@socketio.on('disconnect')
-@jwt_required(optional=True)
-def handle_disconnect():
-    user_id_str = get_jwt_identity()
-    if user_id_str:
-        user = User.query.get(int(user_id_str))
-        if user:
-            user.is_active = False
-            user.last_seen = datetime.utcnow()
-            db.session.commit()
-            # Notificar al panel de admin en tiempo real
-            socketio.emit('user_status_changed', {'user_id': user.id, 'is_active': False}, room='admin_room')
-    print(f"Cliente desconectado: sid={request.sid}")
-
 @socketio.on('join_admin_room')
-@jwt_required()
 def handle_join_admin_room():
-    user_id_str = get_jwt_identity()
-    user = User.query.get(int(user_id_str))
+    user_id = socket_user_id()
+    user = db.session.get(User, user_id) if user_id else None
     if user and user.is_admin:
         join_room('admin_room')
         print(f"Admin {user.username} se unió a la sala de administradores.")
@@ -937,41 +2523,183 @@ def handle_join_admin_room():
 # =========================================================================
 #  6. LÓGICA DE SOCKET.IO PARA CHAT EN TIEMPO REAL
 # =========================================================================
-# (Lógica de Sockets sin cambios)
-user_sids = {}
+def authenticate_socket(token):
+    """Verifica el JWT una sola vez y guarda el usuario en la sesión del socket. Devuelve el user_id o None."""
+    try:
+        claims = decode_token(token)
+        user_id = int(claims['sub'])
+    except Exception as e:
+        print(f"Fallo de autenticación de socket: {e}")
+        return None
+    previous = session.get('socket_user_id')
+    if previous is not None and previous != user_id: leave_room(f'user_{previous}')
+    session['socket_user_id'], session['socket_token_exp'] = user_id, claims.get('exp')
+    join_room(f'user_{user_id}')
+    if presence.connect(user_id, request.sid):
+        # Notificar al panel de admin en tiempo real
+        socketio.emit('user_status_changed', {'user_id': user_id, 'is_active': True}, room='admin_room')
+    print(f"Cliente autenticado y unido a la sala: user_id={user_id}, sid={request.sid}")
+    return user_id
+
+def socket_user_id():
+    """user_id autenticado en este socket; None si no se autenticó o si su token ya expiró."""
+    user_id = session.get('socket_user_id')
+    if user_id is None: return None
+    exp = session.get('socket_token_exp')
+    if exp is not None and exp < time.time():
+        # El cliente debe volver a enviar 'authenticate' con un token vigente
+        emit('auth_expired')
+        return None
+    return user_id
+
 @socketio.on('connect')
-def handle_connect(): print(f"Cliente intentando conectar con sid={request.sid}")
+def handle_connect(auth=None):
+    print(f"Cliente intentando conectar con sid={request.sid}")
+    if isinstance(auth, dict) and auth.get('token'): authenticate_socket(auth['token'])
 @socketio.on('authenticate')
 def handle_authenticate(data):
     token = data.get('token')
-    if not token: return
-    try:
-        user_id = int(decode_token(token)['sub'])
-        join_room(f'user_{user_id}')
-        user_sids[user_id] = request.sid
-        print(f"Cliente autenticado y unido a la sala: user_id={user_id}, sid={request.sid}")
-    except Exception as e: print(f"Fallo de autenticación de socket: {e}")
+    if token: authenticate_socket(token)
 @socketio.on('disconnect')
 def handle_disconnect():
-    user_id_to_remove = next((uid for uid, sid in user_sids.items() if sid == request.sid), None)
-    if user_id_to_remove: del user_sids[user_id_to_remove]
+    user_id, went_offline = presence.disconnect(request.sid)
+    if went_offline:
+        socketio.emit('user_status_changed', {'user_id': user_id, 'is_active': False}, room='admin_room')
     print(f"Cliente desconectado: sid={request.sid}")
 @socketio.on('private_message')
 def handle_private_message(data):
-    token = data.get('token')
-    if not token: return
+    # El remitente sale de la sesión del socket (autenticada una vez), no de un token en cada mensaje
+    sender_id = socket_user_id()
+    if sender_id is None: return
     try:
-        sender_id = int(decode_token(token)['sub'])
         recipient_id, content = data.get('recipient_id'), data.get('content')
         if not (recipient_id and content): return
+        recipient_id = int(recipient_id)
         new_message = Message(sender_id=sender_id, recipient_id=recipient_id, content=content)
         db.session.add(new_message)
-        db.session.commit()
-        create_notification(recipient_id=recipient_id, actor_id=sender_id, ntype='new_message')
+        db.session.flush()
+        record_conversation_message(new_message)
+        create_notification(recipient_id=recipient_id, actor_id=sender_id, ntype='new_message', related_id=sender_id)
         message_data = {'id': new_message.id, 'sender_id': sender_id, 'recipient_id': recipient_id, 'content': content, 'created_at': new_message.created_at.isoformat()}
+        db.session.commit()
         socketio.emit('new_message', message_data, room=f'user_{recipient_id}')
         socketio.emit('message_sent', message_data, room=request.sid)
-    except Exception as e: print(f"Error al manejar mensaje privado: {e}")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al manejar mensaje privado: {e}")
+
+# =========================================================================
+#  COMANDOS DE MANTENIMIENTO (flask <comando>)
+# =========================================================================
+@app.cli.command('recompute-follow-counts')
+def recompute_follow_counts_command():
+    """Recalcula followers_count y following_count de todos los usuarios."""
+    recompute_follow_counts()
+    click.echo('Contadores de seguidores recalculados.')
+
+@app.cli.command('recompute-tag-counts')
+def recompute_tag_counts_command():
+    """Recalcula albums_count de todas las etiquetas."""
+    recompute_tag_counts()
+    click.echo('Contadores de etiquetas recalculados.')
+
+@app.cli.command('merge-album-counters')
+def merge_album_counters_command():
+    """Fusiona en cada álbum los likes/guardados pendientes en album_counter_shard."""
+    merged = counter_shards.merge()
+    click.echo(f'Contadores fusionados en {merged} álbumes.')
+
+# Rutas de lectura cuyas consultas revisan `flask explain-queries` y tests/test_query_plans.py; los {campos} salen de la BD
+EXPLAIN_ROUTES = [
+    '/api/albums?cursor=', '/api/albums?cursor=&sort_by=views_count', '/api/albums/{album_id}',
+    '/api/albums/{album_id}/comments', '/api/comments/{comment_id}/replies', '/api/profiles/{username}',
+    '/api/me/feed', '/api/me/albums', '/api/me/saved-albums', '/api/notifications', '/api/chats',
+    '/api/chats/{other_user_id}', '/api/tags/popular', '/api/tags/{tag}/albums', '/api/search?q={search_term}',
+]
+
+def explain_full_scans(statement, parameters):
+    """Plan de una consulta y las tablas que recorre enteras (Seq Scan en PostgreSQL, SCAN sin índice en SQLite)."""
+    tables = db.metadata.tables
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Con enable_seqscan=off el planificador solo recorre una tabla entera si no tiene índice que usar
+            conn.exec_driver_sql('SET enable_seqscan = off')
+            plan = [line for line, in conn.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+            scans = [match.group(1) for match in map(re.compile(r'Seq Scan on "?(\w+)"?').search, plan) if match]
+        else:
+            plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            scans = [match.group(1) for match in map(re.compile(r'^SCAN "?(\w+)"?$').match, plan) if match]
+        conn.rollback()
+    return plan, [table for table in scans if table in tables]
+
+def explain_samples():
+    """(usuario con sesión, valores de los {campos} de EXPLAIN_ROUTES) tomados de una BD con datos de prueba."""
+    viewer_id = db.session.query(Follow.follower_id).group_by(Follow.follower_id).order_by(db.func.count().desc()).limit(1).scalar()\
+        or db.session.query(User.id).order_by(User.id).limit(1).scalar()
+    album_id = db.session.query(Comment.album_id).group_by(Comment.album_id).order_by(db.func.count().desc()).limit(1).scalar()\
+        or db.session.query(Album.id).order_by(Album.id.desc()).limit(1).scalar()
+    if viewer_id is None or album_id is None: return None, {}
+    conversation = Conversation.query.filter(or_(Conversation.user_low_id == viewer_id, Conversation.user_high_id == viewer_id)).first()
+    # Sin conversaciones propias vale cualquier otro usuario: el historial vacío usa las mismas consultas
+    other_user_id = (conversation.user_high_id if conversation.user_low_id == viewer_id else conversation.user_low_id) if conversation\
+        else db.session.query(User.id).filter(User.id != viewer_id).order_by(User.id).limit(1).scalar()
+    title_words = tokenize(db.session.query(Album.title).filter(Album.id == album_id).scalar())
+    return viewer_id, {
+        'album_id': album_id,
+        'username': db.session.query(User.username).join(Album, Album.user_id == User.id).filter(Album.id == album_id).scalar(),
+        'comment_id': db.session.query(Comment.parent_id).filter(Comment.parent_id != None).limit(1).scalar(),
+        'other_user_id': other_user_id,
+        'tag': db.session.query(Tag.name).order_by(Tag.albums_count.desc()).limit(1).scalar(),
+        'search_term': title_words[0] if title_words else None,
+    }
+
+def explain_route(client, url, headers):
+    """Pide `url` con `client` y devuelve (status, [(consulta, plan, tablas recorridas enteras)]) de sus SELECT."""
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')): statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try: status = client.get(url, headers=headers).status_code
+    finally: event.remove(db.engine, 'before_cursor_execute', capture)
+    return status, [(statement, *explain_full_scans(statement, parameters)) for statement, parameters in statements]
+
+@app.cli.command('explain-queries')
+@click.option('--verbose', is_flag=True, help='Muestra el plan de todas las consultas, no solo de las que fallan.')
+def explain_queries_command(verbose):
+    """Ejecuta EXPLAIN sobre las consultas de las rutas de EXPLAIN_ROUTES y falla si alguna recorre una tabla entera.
+
+    Pensado para una BD con datos de prueba: toma de ella un álbum, un usuario que sigue a otros, etc.
+    Cada ruta se pide sin sesión (validadores de conditional_get incluidos) y con sesión; la caché de
+    respuestas se desactiva mientras tanto para que siempre se ejecute la vista.
+    """
+    global response_cache
+    viewer_id, samples = explain_samples()
+    if viewer_id is None: raise click.ClickException('La BD no tiene usuarios ni álbumes: carga datos de prueba primero.')
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(viewer_id))}'}
+    db.session.remove()
+
+    client, failures = app.test_client(), 0
+    cache, response_cache = response_cache, None
+    try:
+        for route in EXPLAIN_ROUTES:
+            try: url = route.format(**samples)
+            except KeyError: continue
+            if 'None' in url:
+                click.echo(f'--   {route} (sin datos de ejemplo)')
+                continue
+            # Una petición previa sin medir: los índices en memoria (búsqueda en SQLite) se reconstruyen recorriendo tablas
+            client.get(url)
+            for mode, request_headers in (('anónimo', {}), ('con sesión', headers)):
+                status, results = explain_route(client, url, request_headers)
+                if status == 401: continue  # ruta solo para usuarios con sesión
+                scanned = sorted({table for _, _, scans in results for table in scans})
+                failures += bool(scanned)
+                click.echo(f"{'SCAN' if scanned else 'ok  '} {url} ({mode}) [{status}] {len(results)} consultas" + (f" -> {', '.join(scanned)}" if scanned else ''))
+                for statement, plan, scans in results:
+                    if scans or verbose: click.echo('\n'.join(['', statement, *('    ' + line for line in plan), '']))
+    finally:
+        response_cache = cache
+    if failures: raise click.ClickException(f'{failures} rutas recorren tablas enteras.')
 
 # =========================================================================
 #  7. PUNTO DE ENTRADA PRINCIPAL
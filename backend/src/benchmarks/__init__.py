@@ -0,0 +1,14 @@
+"""Benchmarks reproducibles de la API y del chat por Socket.IO.
+
+Generan una BD local con datos sintéticos (misma semilla = mismos datos), sustituyen Supabase por el
+almacenamiento en disco (STORAGE_BACKEND=local, MEDIA_URL_BACKEND=local) y miden cada ruta /api/*
+dentro del proceso con el cliente de pruebas de Flask, sin red de por medio. Desde backend/src:
+
+    python -m benchmarks run --users 300 --output base.json
+    python -m benchmarks run --users 300 --output nuevo.json
+    python -m benchmarks compare base.json nuevo.json     # termina con código 1 si algo empeoró
+    python -m benchmarks seed --users 2000 --database-url postgresql://...   # solo los datos
+
+Sin --database-url se usa un SQLite temporal. Con --database-url la BD indicada se VACÍA antes de
+llenarla: úsese solo con una BD local de pruebas.
+"""
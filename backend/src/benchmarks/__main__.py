@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+
+def configure(args):
+    """Entorno de app.py antes de importarlo: BD de benchmark, almacenamiento en disco en lugar de Supabase."""
+    workdir = tempfile.mkdtemp(prefix='benchmark_')
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-secret-key-de-32-bytes!!')
+    os.environ.update({
+        'STORAGE_BACKEND': 'local', 'LOCAL_STORAGE_DIR': os.path.join(workdir, 'media'), 'MEDIA_URL_BACKEND': 'local',
+        # Vacías y no ausentes: load_dotenv no pisa las variables ya definidas con el .env de desarrollo
+        'SUPABASE_URL': '', 'SUPABASE_KEY': '', 'SOCKETIO_MESSAGE_QUEUE': '',
+        'RESPONSE_CACHE_BACKEND': args.response_cache, 'TIMELINE_BACKEND': 'memory',
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks reproducibles de la API y del chat.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('run', 'seed'):
+        command = commands.add_parser(name)
+        command.add_argument('--users', type=int, default=300, help='usuarios sintéticos (el resto de tablas escala con esto)')
+        command.add_argument('--seed', type=int, default=1)
+        command.add_argument('--database-url', help='BD a VACIAR y llenar (por defecto, un SQLite temporal)')
+        command.add_argument('--response-cache', default='memory', help='RESPONSE_CACHE_BACKEND durante el benchmark')
+    run = commands.choices['run']
+    run.add_argument('--iterations', type=int, default=30, help='peticiones medidas por escenario')
+    run.add_argument('--warmup', type=int, default=5, help='peticiones previas sin medir por escenario')
+    run.add_argument('--concurrency', type=int, default=4, help='hilos de la prueba de rendimiento (0 la omite)')
+    run.add_argument('--duration', type=float, default=5, help='segundos de la prueba de rendimiento')
+    run.add_argument('--only', help='mide solo los escenarios cuyo nombre contenga este texto')
+    run.add_argument('--output', help='fichero JSON con los resultados')
+    compare = commands.add_parser('compare')
+    compare.add_argument('base')
+    compare.add_argument('current')
+    compare.add_argument('--metric', default='p50_ms', choices=['mean_ms', 'p50_ms', 'p90_ms', 'p99_ms'])
+    compare.add_argument('--threshold', type=float, default=0.15, help='empeoramiento relativo tolerado (0.15 = 15 %%)')
+    compare.add_argument('--min-delta-ms', type=float, default=1.0, help='empeoramiento absoluto mínimo para contar')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        from benchmarks.compare import report
+        return report(args.base, args.current, args.metric, args.threshold, args.min_delta_ms)
+
+    configure(args)
+    if args.command == 'seed':
+        from app import app
+        from benchmarks.data import generate
+        with app.app_context(): print(json.dumps(generate(args.users, args.seed), indent=2))
+        return 0
+
+    from benchmarks.runner import run as run_benchmarks
+    results = run_benchmarks(args.users, args.seed, args.iterations, args.warmup, args.concurrency, args.duration, args.only)
+    if results['uncovered_routes']: print(f"Rutas sin escenario: {', '.join(results['uncovered_routes'])}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle: json.dump(results, handle, indent=2, ensure_ascii=False)
+        print(f'Resultados en {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Compara dos resultados de `run` y marca como regresión lo que empeoró más allá del umbral."""
+import json
+
+
+def load(path):
+    with open(path, encoding='utf-8') as handle: return json.load(handle)
+
+
+def slower(before, after, threshold, min_delta_ms):
+    # Relativo y absoluto: en rutas de décimas de ms un 15 % es ruido del planificador
+    return after - before > min_delta_ms and after > before * (1 + threshold)
+
+
+def compare(base, current, metric='p50_ms', threshold=0.15, min_delta_ms=1.0):
+    """Devuelve (filas, regresiones); cada fila es (nombre, antes, después, cambio, es_regresión)."""
+    rows, regressions = [], []
+    def add(name, before, after, regressed):
+        change = f'{(after - before) / before * 100:+.1f}%' if before else '-'
+        rows.append((name, before, after, change, regressed))
+        if regressed: regressions.append(name)
+
+    for name, stats in sorted(current['routes'].items()):
+        previous = base['routes'].get(name)
+        if not previous: continue
+        add(name, previous[metric], stats[metric], slower(previous[metric], stats[metric], threshold, min_delta_ms))
+        # Una consulta más por petición es una regresión aunque hoy no se note en el tiempo
+        if stats['queries'] > previous['queries'] + 0.5:
+            add(f'{name} (consultas)', previous['queries'], stats['queries'], True)
+        if stats['errors'] > previous['errors']:
+            add(f'{name} (errores)', previous['errors'], stats['errors'], True)
+
+    if base.get('throughput') and current.get('throughput'):
+        before, after = base['throughput']['requests_per_second'], current['throughput']['requests_per_second']
+        add('rendimiento (peticiones/s)', before, after, after < before * (1 - threshold))
+    for name, stats in sorted((current.get('socketio') or {}).items()):
+        previous = (base.get('socketio') or {}).get(name)
+        if previous: add(f'socket.io {name}', previous[metric], stats[metric], slower(previous[metric], stats[metric], threshold, min_delta_ms))
+    return rows, regressions
+
+
+def report(base_path, current_path, metric='p50_ms', threshold=0.15, min_delta_ms=1.0):
+    base, current = load(base_path), load(current_path)
+    for key in ('database', 'users', 'seed'):
+        if base['meta'].get(key) != current['meta'].get(key):
+            print(f"Aviso: '{key}' distinto ({base['meta'].get(key)} frente a {current['meta'].get(key)}); la comparación no es directa")
+    rows, regressions = compare(base, current, metric, threshold, min_delta_ms)
+    print(f"{'':<64} {'antes':>10} {'después':>10} {'cambio':>9}")
+    for name, before, after, change, regressed in rows:
+        print(f"{name:<64} {before:>10} {after:>10} {change:>9}" + ('  REGRESIÓN' if regressed else ''))
+    missing = sorted(set(base['routes']) - set(current['routes']))
+    if missing: print(f"Sin medir en el resultado nuevo: {', '.join(missing)}")
+    print(f"{len(regressions)} regresiones ({metric}, umbral {threshold:.0%} y {min_delta_ms} ms)")
+    return 1 if regressions else 0
@@ -0,0 +1,200 @@
+"""Generador determinista de datos sintéticos con la asimetría de una red social real.
+
+Unos pocos usuarios publican la mayoría de los álbumes y se llevan casi todos los seguidores, likes y
+comentarios (pesos tipo Zipf); la mayoría mira más de lo que publica. Con la misma semilla y el mismo
+número de usuarios se genera exactamente la misma BD, ids incluidos.
+"""
+import random
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+from app import (
+    db, User, Album, Media, Tag, album_tags, Comment, Follow, AlbumLike, SavedAlbum, Message, Conversation,
+    Notification, NotificationActor, recompute_follow_counts, recompute_tag_counts
+)
+
+PASSWORD = 'benchmark'
+EPOCH = datetime(2026, 1, 1)  # fecha fija: los datos no dependen del día en que se generan
+DAYS = 365
+TAG_WORDS = [
+    'tacna', 'paisaje', 'arequipa', 'retrato', 'viaje', 'playa', 'desierto', 'boda', 'familia', 'comida',
+    'fiesta', 'atardecer', 'montaña', 'ciudad', 'noche', 'arquitectura', 'naturaleza', 'perros', 'gatos', 'moda',
+    'deporte', 'futbol', 'musica', 'concierto', 'arte', 'mural', 'calle', 'mercado', 'iglesia', 'plaza',
+    'candarave', 'tarata', 'ilo', 'moquegua', 'vendimia', 'carnaval', 'procesion', 'cumpleaños', 'graduacion', 'mascotas',
+]
+TITLE_WORDS = ['Recuerdos', 'Paseo', 'Tarde', 'Domingo', 'Festival', 'Ruta', 'Sesión', 'Viaje', 'Mañana', 'Encuentro']
+MODELS = [User, Album, Media, Tag, Comment, Follow, AlbumLike, SavedAlbum, Message, Conversation, Notification, NotificationActor]
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def moment(rnd, after=None):
+    # Instante aleatorio del año de datos, posterior a `after` si se indica
+    start = after or EPOCH
+    span = max((EPOCH + timedelta(days=DAYS) - start).total_seconds(), 1)
+    return start + timedelta(seconds=rnd.random() * span)
+
+
+def bulk_insert(target, rows):
+    if rows: db.session.execute((target.__table__ if hasattr(target, '__table__') else target).insert(), rows)
+
+
+def generate(users=300, seed=1):
+    """Vacía la BD configurada y la llena con `users` usuarios y su actividad.
+
+    Devuelve el número de filas de cada tabla. El usuario 1 es administrador; todos usan la contraseña
+    PASSWORD (se calcula un único hash para no pasar minutos en scrypt).
+    """
+    rnd = random.Random(seed)
+    db.drop_all()
+    db.create_all()
+    password_hash = generate_password_hash(PASSWORD)
+
+    user_ids = list(range(1, users + 1))
+    # Popularidad de cada usuario como creador: el orden de la lista de pesos Zipf se baraja
+    ranking = rnd.sample(user_ids, len(user_ids))
+    creator_weight = dict(zip(ranking, zipf_weights(users)))
+    ranking_weights = list(creator_weight.values())
+    bulk_insert(User, [{
+        'id': user_id, 'username': f'user{user_id:05d}', 'email': f'user{user_id:05d}@example.com', 'password_hash': password_hash,
+        'bio': f'Bio del usuario {user_id}' if rnd.random() < 0.5 else None,
+        'profile_picture_path': f'bench/user{user_id:05d}/avatar.jpg' if rnd.random() < 0.6 else None,
+        'is_admin': user_id == 1, 'is_approved': True, 'is_active': False, 'last_seen': moment(rnd), 'updated_at': EPOCH,
+    } for user_id in user_ids])
+
+    # Álbumes: los ids crecen con la fecha, como en producción
+    album_count = users * 3
+    owners = rnd.choices(ranking, weights=ranking_weights, k=album_count)
+    album_dates = sorted(moment(rnd) for _ in range(album_count))
+    album_weight = {album_id: creator_weight[owner] * rnd.lognormvariate(0, 1) for album_id, owner in enumerate(owners, start=1)}
+    albums, media, tag_links = [], [], []
+    tag_weights = zipf_weights(len(TAG_WORDS))
+    media_id = 0
+    for album_id, (owner, created_at) in enumerate(zip(owners, album_dates), start=1):
+        paths = []
+        for position in range(min(int(rnd.paretovariate(1.2)) + rnd.randint(0, 4), 40)):
+            media_id += 1
+            is_image = rnd.random() < 0.85
+            path = f'bench/user{owner:05d}/album_{album_id}/{media_id}.{"jpg" if is_image else "mp4"}'
+            variants = {
+                'webp': {str(width): f'{path}.{width}.webp' for width in (320, 640, 1280)},
+                'jpeg': {str(width): f'{path}.{width}.jpg' for width in (320, 640, 1280)},
+                'placeholder': None,
+            } if is_image and rnd.random() < 0.7 else None
+            media.append({'id': media_id, 'album_id': album_id, 'file_path': path, 'file_type': 'image/jpeg' if is_image else 'video/mp4',
+                          'position': position, 'created_at': created_at, 'variants': variants})
+            paths.append(path)
+        albums.append({
+            'id': album_id, 'user_id': owner, 'created_at': created_at, 'updated_at': created_at,
+            'title': f'{rnd.choice(TITLE_WORDS)} en {rnd.choices(TAG_WORDS, weights=tag_weights)[0]} {album_id}',
+            'description': f'Álbum de prueba {album_id}' if rnd.random() < 0.7 else None,
+            'views_count': int(album_weight[album_id] * 5000), 'likes_count': 0, 'saves_count': 0, 'shares_count': 0,
+            'thumbnail_path': paths[0] if paths and rnd.random() < 0.8 else None,
+        })
+        for tag_index in {rnd.choices(range(len(TAG_WORDS)), weights=tag_weights)[0] for _ in range(rnd.randint(0, 4))}:
+            tag_links.append({'album_id': album_id, 'tag_id': tag_index + 1})
+    bulk_insert(Tag, [{'id': index + 1, 'name': word, 'albums_count': 0} for index, word in enumerate(TAG_WORDS)])
+    bulk_insert(Album, albums)
+    bulk_insert(Media, media)
+    bulk_insert(album_tags, tag_links)
+
+    # Seguimientos: cada usuario sigue a unos pocos, casi siempre a los más populares
+    follows = set()
+    for user_id in user_ids:
+        for followed in rnd.choices(ranking, weights=ranking_weights, k=min(int(rnd.paretovariate(1.3) * 3), users - 1)):
+            if followed != user_id: follows.add((user_id, followed))
+    bulk_insert(Follow, [{'follower_id': follower, 'followed_id': followed} for follower, followed in sorted(follows)])
+
+    album_ids = list(range(1, album_count + 1))
+    album_weights = [album_weight[album_id] for album_id in album_ids]
+    likes = {(rnd.choice(user_ids), album_id) for album_id in rnd.choices(album_ids, weights=album_weights, k=users * 10)}
+    saves = {(rnd.choice(user_ids), album_id) for album_id in rnd.choices(album_ids, weights=album_weights, k=users * 2)}
+    bulk_insert(AlbumLike, [{'user_id': user_id, 'album_id': album_id} for user_id, album_id in sorted(likes)])
+    bulk_insert(SavedAlbum, [{'user_id': user_id, 'album_id': album_id} for user_id, album_id in sorted(saves)])
+
+    # Comentarios concentrados en los álbumes populares; una cuarta parte son respuestas
+    comments, top_level = [], {}
+    for comment_id, album_id in enumerate(rnd.choices(album_ids, weights=album_weights, k=album_count * 3), start=1):
+        parent = rnd.choice(top_level[album_id]) if top_level.get(album_id) and rnd.random() < 0.25 else None
+        author = rnd.choice(user_ids)
+        comments.append({'id': comment_id, 'album_id': album_id, 'user_id': author, 'parent_id': parent and parent[0],
+                         'text': f'Comentario {comment_id}', 'created_at': moment(rnd, parent[1] if parent else album_dates[album_id - 1])})
+        if parent is None: top_level.setdefault(album_id, []).append((comment_id, comments[-1]['created_at']))
+    bulk_insert(Comment, comments)
+
+    # Chats: pocas conversaciones muy activas y muchas de un par de mensajes
+    messages, conversations = [], {}
+    for _ in range(users // 2):
+        sender = rnd.choice(user_ids)
+        recipient = rnd.choices(ranking, weights=ranking_weights)[0]
+        if sender == recipient: continue
+        created_at = moment(rnd)
+        for _ in range(min(int(rnd.paretovariate(1.1) * 2), 300)):
+            created_at += timedelta(seconds=rnd.randint(5, 3600))
+            from_id, to_id = (sender, recipient) if rnd.random() < 0.5 else (recipient, sender)
+            messages.append({'id': len(messages) + 1, 'sender_id': from_id, 'recipient_id': to_id, 'content': f'Mensaje {len(messages) + 1}',
+                             'created_at': created_at, 'is_read': rnd.random() < 0.9})
+            low, high = sorted((from_id, to_id))
+            summary = conversations.setdefault((low, high), {'user_low_id': low, 'user_high_id': high, 'unread_low': 0, 'unread_high': 0})
+            if summary.get('last_message_at') is None or created_at >= summary['last_message_at']:
+                summary.update(last_message_id=messages[-1]['id'], last_message_preview=messages[-1]['content'], last_message_at=created_at, last_sender_id=from_id)
+            if not messages[-1]['is_read']: summary['unread_low' if to_id == low else 'unread_high'] += 1
+    bulk_insert(Message, messages)
+    bulk_insert(Conversation, list(conversations.values()))
+
+    # Notificaciones de una muestra de la actividad anterior
+    owner_of = {album['id']: album['user_id'] for album in albums}
+    events = [('new_follower', followed, follower, None) for follower, followed in follows]
+    events += [('new_like', owner_of[album_id], user_id, album_id) for user_id, album_id in likes]
+    events += [('new_comment', owner_of[comment['album_id']], comment['user_id'], comment['album_id']) for comment in comments]
+    notifications = [{'id': 0, 'recipient_id': recipient, 'actor_id': actor, 'notification_type': ntype, 'related_entity_id': related,
+                      'is_read': rnd.random() < 0.7, 'created_at': moment(rnd), 'actor_count': 1}
+                     for ntype, recipient, actor, related in sorted(events, key=str) if recipient != actor and rnd.random() < 0.3]
+    for index, notification in enumerate(notifications, 1): notification['id'] = index
+    bulk_insert(Notification, notifications)
+    bulk_insert(NotificationActor, [{'notification_id': notification['id'], 'actor_id': notification['actor_id']} for notification in notifications])
+
+    Album.query.update({
+        Album.likes_count: db.select(db.func.count()).where(AlbumLike.album_id == Album.id).scalar_subquery(),
+        Album.saves_count: db.select(db.func.count()).where(SavedAlbum.album_id == Album.id).scalar_subquery(),
+    }, synchronize_session=False)
+    db.session.commit()
+    recompute_follow_counts()
+    recompute_tag_counts()
+    if db.engine.dialect.name == 'postgresql':
+        # Los ids se insertaron explícitos: las secuencias deben continuar tras el último
+        for model in MODELS:
+            if 'id' in model.__table__.c:
+                db.session.execute(db.text(f"SELECT setval(pg_get_serial_sequence('\"{model.__tablename__}\"', 'id'), COALESCE(MAX(id), 1)) FROM \"{model.__tablename__}\""))
+        db.session.commit()
+    return dataset_counts()
+
+
+def dataset_counts():
+    return {model.__tablename__: db.session.query(db.func.count()).select_from(model).scalar() for model in MODELS}
+
+
+def reference_ids():
+    """Ids de la BD sobre los que actúan los benchmarks: el álbum más popular, quien más sigue, etc."""
+    def most_frequent(*columns):
+        return db.session.query(*columns).filter(columns[0] != None).group_by(*columns).order_by(db.func.count().desc(), *columns).first()
+    creator_id, = most_frequent(Album.user_id)
+    hot_comment = db.session.get(Comment, most_frequent(Comment.parent_id)[0])
+    chat_user_id, chat_other_id = most_frequent(Message.sender_id, Message.recipient_id)
+    viewer_id, = most_frequent(Follow.follower_id)
+    return {
+        'admin_id': 1,
+        'viewer_id': viewer_id,
+        'creator_id': creator_id,
+        'creator_username': db.session.get(User, creator_id).username,
+        'creator_album_id': db.session.query(db.func.max(Album.id)).filter(Album.user_id == creator_id).scalar(),
+        'hot_album_id': db.session.query(Album.id).order_by(Album.likes_count.desc(), Album.id).limit(1).scalar(),
+        'hot_comment_id': hot_comment.id,
+        # Quien reporta el comentario no puede ser su autor
+        'reporter_id': next(user_id for user_id in (viewer_id, 1, 2) if user_id != hot_comment.user_id),
+        'chat_user_id': chat_user_id,
+        'chat_other_id': chat_other_id,
+        'tag': db.session.query(Tag.name).order_by(Tag.albums_count.desc()).limit(1).scalar(),
+        'search_term': TITLE_WORDS[0].lower(),
+    }
@@ -0,0 +1,450 @@
+"""Latencia por ruta, rendimiento con varios hilos y el camino del chat por Socket.IO.
+
+Cada escenario hace exactamente una petición medida (`ctx.measure`) por iteración; lo que necesite
+antes o después (crear el álbum que se va a borrar, deshacer un comentario...) va por `ctx.request`
+o directo a la BD y no cuenta en el tiempo.
+"""
+import io
+import os
+import platform
+import subprocess
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from PIL import Image
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app import app, db, socketio, Comment, CommentReport, Media, Notification, Report, User
+from benchmarks.data import PASSWORD, dataset_counts, reference_ids
+
+SCENARIOS = []  # (método, regla de Flask, variante, función)
+
+
+def scenario(method, rule, variant=None):
+    def register(fn):
+        SCENARIOS.append((method, rule, variant, fn))
+        return fn
+    return register
+
+
+def scenario_name(method, rule, variant):
+    return f'{method} {rule}' + (f' [{variant}]' if variant else '')
+
+
+def sample_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 120, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class BenchmarkContext:
+    """Cliente de pruebas con tokens por usuario y registro de las peticiones medidas."""
+    IMAGE = None
+
+    def __init__(self, refs):
+        self.refs = refs
+        self.client = app.test_client()
+        self.samples = []
+        self._tokens = {}
+        self._sequence = 0
+        self._statements = 0
+        self._thread = threading.get_ident()
+
+    def count_statements(self, *args):
+        # Solo las del hilo que mide: las variantes de imagen y los volcados van en otros hilos
+        if threading.get_ident() == self._thread: self._statements += 1
+
+    def headers(self, user_id):
+        if user_id is None: return {}
+        if user_id not in self._tokens:
+            with app.app_context(): self._tokens[user_id] = create_access_token(identity=str(user_id))
+        return {'Authorization': f'Bearer {self._tokens[user_id]}'}
+
+    def next_id(self):
+        self._sequence += 1
+        return self._sequence
+
+    def upload(self):
+        if BenchmarkContext.IMAGE is None: BenchmarkContext.IMAGE = sample_image()
+        return {'data': {'file': (io.BytesIO(BenchmarkContext.IMAGE), 'benchmark.jpg', 'image/jpeg')}, 'content_type': 'multipart/form-data'}
+
+    def request(self, method, url, user=None, **kwargs):
+        return self.client.open(url, method=method, headers=self.headers(user), **kwargs)
+
+    def measure(self, method, url, user=None, **kwargs):
+        headers = self.headers(user)
+        self._statements = 0
+        start = time.perf_counter()
+        response = self.client.open(url, method=method, headers=headers, **kwargs)
+        self.samples.append((time.perf_counter() - start, self._statements, response.status_code))
+        return response
+
+    def query(self, fn):
+        with app.app_context():
+            result = fn()
+            db.session.commit()
+            return result
+
+
+# --- Escenarios: uno por método y regla de /api/*; varios si la ruta tiene modos distintos ---
+@scenario('POST', '/api/register')
+def register(ctx):
+    name = f'bench_new_{ctx.next_id()}'
+    ctx.measure('POST', '/api/register', json={'username': name, 'email': f'{name}@example.com', 'password': PASSWORD})
+
+@scenario('POST', '/api/login')
+def login(ctx):
+    ctx.measure('POST', '/api/login', json={'username': f"user{ctx.refs['viewer_id']:05d}", 'password': PASSWORD})
+
+@scenario('GET', '/api/profiles/<username>', 'anónimo')
+def profile_anonymous(ctx):
+    ctx.measure('GET', f"/api/profiles/{ctx.refs['creator_username']}")
+
+@scenario('GET', '/api/profiles/<username>', 'con sesión')
+def profile(ctx):
+    ctx.measure('GET', f"/api/profiles/{ctx.refs['creator_username']}", user=ctx.refs['viewer_id'])
+
+@scenario('PUT', '/api/my-profile')
+def update_profile(ctx):
+    ctx.measure('PUT', '/api/my-profile', user=ctx.refs['viewer_id'], json={'bio': 'Bio de benchmark'})
+
+@scenario('POST', '/api/my-profile/picture')
+def upload_picture(ctx):
+    ctx.measure('POST', '/api/my-profile/picture', user=ctx.refs['viewer_id'], **ctx.upload())
+
+@scenario('DELETE', '/api/my-profile/picture')
+def delete_picture(ctx):
+    ctx.request('POST', '/api/my-profile/picture', user=ctx.refs['viewer_id'], **ctx.upload())
+    ctx.measure('DELETE', '/api/my-profile/picture', user=ctx.refs['viewer_id'])
+
+@scenario('POST', '/api/my-profile/banner')
+def upload_banner(ctx):
+    ctx.measure('POST', '/api/my-profile/banner', user=ctx.refs['viewer_id'], **ctx.upload())
+
+@scenario('DELETE', '/api/my-profile/banner')
+def delete_banner(ctx):
+    ctx.request('POST', '/api/my-profile/banner', user=ctx.refs['viewer_id'], **ctx.upload())
+    ctx.measure('DELETE', '/api/my-profile/banner', user=ctx.refs['viewer_id'])
+
+@scenario('GET', '/api/me/albums')
+def my_albums(ctx):
+    ctx.measure('GET', '/api/me/albums', user=ctx.refs['creator_id'])
+
+@scenario('GET', '/api/me/feed')
+def my_feed(ctx):
+    ctx.measure('GET', '/api/me/feed', user=ctx.refs['viewer_id'])
+
+@scenario('GET', '/api/search')
+def search(ctx):
+    ctx.measure('GET', f"/api/search?q={ctx.refs['search_term']}", user=ctx.refs['viewer_id'])
+
+@scenario('GET', '/api/me/saved-albums')
+def saved_albums(ctx):
+    ctx.measure('GET', '/api/me/saved-albums', user=ctx.refs['viewer_id'])
+
+@scenario('GET', '/api/notifications')
+def notifications(ctx):
+    ctx.measure('GET', '/api/notifications', user=ctx.refs['creator_id'])
+
+@scenario('POST', '/api/notifications/read')
+def read_notifications(ctx):
+    ctx.measure('POST', '/api/notifications/read', user=ctx.refs['creator_id'])
+
+@scenario('GET', '/api/albums', 'página')
+def albums_page(ctx):
+    ctx.measure('GET', '/api/albums?page=1&per_page=16')
+
+@scenario('GET', '/api/albums', 'cursor')
+def albums_cursor(ctx):
+    ctx.measure('GET', '/api/albums?cursor=&per_page=16', user=ctx.refs['viewer_id'])
+
+@scenario('POST', '/api/albums')
+def create_album(ctx):
+    response = ctx.measure('POST', '/api/albums', user=ctx.refs['creator_id'], json={'title': 'Álbum de benchmark', 'tags': 'tacna, benchmark'})
+    if response.status_code == 201: ctx.request('DELETE', f"/api/albums/{response.get_json()['album_id']}", user=ctx.refs['creator_id'])
+
+@scenario('GET', '/api/tags/popular')
+def popular_tags(ctx):
+    ctx.measure('GET', '/api/tags/popular')
+
+@scenario('GET', '/api/tags/<name>/albums')
+def tag_albums(ctx):
+    ctx.measure('GET', f"/api/tags/{ctx.refs['tag']}/albums")
+
+@scenario('GET', '/api/albums/<int:album_id>', 'anónimo')
+def album_anonymous(ctx):
+    ctx.measure('GET', f"/api/albums/{ctx.refs['hot_album_id']}")
+
+@scenario('GET', '/api/albums/<int:album_id>', 'con sesión')
+def album(ctx):
+    ctx.measure('GET', f"/api/albums/{ctx.refs['hot_album_id']}", user=ctx.refs['viewer_id'])
+
+@scenario('PUT', '/api/albums/<int:album_id>')
+def update_album(ctx):
+    ctx.measure('PUT', f"/api/albums/{ctx.refs['creator_album_id']}", user=ctx.refs['creator_id'], json={'description': 'Editado en el benchmark', 'tags': 'tacna, paisaje'})
+
+@scenario('DELETE', '/api/albums/<int:album_id>')
+def delete_album(ctx):
+    album_id = ctx.request('POST', '/api/albums', user=ctx.refs['creator_id'], json={'title': 'Para borrar', 'tags': 'benchmark'}).get_json()['album_id']
+    ctx.request('POST', f'/api/albums/{album_id}/media', user=ctx.refs['creator_id'], **ctx.upload())
+    ctx.measure('DELETE', f'/api/albums/{album_id}', user=ctx.refs['creator_id'])
+
+def last_media_id(album_id):
+    return db.session.query(db.func.max(Media.id)).filter(Media.album_id == album_id).scalar()
+
+@scenario('POST', '/api/albums/<int:album_id>/media')
+def upload_media(ctx):
+    album_id = ctx.refs['creator_album_id']
+    if ctx.measure('POST', f'/api/albums/{album_id}/media', user=ctx.refs['creator_id'], **ctx.upload()).status_code == 201:
+        ctx.request('DELETE', f'/api/media/{ctx.query(lambda: last_media_id(album_id))}', user=ctx.refs['creator_id'])
+
+@scenario('DELETE', '/api/media/<int:media_id>')
+def delete_media(ctx):
+    album_id = ctx.refs['creator_album_id']
+    ctx.request('POST', f'/api/albums/{album_id}/media', user=ctx.refs['creator_id'], **ctx.upload())
+    ctx.measure('DELETE', f'/api/media/{ctx.query(lambda: last_media_id(album_id))}', user=ctx.refs['creator_id'])
+
+@scenario('PUT', '/api/albums/<int:album_id>/reorder')
+def reorder_media(ctx):
+    album_id = ctx.refs['creator_album_id']
+    media_ids = ctx.query(lambda: [media_id for media_id, in db.session.query(Media.id).filter(Media.album_id == album_id).order_by(Media.position, Media.id)])
+    ctx.measure('PUT', f'/api/albums/{album_id}/reorder', user=ctx.refs['creator_id'], json={'media_ids': media_ids[::-1]})
+
+@scenario('PUT', '/api/albums/<int:album_id>/cover')
+def set_cover(ctx):
+    album_id = ctx.refs['creator_album_id']
+    media_id = ctx.query(lambda: db.session.query(db.func.min(Media.id)).filter(Media.album_id == album_id).scalar())
+    ctx.measure('PUT', f'/api/albums/{album_id}/cover', user=ctx.refs['creator_id'], json={'media_id': media_id})
+
+@scenario('GET', '/api/albums/<int:album_id>/comments')
+def album_comments(ctx):
+    ctx.measure('GET', f"/api/albums/{ctx.refs['hot_album_id']}/comments", user=ctx.refs['viewer_id'])
+
+@scenario('GET', '/api/comments/<int:comment_id>/replies')
+def comment_replies(ctx):
+    ctx.measure('GET', f"/api/comments/{ctx.refs['hot_comment_id']}/replies", user=ctx.refs['viewer_id'])
+
+def last_comment_id(user_id):
+    return db.session.query(db.func.max(Comment.id)).filter(Comment.user_id == user_id).scalar()
+
+@scenario('POST', '/api/albums/<int:album_id>/comments')
+def post_comment(ctx):
+    user_id = ctx.refs['viewer_id']
+    if ctx.measure('POST', f"/api/albums/{ctx.refs['hot_album_id']}/comments", user=user_id, json={'text': 'Comentario de benchmark'}).status_code == 201:
+        ctx.request('DELETE', f'/api/comments/{ctx.query(lambda: last_comment_id(user_id))}', user=user_id)
+
+@scenario('POST', '/api/comments/<int:comment_id>/reply')
+def reply_comment(ctx):
+    user_id = ctx.refs['viewer_id']
+    if ctx.measure('POST', f"/api/comments/{ctx.refs['hot_comment_id']}/reply", user=user_id, json={'text': 'Respuesta de benchmark'}).status_code == 201:
+        ctx.request('DELETE', f'/api/comments/{ctx.query(lambda: last_comment_id(user_id))}', user=user_id)
+
+@scenario('DELETE', '/api/comments/<int:comment_id>')
+def delete_comment(ctx):
+    user_id = ctx.refs['viewer_id']
+    ctx.request('POST', f"/api/albums/{ctx.refs['hot_album_id']}/comments", user=user_id, json={'text': 'Para borrar'})
+    ctx.measure('DELETE', f'/api/comments/{ctx.query(lambda: last_comment_id(user_id))}', user=user_id)
+
+@scenario('POST', '/api/comments/<int:comment_id>/report')
+def report_comment(ctx):
+    comment_id, user_id = ctx.refs['hot_comment_id'], ctx.refs['reporter_id']
+    ctx.measure('POST', f'/api/comments/{comment_id}/report', user=user_id, json={'reason': 'spam'})
+    ctx.query(lambda: CommentReport.query.filter_by(comment_id=comment_id, reporter_id=user_id).delete())
+
+@scenario('POST', '/api/users/<int:user_id>/follow')
+def toggle_follow(ctx):
+    ctx.measure('POST', f"/api/users/{ctx.refs['creator_id']}/follow", user=ctx.refs['reporter_id'])
+
+@scenario('POST', '/api/albums/<int:album_id>/like')
+def toggle_like(ctx):
+    ctx.measure('POST', f"/api/albums/{ctx.refs['hot_album_id']}/like", user=ctx.refs['viewer_id'])
+
+@scenario('POST', '/api/albums/<int:album_id>/save')
+def toggle_save(ctx):
+    ctx.measure('POST', f"/api/albums/{ctx.refs['hot_album_id']}/save", user=ctx.refs['viewer_id'])
+
+@scenario('POST', '/api/albums/<int:album_id>/report')
+def report_album(ctx):
+    album_id, user_id = ctx.refs['hot_album_id'], ctx.refs['viewer_id']
+    ctx.measure('POST', f'/api/albums/{album_id}/report', user=user_id, json={'reason': 'spam'})
+    ctx.query(lambda: Report.query.filter_by(album_id=album_id, reporter_id=user_id).delete())
+
+@scenario('DELETE', '/api/notifications/<int:notification_id>')
+def delete_notification(ctx):
+    user_id = ctx.refs['viewer_id']
+    def add_notification():
+        notification = Notification(recipient_id=user_id, actor_id=ctx.refs['admin_id'], notification_type='new_follower')
+        db.session.add(notification)
+        db.session.flush()
+        return notification.id
+    ctx.measure('DELETE', f'/api/notifications/{ctx.query(add_notification)}', user=user_id)
+
+@scenario('DELETE', '/api/me/notifications/read')
+def delete_read_notifications(ctx):
+    ctx.measure('DELETE', '/api/me/notifications/read', user=ctx.refs['viewer_id'])
+
+@scenario('GET', '/api/chats')
+def chats(ctx):
+    ctx.measure('GET', '/api/chats', user=ctx.refs['chat_user_id'])
+
+@scenario('GET', '/api/chats/<int:other_user_id>')
+def chat_history(ctx):
+    ctx.measure('GET', f"/api/chats/{ctx.refs['chat_other_id']}", user=ctx.refs['chat_user_id'])
+
+@scenario('GET', '/api/admin/metrics')
+def admin_metrics(ctx):
+    ctx.measure('GET', '/api/admin/metrics', user=ctx.refs['admin_id'])
+
+@scenario('GET', '/api/admin/users')
+def admin_users(ctx):
+    ctx.measure('GET', '/api/admin/users', user=ctx.refs['admin_id'])
+
+@scenario('POST', '/api/admin/users/<int:user_id>/approve')
+def admin_approve(ctx):
+    ctx.measure('POST', f"/api/admin/users/{ctx.refs['viewer_id']}/approve", user=ctx.refs['admin_id'])
+
+@scenario('DELETE', '/api/admin/users/<int:user_id>')
+def admin_delete_user(ctx):
+    name = f'bench_delete_{ctx.next_id()}'
+    def add_user():
+        user = User(username=name, email=f'{name}@example.com', password_hash='-', is_approved=True)
+        db.session.add(user)
+        db.session.flush()
+        return user.id
+    ctx.measure('DELETE', f'/api/admin/users/{ctx.query(add_user)}', user=ctx.refs['admin_id'])
+
+
+# --- Medición ---
+def percentile(sorted_values, fraction):
+    # Rango más cercano: el valor que deja por debajo al menos `fraction` de las muestras
+    return sorted_values[max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))]
+
+
+def summarize(samples):
+    durations = sorted(duration * 1000 for duration, _, _ in samples)
+    statuses = {}
+    for _, _, status in samples: statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'count': len(samples),
+        'errors': sum(1 for _, _, status in samples if status >= 400),
+        'mean_ms': round(sum(durations) / len(durations), 3),
+        'p50_ms': round(percentile(durations, 0.5), 3),
+        'p90_ms': round(percentile(durations, 0.9), 3),
+        'p99_ms': round(percentile(durations, 0.99), 3),
+        'min_ms': round(durations[0], 3),
+        'max_ms': round(durations[-1], 3),
+        'queries': round(sum(statements for _, statements, _ in samples) / len(samples), 2),
+        'status': statuses,
+    }
+
+
+def run_routes(refs, iterations, warmup, only=None):
+    ctx = BenchmarkContext(refs)
+    results = {}
+    with app.app_context(): engine = db.engine
+    event.listen(engine, 'after_cursor_execute', ctx.count_statements)
+    try:
+        for method, rule, variant, fn in SCENARIOS:
+            name = scenario_name(method, rule, variant)
+            if only and only not in name: continue
+            for _ in range(warmup): fn(ctx)
+            ctx.samples = []
+            for _ in range(iterations): fn(ctx)
+            results[name] = summarize(ctx.samples)
+            print(f"{name:<60} p50 {results[name]['p50_ms']:>8.2f} ms  p99 {results[name]['p99_ms']:>8.2f} ms  {results[name]['queries']:>5} consultas"
+                  + (f"  {results[name]['errors']} errores" if results[name]['errors'] else ''))
+    finally:
+        event.remove(engine, 'after_cursor_execute', ctx.count_statements)
+    return results
+
+
+def run_throughput(refs, concurrency, duration):
+    """Mezcla de todas las lecturas (GET) repartida en `concurrency` hilos durante `duration` segundos."""
+    reads = [fn for method, _, _, fn in SCENARIOS if method == 'GET']
+    deadline = time.perf_counter() + duration
+    contexts = [BenchmarkContext(refs) for _ in range(concurrency)]
+    def worker(ctx, offset):
+        ctx._thread = threading.get_ident()
+        index = offset
+        while time.perf_counter() < deadline:
+            reads[index % len(reads)](ctx)
+            index += 1
+    threads = [threading.Thread(target=worker, args=(ctx, offset)) for offset, ctx in enumerate(contexts)]
+    start = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - start
+    samples = [sample for ctx in contexts for sample in ctx.samples]
+    return {'concurrency': concurrency, 'duration_s': round(elapsed, 3), 'requests': len(samples),
+            'requests_per_second': round(len(samples) / elapsed, 2), **summarize(samples)}
+
+
+def run_socketio(refs, iterations, warmup):
+    """Conexión autenticada y envío de un mensaje privado hasta que llega al destinatario."""
+    ctx = BenchmarkContext(refs)
+    sender_id, recipient_id = refs['chat_user_id'], refs['chat_other_id']
+    token = lambda user_id: ctx.headers(user_id)['Authorization'].split()[1]
+    connect_samples, message_samples = [], []
+    # Los manejadores de conexión escriben trazas por stdout en cada conexión
+    with redirect_stdout(io.StringIO()):
+        for index in range(warmup + iterations):
+            start = time.perf_counter()
+            client = socketio.test_client(app, auth={'token': token(sender_id)})
+            elapsed = time.perf_counter() - start
+            if index >= warmup: connect_samples.append((elapsed, 0, 200 if client.is_connected() else 500))
+            client.disconnect()
+        sender = socketio.test_client(app, auth={'token': token(sender_id)})
+        recipient = socketio.test_client(app, auth={'token': token(recipient_id)})
+        for index in range(warmup + iterations):
+            recipient.get_received()
+            start = time.perf_counter()
+            sender.emit('private_message', {'recipient_id': recipient_id, 'content': f'Mensaje de benchmark {index}'})
+            delivered = any(packet['name'] == 'new_message' for packet in recipient.get_received())
+            elapsed = time.perf_counter() - start
+            sender.get_received()
+            if index >= warmup: message_samples.append((elapsed, 0, 200 if delivered else 500))
+        sender.disconnect()
+        recipient.disconnect()
+    results = {'connect': summarize(connect_samples), 'private_message': summarize(message_samples)}
+    for stats in results.values(): del stats['queries']
+    results['private_message']['messages_per_second'] = round(1000 / results['private_message']['mean_ms'], 2)
+    return results
+
+
+def uncovered_routes():
+    covered = {(method, rule) for method, rule, _, _ in SCENARIOS}
+    return sorted(f'{method} {rule.rule}' for rule in app.url_map.iter_rules() if rule.rule.startswith('/api/')
+                  for method in rule.methods - {'HEAD', 'OPTIONS'} if (method, rule.rule) not in covered)
+
+
+def git_commit():
+    try: return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return None
+
+
+def run(users, seed, iterations, warmup, concurrency, duration, only=None):
+    from benchmarks.data import generate
+    with app.app_context():
+        dataset = generate(users, seed)
+        refs = reference_ids()
+        dialect = db.engine.dialect.name
+    print(f"Datos generados ({dialect}): {', '.join(f'{table}={count}' for table, count in dataset.items())}")
+    routes = run_routes(refs, iterations, warmup, only)
+    throughput = run_throughput(refs, concurrency, duration) if concurrency and duration and not only else None
+    if throughput: print(f"Rendimiento con {concurrency} hilos: {throughput['requests_per_second']} peticiones/s, p99 {throughput['p99_ms']} ms")
+    sockets = run_socketio(refs, iterations, warmup) if not only else None
+    if sockets: print(f"Socket.IO: mensaje privado p50 {sockets['private_message']['p50_ms']} ms, {sockets['private_message']['messages_per_second']} mensajes/s")
+    with app.app_context(): dataset_after = dataset_counts()
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(), 'git_commit': git_commit(), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'database': dialect,
+            'users': users, 'seed': seed, 'iterations': iterations, 'warmup': warmup, 'dataset': dataset,
+            'dataset_after': dataset_after, 'references': refs,
+        },
+        'routes': routes,
+        'throughput': throughput,
+        'socketio': sockets,
+        'uncovered_routes': uncovered_routes(),
+    }
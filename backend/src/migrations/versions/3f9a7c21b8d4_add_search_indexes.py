@@ -0,0 +1,39 @@
+"""Add full-text and trigram search indexes
+
+Revision ID: 3f9a7c21b8d4
+Revises: 700b683f689f
+Create Date: 2026-10-18 10:12:41.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a7c21b8d4'
+down_revision = '700b683f689f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Índices específicos de PostgreSQL; en otros motores /api/search usa el índice en memoria
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_user_username_trgm', 'user', ['username'], unique=False, postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'})
+    op.create_index('ix_album_title_trgm', 'album', ['title'], unique=False, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+    op.create_index('ix_tag_name_trgm', 'tag', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.execute(
+        "CREATE INDEX ix_album_search_document ON album "
+        "USING gin (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '')))"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_album_search_document', table_name='album')
+    op.drop_index('ix_tag_name_trgm', table_name='tag')
+    op.drop_index('ix_album_title_trgm', table_name='album')
+    op.drop_index('ix_user_username_trgm', table_name='user')
@@ -0,0 +1,35 @@
+"""Add denormalized follower/following counters to user
+
+Revision ID: 8b2e4d6f0a13
+Revises: 3f9a7c21b8d4
+Create Date: 2026-10-18 11:03:27.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f0a13'
+down_revision = '3f9a7c21b8d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Rellenamos los contadores con los datos existentes
+    op.execute(
+        'UPDATE "user" SET '
+        'followers_count = (SELECT count(*) FROM follow WHERE follow.followed_id = "user".id), '
+        'following_count = (SELECT count(*) FROM follow WHERE follow.follower_id = "user".id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('following_count')
+        batch_op.drop_column('followers_count')
@@ -0,0 +1,31 @@
+"""Add album_counter_shard table for sharded like/save counters
+
+Revision ID: a1c5e9b3d784
+Revises: e4f8a2c6d035
+Create Date: 2026-10-18 17:20:14.508317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c5e9b3d784'
+down_revision = 'e4f8a2c6d035'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('album_counter_shard',
+    sa.Column('album_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.SmallInteger(), nullable=False),
+    sa.Column('likes_count', sa.Integer(), nullable=False),
+    sa.Column('saves_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['album_id'], ['album.id'], ),
+    sa.PrimaryKeyConstraint('album_id', 'shard')
+    )
+
+
+def downgrade():
+    op.drop_table('album_counter_shard')
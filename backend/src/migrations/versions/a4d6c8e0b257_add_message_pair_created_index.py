@@ -0,0 +1,26 @@
+"""Add composite index on message pair and created_at for chat history pagination
+
+Revision ID: a4d6c8e0b257
+Revises: f2c8a4e6b913
+Create Date: 2026-10-18 15:02:41.318270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d6c8e0b257'
+down_revision = 'f2c8a4e6b913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.create_index('ix_message_pair_created', ['sender_id', 'recipient_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('message', schema=None) as batch_op:
+        batch_op.drop_index('ix_message_pair_created')
@@ -0,0 +1,32 @@
+"""Add notification_actor table so coalesced notifications count distinct actors
+
+Revision ID: b3f7d1e9a526
+Revises: c6e2a8f4b017
+Create Date: 2026-10-18 19:05:37.418266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f7d1e9a526'
+down_revision = 'c6e2a8f4b017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_actor',
+    sa.Column('notification_id', sa.Integer(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['actor_id'], ['user.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['notification_id'], ['notification.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('notification_id', 'actor_id')
+    )
+    # De las notificaciones ya agrupadas solo se conoce el último actor
+    op.execute('INSERT INTO notification_actor (notification_id, actor_id) SELECT id, actor_id FROM notification')
+
+
+def downgrade():
+    op.drop_table('notification_actor')
@@ -0,0 +1,28 @@
+"""Add comment indexes for paginated comment threads
+
+Revision ID: b7e1f3a5c942
+Revises: a4d6c8e0b257
+Create Date: 2026-10-18 15:41:07.552918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1f3a5c942'
+down_revision = 'a4d6c8e0b257'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.create_index('ix_comment_album_parent_created', ['album_id', 'parent_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_comment_parent_created', ['parent_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('comment', schema=None) as batch_op:
+        batch_op.drop_index('ix_comment_parent_created')
+        batch_op.drop_index('ix_comment_album_parent_created')
@@ -0,0 +1,34 @@
+"""Add responsive image variants to media and user
+
+Revision ID: c5d1e9a2f774
+Revises: 8b2e4d6f0a13
+Create Date: 2026-10-18 12:20:05.117843
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d1e9a2f774'
+down_revision = '8b2e4d6f0a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('media', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('variants', sa.JSON(), nullable=True))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_picture_variants', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('banner_image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('banner_image_variants')
+        batch_op.drop_column('profile_picture_variants')
+
+    with op.batch_alter_table('media', schema=None) as batch_op:
+        batch_op.drop_column('variants')
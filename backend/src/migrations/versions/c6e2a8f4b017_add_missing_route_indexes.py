@@ -0,0 +1,40 @@
+"""Add indexes for album listings, media order, followers, like/save reverse lookups and notifications
+
+Revision ID: c6e2a8f4b017
+Revises: a1c5e9b3d784
+Create Date: 2026-10-18 17:52:41.236905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e2a8f4b017'
+down_revision = 'a1c5e9b3d784'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_album_user_id', 'album', ['user_id', 'id']),
+    ('ix_album_created_at_id', 'album', ['created_at', 'id']),
+    ('ix_album_views_count_id', 'album', ['views_count', 'id']),
+    ('ix_media_album_position', 'media', ['album_id', 'position', 'created_at']),
+    ('ix_follow_followed_follower', 'follow', ['followed_id', 'follower_id']),
+    ('ix_album_like_album_user', 'album_like', ['album_id', 'user_id']),
+    ('ix_saved_album_album_user', 'saved_album', ['album_id', 'user_id']),
+    ('ix_notification_recipient_created', 'notification', ['recipient_id', 'created_at']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY no bloquea escrituras en PostgreSQL, pero no puede ir dentro de una transacción
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
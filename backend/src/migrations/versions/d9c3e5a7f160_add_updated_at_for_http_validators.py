@@ -0,0 +1,36 @@
+"""Add updated_at to album and user for ETag/Last-Modified validators
+
+Revision ID: d9c3e5a7f160
+Revises: b7e1f3a5c942
+Create Date: 2026-10-18 16:12:54.207113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9c3e5a7f160'
+down_revision = 'b7e1f3a5c942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('album', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    # Valores iniciales: la creación del álbum y, para usuarios (sin fecha de alta), el momento de la migración
+    op.execute('UPDATE album SET updated_at = coalesce(created_at, CURRENT_TIMESTAMP)')
+    op.execute('UPDATE "user" SET updated_at = CURRENT_TIMESTAMP')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('album', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,36 @@
+"""Add per-tag album counts and album_tags(tag_id, album_id) index for tag browsing
+
+Revision ID: e4f8a2c6d035
+Revises: d9c3e5a7f160
+Create Date: 2026-10-18 16:48:30.671402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f8a2c6d035'
+down_revision = 'd9c3e5a7f160'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('albums_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index(batch_op.f('ix_tag_albums_count'), ['albums_count'], unique=False)
+
+    with op.batch_alter_table('album_tags', schema=None) as batch_op:
+        batch_op.create_index('ix_album_tags_tag_album', ['tag_id', 'album_id'], unique=False)
+
+    op.execute('UPDATE tag SET albums_count = (SELECT count(*) FROM album_tags WHERE album_tags.tag_id = tag.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('album_tags', schema=None) as batch_op:
+        batch_op.drop_index('ix_album_tags_tag_album')
+
+    with op.batch_alter_table('tag', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tag_albums_count'))
+        batch_op.drop_column('albums_count')
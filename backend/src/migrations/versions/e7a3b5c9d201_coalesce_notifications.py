@@ -0,0 +1,28 @@
+"""Coalesce notifications: actor_count and lookup index
+
+Revision ID: e7a3b5c9d201
+Revises: c5d1e9a2f774
+Create Date: 2026-10-18 13:41:52.660127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3b5c9d201'
+down_revision = 'c5d1e9a2f774'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('actor_count', sa.Integer(), server_default='1', nullable=False))
+        batch_op.create_index('ix_notification_coalesce', ['recipient_id', 'notification_type', 'related_entity_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_coalesce')
+        batch_op.drop_column('actor_count')
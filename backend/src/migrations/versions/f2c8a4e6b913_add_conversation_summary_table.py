@@ -0,0 +1,61 @@
+"""Add conversation summary table for the chat inbox
+
+Revision ID: f2c8a4e6b913
+Revises: e7a3b5c9d201
+Create Date: 2026-10-18 14:37:19.804551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a4e6b913'
+down_revision = 'e7a3b5c9d201'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversation',
+    sa.Column('user_low_id', sa.Integer(), nullable=False),
+    sa.Column('user_high_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_preview', sa.String(length=255), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=True),
+    sa.Column('last_sender_id', sa.Integer(), nullable=True),
+    sa.Column('unread_low', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('unread_high', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['last_message_id'], ['message.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_high_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_low_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_low_id', 'user_high_id')
+    )
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.create_index('ix_conversation_high_last_message', ['user_high_id', 'last_message_at'], unique=False)
+        batch_op.create_index('ix_conversation_low_last_message', ['user_low_id', 'last_message_at'], unique=False)
+
+    # Rellenamos los resúmenes a partir de los mensajes existentes
+    op.execute("""
+        INSERT INTO conversation (user_low_id, user_high_id, last_message_id, last_message_preview,
+                                  last_message_at, last_sender_id, unread_low, unread_high)
+        SELECT r.user_low_id, r.user_high_id, r.id, substr(r.content, 1, 255), r.created_at, r.sender_id,
+               (SELECT count(*) FROM message m WHERE m.sender_id = r.user_high_id AND m.recipient_id = r.user_low_id AND coalesce(m.is_read, false) = false),
+               (SELECT count(*) FROM message m WHERE m.sender_id = r.user_low_id AND m.recipient_id = r.user_high_id AND coalesce(m.is_read, false) = false)
+        FROM (
+            SELECT id, sender_id, content, created_at,
+                   least(sender_id, recipient_id) AS user_low_id, greatest(sender_id, recipient_id) AS user_high_id,
+                   row_number() OVER (PARTITION BY least(sender_id, recipient_id), greatest(sender_id, recipient_id)
+                                      ORDER BY created_at DESC, id DESC) AS rank
+            FROM message
+        ) r
+        WHERE r.rank = 1
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversation', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversation_low_last_message')
+        batch_op.drop_index('ix_conversation_high_last_message')
+
+    op.drop_table('conversation')
@@ -0,0 +1,95 @@
+"""Fixtures comunes. app.py lee su configuración del entorno al importarse, así que se fija aquí antes.
+
+Por defecto se usa un SQLite temporal; con TEST_DATABASE_URL=postgresql://... las pruebas usan esa BD,
+que se VACÍA antes de cada prueba. Las marcadas `postgresql` (concurrencia real) solo corren en ese caso.
+Las cachés de respuestas están desactivadas: cada petición ejecuta la vista.
+"""
+import os
+import tempfile
+import threading
+
+WORKDIR = tempfile.mkdtemp(prefix='tests_')
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL') or f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ.setdefault('JWT_SECRET_KEY', 'clave-de-pruebas-de-al-menos-32-bytes')
+os.environ.update({
+    'STORAGE_BACKEND': 'local', 'LOCAL_STORAGE_DIR': os.path.join(WORKDIR, 'media'), 'MEDIA_URL_BACKEND': 'local',
+    # Vacías y no ausentes: load_dotenv no pisa las variables ya definidas con el .env de desarrollo
+    'SUPABASE_URL': '', 'SUPABASE_KEY': '', 'SOCKETIO_MESSAGE_QUEUE': '',
+    'RESPONSE_CACHE_BACKEND': 'none', 'TIMELINE_BACKEND': 'memory',
+})
+
+import pytest
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app import app, db, view_counter, User, Album, Media, Tag, Comment
+
+
+def pytest_collection_modifyitems(items):
+    with app.app_context(): dialect = db.engine.dialect.name
+    if dialect == 'postgresql': return
+    skip = pytest.mark.skip(reason='necesita PostgreSQL (TEST_DATABASE_URL)')
+    for item in items:
+        if 'postgresql' in item.keywords: item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def database():
+    # Vistas en el buffer de una prueba anterior: se vuelcan antes de vaciar la BD para que no pasen a la siguiente
+    view_counter.flush()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield db
+    with app.app_context(): db.session.remove()
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user():
+    def make(username, **fields):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', password_hash='-', is_approved=True, **fields)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def make_album():
+    def make(owner_id, media=1, tags=0, comments=0):
+        """Álbum con `media` archivos (uno de cada tres es vídeo), `tags` etiquetas y `comments` comentarios."""
+        with app.app_context():
+            album = Album(title='Álbum de prueba', user_id=owner_id)
+            album.tags = [Tag(name=f'etiqueta{index}') for index in range(tags)]
+            db.session.add(album)
+            db.session.flush()
+            db.session.add_all(Media(album_id=album.id, file_path=f'albums/{album.id}/{index}.jpg', position=index,
+                                     file_type='video/mp4' if index % 3 == 2 else 'image/jpeg') for index in range(media))
+            db.session.add_all(Comment(text=f'Comentario {index}', user_id=owner_id, album_id=album.id) for index in range(comments))
+            db.session.commit()
+            return album.id
+    return make
+
+
+@pytest.fixture
+def auth_headers():
+    def headers(user_id):
+        with app.app_context(): return {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+    return headers
+
+
+@pytest.fixture
+def statements():
+    """Sentencias SQL que ejecuta el hilo de la prueba (no las de hilos en segundo plano); .clear() para reiniciar."""
+    executed, thread = [], threading.get_ident()
+    def record(conn, cursor, statement, *args):
+        if threading.get_ident() == thread: executed.append(statement)
+    with app.app_context(): engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
@@ -0,0 +1,37 @@
+"""GET /api/albums/<id> se sirve con un número fijo de consultas, tenga el álbum los archivos, etiquetas y comentarios que tenga."""
+import pytest
+from app import app, db, Follow, AlbumLike
+
+# Sin sesión: validador de conditional_get, álbum con dueño y etiquetas, archivos y un SELECT de agregados
+ANONYMOUS_QUERIES = 4
+# Con sesión no hay validador HTTP; las relaciones del visitante van en el mismo SELECT de agregados
+SIGNED_IN_QUERIES = 3
+
+
+@pytest.mark.parametrize('size', [dict(media=1), dict(media=30, tags=5, comments=40)], ids=['pequeño', 'grande'])
+def test_album_detail_query_count(client, make_user, make_album, auth_headers, statements, size):
+    owner_id, viewer_id = make_user('duena'), make_user('visitante')
+    album_id = make_album(owner_id, **size)
+    with app.app_context():
+        db.session.add_all([Follow(follower_id=viewer_id, followed_id=owner_id), AlbumLike(user_id=viewer_id, album_id=album_id)])
+        db.session.commit()
+
+    statements.clear()
+    response = client.get(f'/api/albums/{album_id}')
+    assert response.status_code == 200
+    assert len(statements) == ANONYMOUS_QUERIES, statements
+    data = response.get_json()
+    assert (len(data['media']), len(data['tags']), data['comments_count']) == (size['media'], size.get('tags', 0), size.get('comments', 0))
+    assert data['photos_count'] + data['videos_count'] == size['media']
+    assert not data['user_is_logged_in']
+
+    statements.clear()
+    response = client.get(f'/api/albums/{album_id}', headers=auth_headers(viewer_id))
+    assert response.status_code == 200
+    assert len(statements) == SIGNED_IN_QUERIES, statements
+    data = response.get_json()
+    assert (data['is_followed'], data['is_liked'], data['is_saved']) == (True, True, False)
+
+
+def test_missing_album_is_404(client):
+    assert client.get('/api/albums/999').status_code == 404
@@ -0,0 +1,81 @@
+"""Modo cursor de GET /api/albums (keyset sobre (columna de orden, id)): cada orden recorre todos los álbumes
+sin repetir ni saltar ninguno, también con empates y con álbumes publicados a mitad del recorrido."""
+import base64
+from datetime import datetime, timedelta
+import pytest
+from app import app, db, encode_cursor, Album
+
+# (created_at en horas desde el origen, views_count): empates en ambas columnas
+ALBUMS = [(0, 5), (1, 0), (1, 5), (2, 9), (3, 5), (3, 0), (4, 9), (5, 1)]
+ORIGIN = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def albums(make_user, make_album):
+    owner_id = make_user('duena')
+    album_ids = [make_album(owner_id) for _ in ALBUMS]
+    with app.app_context():
+        for album_id, (hours, views) in zip(album_ids, ALBUMS):
+            album = db.session.get(Album, album_id)
+            album.created_at, album.views_count = ORIGIN + timedelta(hours=hours), views
+        db.session.commit()
+    return {album_id: (ORIGIN + timedelta(hours=hours), views) for album_id, (hours, views) in zip(album_ids, ALBUMS)}
+
+
+def expected_order(albums, sort_by, sort_order):
+    column = 0 if sort_by == 'created_at' else 1
+    return sorted(albums, key=lambda album_id: (albums[album_id][column], album_id), reverse=sort_order == 'desc')
+
+
+def walk(client, cursor='', **params):
+    """Sigue next_cursor desde `cursor` (la primera página si está vacío); devuelve las páginas de ids."""
+    pages = []
+    while cursor is not None:
+        response = client.get('/api/albums', query_string={**params, 'cursor': cursor})
+        assert response.status_code == 200
+        data = response.get_json()
+        pages.append([album['id'] for album in data['albums']])
+        cursor = data['next_cursor']
+    return pages
+
+
+@pytest.mark.parametrize('sort_by', ['created_at', 'views_count'])
+@pytest.mark.parametrize('sort_order', ['desc', 'asc'])
+@pytest.mark.parametrize('per_page', [1, 3, 8])
+def test_pages_cover_every_album_once(client, albums, sort_by, sort_order, per_page):
+    pages = walk(client, sort_by=sort_by, sort_order=sort_order, per_page=per_page)
+    assert [album_id for page in pages for album_id in page] == expected_order(albums, sort_by, sort_order)
+    assert all(len(page) == per_page for page in pages[:-1]) and 0 < len(pages[-1]) <= per_page
+
+
+def test_album_published_mid_walk_does_not_shift_pages(client, albums, make_user, make_album):
+    first = client.get('/api/albums', query_string={'cursor': '', 'per_page': 3}).get_json()
+    new_id = make_album(make_user('otra'))
+    # Con OFFSET el álbum nuevo empujaría uno de la primera página a la segunda; con el cursor no se repite ninguno
+    rest = walk(client, first['next_cursor'], per_page=3)
+    seen = [album['id'] for album in first['albums']] + [album_id for page in rest for album_id in page]
+    assert seen == expected_order(albums, 'created_at', 'desc')
+    assert walk(client, per_page=3)[0][0] == new_id
+
+
+def test_unknown_sort_falls_back_to_created_at(client, albums):
+    pages = walk(client, sort_by='title', per_page=3)
+    assert [album_id for page in pages for album_id in page] == expected_order(albums, 'created_at', 'desc')
+
+
+@pytest.mark.parametrize('cursor, params', [
+    ('no-es-un-cursor', {}),
+    (base64.urlsafe_b64encode(b'{"a":1}').decode(), {}),
+    (encode_cursor('created_at', 'desc', '2024-01-01T00:00:00'), {}),
+    (encode_cursor('created_at', 'desc', 'ayer', 3), {}),
+    (encode_cursor('created_at', 'desc', '2024-01-01T00:00:00', 'x'), {}),
+    (encode_cursor('views_count', 'desc', 'muchas', 3), {'sort_by': 'views_count'}),
+    # Cursor de otro orden: sus valores no sirven para este
+    (encode_cursor('views_count', 'desc', 5, 3), {}),
+    (encode_cursor('created_at', 'asc', '2024-01-01T00:00:00', 3), {}),
+], ids=['base64 inválido', 'no es una lista', 'incompleto', 'fecha inválida', 'id no numérico', 'vistas no numéricas',
+        'otra columna', 'otro sentido'])
+def test_malformed_cursor_is_rejected(client, albums, cursor, params):
+    response = client.get('/api/albums', query_string={'cursor': cursor, **params})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Cursor inválido'}
@@ -0,0 +1,68 @@
+"""Likes y guardados con SQL atómico: los contadores cuadran con las filas de album_like/saved_album,
+con y sin contadores fragmentados, también con muchas peticiones simultáneas sobre el mismo álbum."""
+import random
+import threading
+import pytest
+from app import app, db, counter_shards, Album, AlbumLike, SavedAlbum
+
+
+@pytest.fixture(params=[0, 8], ids=['sin fragmentos', 'fragmentado'])
+def shards(request, monkeypatch):
+    monkeypatch.setattr(counter_shards, 'shards', request.param)
+    monkeypatch.setattr(counter_shards, 'hot_threshold', 0)
+    # Sin el hilo de fusión periódica: la prueba llama a merge() cuando le toca
+    monkeypatch.setattr(counter_shards, '_started', True)
+    return request.param
+
+
+def counts(album_id):
+    """((likes, guardados) del álbum más los fragmentos pendientes, (likes, guardados) según las filas)."""
+    with app.app_context():
+        album = db.session.get(Album, album_id)
+        pending = [db.session.scalar(db.select(counter_shards.pending(album_id, counter))) for counter in ('likes_count', 'saves_count')] \
+            if counter_shards.enabled else [0, 0]
+        rows = (AlbumLike.query.filter_by(album_id=album_id).count(), SavedAlbum.query.filter_by(album_id=album_id).count())
+        return (album.likes_count + pending[0], album.saves_count + pending[1]), rows
+
+
+def test_toggles_return_current_counts(client, make_user, make_album, auth_headers, shards):
+    album_id = make_album(make_user('duena'))
+    fans = [auth_headers(make_user(f'fan{index}')) for index in range(3)]
+    for expected, headers in enumerate(fans, 1):
+        assert client.post(f'/api/albums/{album_id}/like', headers=headers).get_json()['likes_count'] == expected
+    data = client.post(f'/api/albums/{album_id}/like', headers=fans[0]).get_json()
+    assert (data['is_liked'], data['likes_count']) == (False, 2)
+    data = client.post(f'/api/albums/{album_id}/save', headers=fans[1]).get_json()
+    assert (data['is_saved'], data['saves_count']) == (True, 1)
+    assert counts(album_id) == ((2, 1), (2, 1))
+    detail = client.get(f'/api/albums/{album_id}').get_json()
+    assert (detail['likes_count'], detail['saves_count']) == (2, 1)
+    assert client.post('/api/albums/999/like', headers=fans[0]).status_code == 404
+
+
+@pytest.mark.postgresql
+def test_concurrent_toggles_keep_exact_counts(make_user, make_album, auth_headers, shards):
+    album_id = make_album(make_user('duena'))
+    fans = [auth_headers(make_user(f'fan{index}')) for index in range(40)]
+    rnd = random.Random(1)
+    start, errors = threading.Barrier(len(fans)), []
+
+    def toggle(headers, times):
+        client = app.test_client()
+        start.wait()
+        for _ in range(times):
+            for mark in ('like', 'save'):
+                response = client.post(f'/api/albums/{album_id}/{mark}', headers=headers)
+                if response.status_code != 200: errors.append(response.status_code)
+
+    # Cada fan alterna entre 3 y 5 veces: unos acaban con like/guardado y otros sin él
+    threads = [threading.Thread(target=toggle, args=(headers, rnd.randint(3, 5))) for headers in fans]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    counters, rows = counts(album_id)
+    assert counters == rows
+    if shards:
+        counter_shards.merge()
+        with app.app_context(): album = db.session.get(Album, album_id)
+        assert (album.likes_count, album.saves_count) == rows
@@ -0,0 +1,80 @@
+"""Chats: /api/chats lee el resumen de Conversation (último mensaje y no leídos de cada lado) y
+/api/chats/<id> pagina el historial hacia atrás con `before`, marcando como leídos solo los mensajes entregados."""
+import pytest
+from flask_jwt_extended import create_access_token
+from app import app, socketio, encode_cursor
+
+
+@pytest.fixture
+def send():
+    clients = {}
+    def message(sender_id, recipient_id, content):
+        if sender_id not in clients:
+            with app.app_context(): token = create_access_token(identity=str(sender_id))
+            clients[sender_id] = socketio.test_client(app, auth={'token': token})
+        clients[sender_id].emit('private_message', {'recipient_id': recipient_id, 'content': content})
+    yield message
+    for client in clients.values(): client.disconnect()
+
+
+@pytest.fixture
+def chats(client, auth_headers):
+    def summary(user_id):
+        """{nombre del otro usuario: (último mensaje, leído, no leídos)} en el orden de la lista."""
+        response = client.get('/api/chats', headers=auth_headers(user_id))
+        assert response.status_code == 200
+        return {chat['other_user']['username']: (chat['last_message']['content'], chat['last_message']['is_read'], chat['unread_count'])
+                for chat in response.get_json()}
+    return summary
+
+
+@pytest.fixture
+def history(client, auth_headers):
+    def page(user_id, other_user_id, **params):
+        response = client.get(f'/api/chats/{other_user_id}', query_string=params, headers=auth_headers(user_id))
+        assert response.status_code == 200
+        data = response.get_json()
+        return [message['content'] for message in data['messages']], data['next_cursor']
+    return page
+
+
+def test_chat_list_summarizes_each_conversation(make_user, send, chats):
+    ana, bea, carla = make_user('ana'), make_user('bea'), make_user('carla')
+    send(ana, bea, 'Hola')
+    send(ana, bea, '¿Qué tal?')
+    send(bea, ana, 'Bien')
+    send(carla, ana, 'Buenas')
+    # La conversación más reciente primero; cada lado ve sus propios no leídos
+    assert list(chats(ana).items()) == [('carla', ('Buenas', False, 1)), ('bea', ('Bien', False, 1))]
+    assert chats(bea) == {'ana': ('Bien', True, 2)}
+    assert chats(carla) == {'ana': ('Buenas', True, 0)}
+
+
+def test_history_pages_backwards_and_marks_delivered_messages_read(make_user, send, chats, history):
+    ana, bea = make_user('ana'), make_user('bea')
+    for index in range(5): send(ana, bea, f'Mensaje {index}')
+    assert chats(bea)['ana'][2] == 5
+
+    page, cursor = history(bea, ana, limit=2)
+    assert page == ['Mensaje 3', 'Mensaje 4']
+    assert chats(bea)['ana'][2] == 3
+    page, cursor = history(bea, ana, limit=2, before=cursor)
+    assert page == ['Mensaje 1', 'Mensaje 2']
+    assert chats(bea)['ana'][2] == 1
+    # Un mensaje nuevo suma uno; la página siguiente del cursor no lo incluye
+    send(ana, bea, 'Mensaje 5')
+    assert chats(bea)['ana'] == ('Mensaje 5', False, 2)
+    assert history(bea, ana, limit=2, before=cursor) == (['Mensaje 0'], None)
+    assert chats(bea)['ana'][2] == 1
+    # Leer lo propio no cambia nada; la primera página vuelve a traer lo más reciente
+    assert history(ana, bea, limit=1)[0] == ['Mensaje 5']
+    assert chats(bea)['ana'][2] == 1
+    assert history(bea, ana)[0] == [f'Mensaje {index}' for index in range(6)]
+    assert chats(bea)['ana'] == ('Mensaje 5', True, 0)
+
+
+@pytest.mark.parametrize('before', ['no-es-un-cursor', encode_cursor('ayer', 1), encode_cursor('2024-01-01T00:00:00')])
+def test_bad_before_cursor_is_rejected(client, make_user, auth_headers, send, before):
+    ana, bea = make_user('ana'), make_user('bea')
+    send(ana, bea, 'Hola')
+    assert client.get(f'/api/chats/{ana}', query_string={'before': before}, headers=auth_headers(bea)).status_code == 400
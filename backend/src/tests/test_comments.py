@@ -0,0 +1,79 @@
+"""Comentarios paginados: /api/albums/<id>/comments (primer nivel con las primeras respuestas) y
+/api/comments/<id>/replies (el resto del hilo por cursor), un solo nivel de respuestas y comments_count
+del detalle al borrar un comentario con sus respuestas."""
+import base64
+import pytest
+from app import app, db, encode_cursor, Comment, COMMENT_REPLIES_PREVIEW
+
+
+@pytest.fixture
+def thread(client, make_user, make_album, auth_headers):
+    """Álbum con un comentario de primer nivel y 7 respuestas: (album_id, comment_id, ids de respuestas, cabeceras)."""
+    owner_id = make_user('duena')
+    headers = auth_headers(make_user('fan'))
+    album_id = make_album(owner_id)
+    assert client.post(f'/api/albums/{album_id}/comments', json={'text': 'Primero'}, headers=headers).status_code == 201
+    with app.app_context(): comment_id = db.session.scalar(db.select(Comment.id).where(Comment.album_id == album_id))
+    for index in range(7):
+        assert client.post(f'/api/comments/{comment_id}/reply', json={'text': f'Respuesta {index}'}, headers=headers).status_code == 201
+    with app.app_context():
+        reply_ids = list(db.session.scalars(db.select(Comment.id).where(Comment.parent_id == comment_id).order_by(Comment.id)))
+    return album_id, comment_id, reply_ids, headers
+
+
+def test_top_level_comments_are_paged_in_order(client, make_user, make_album):
+    album_id = make_album(make_user('duena'), comments=5)
+    pages, cursor = [], None
+    while True:
+        data = client.get(f'/api/albums/{album_id}/comments', query_string={'limit': 2, 'cursor': cursor or ''}).get_json()
+        pages.append([comment['id'] for comment in data['comments']])
+        cursor = data['next_cursor']
+        if cursor is None: break
+    with app.app_context(): ids = list(db.session.scalars(db.select(Comment.id).where(Comment.album_id == album_id).order_by(Comment.id)))
+    assert pages == [ids[:2], ids[2:4], ids[4:]]
+
+
+def test_replies_preview_then_cursor_pages(client, thread):
+    album_id, comment_id, reply_ids, _ = thread
+    (comment,) = client.get(f'/api/albums/{album_id}/comments').get_json()['comments']
+    assert comment['reply_count'] == 7
+    assert [reply['id'] for reply in comment['replies']] == reply_ids[:COMMENT_REPLIES_PREVIEW]
+    assert all(reply['replying_to'] == 'fan' for reply in comment['replies'])
+
+    # El resto del hilo a partir del cursor de la vista previa, sin repetir ni saltar respuestas
+    loaded, cursor = [reply['id'] for reply in comment['replies']], comment['replies_cursor']
+    while cursor:
+        data = client.get(f'/api/comments/{comment_id}/replies', query_string={'limit': 3, 'cursor': cursor}).get_json()
+        loaded += [reply['id'] for reply in data['replies']]
+        cursor = data['next_cursor']
+    assert loaded == reply_ids
+
+    data = client.get(f'/api/comments/{comment_id}/replies', query_string={'limit': 7}).get_json()
+    assert ([reply['id'] for reply in data['replies']], data['next_cursor']) == (reply_ids, None)
+
+
+def test_reply_to_a_reply_is_rejected(client, thread):
+    _, _, reply_ids, headers = thread
+    response = client.post(f'/api/comments/{reply_ids[0]}/reply', json={'text': 'Más hondo'}, headers=headers)
+    assert response.status_code == 400
+    with app.app_context(): assert db.session.query(Comment).filter(Comment.parent_id == reply_ids[0]).count() == 0
+
+
+@pytest.mark.parametrize('cursor', [
+    'no-es-un-cursor', base64.urlsafe_b64encode(b'{"a":1}').decode(), encode_cursor('ayer', 1), encode_cursor(1), encode_cursor('2024-01-01T00:00:00', 'x'),
+], ids=['base64 inválido', 'no es una lista', 'fecha inválida', 'incompleto', 'id no numérico'])
+def test_bad_cursor_is_rejected(client, thread, cursor):
+    album_id, comment_id, _, _ = thread
+    assert client.get(f'/api/albums/{album_id}/comments', query_string={'cursor': cursor}).status_code == 400
+    assert client.get(f'/api/comments/{comment_id}/replies', query_string={'cursor': cursor}).status_code == 400
+
+
+def test_deleting_a_comment_deletes_its_replies(client, thread):
+    album_id, comment_id, reply_ids, headers = thread
+    client.post(f'/api/albums/{album_id}/comments', json={'text': 'Segundo'}, headers=headers)
+    assert client.get(f'/api/albums/{album_id}').get_json()['comments_count'] == 9
+    assert client.delete(f'/api/comments/{comment_id}', headers=headers).status_code == 200
+    assert client.get(f'/api/albums/{album_id}').get_json()['comments_count'] == 1
+    with app.app_context(): assert db.session.query(Comment).filter(Comment.id.in_(reply_ids)).count() == 0
+    assert client.get(f'/api/comments/{comment_id}/replies').status_code == 404
+    assert [comment['text'] for comment in client.get(f'/api/albums/{album_id}/comments').get_json()['comments']] == ['Segundo']
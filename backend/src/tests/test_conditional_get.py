@@ -0,0 +1,101 @@
+"""GET condicionales (ETag / Last-Modified) de las rutas públicas: 304 sin ejecutar la vista mientras no cambia
+nada de lo que muestra el cuerpo, y un ETag nuevo en cuanto cambia."""
+import pytest
+from app import view_counter, counter_shards
+
+
+def revalidates(client, url, etag):
+    """True si el servidor responde 304 a un GET con ese ETag."""
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code in (200, 304)
+    return response.status_code == 304
+
+
+@pytest.fixture
+def album(make_user, make_album, auth_headers):
+    owner_id = make_user('duena')
+    album_id = make_album(owner_id, media=3)
+    return album_id, auth_headers(owner_id)
+
+
+def test_not_modified_album_detail_counts_as_a_view(client, album, statements):
+    album_id, _ = album
+    url = f'/api/albums/{album_id}'
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'].startswith('public')
+
+    statements.clear()
+    response = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert (response.status_code, response.data) == (304, b'')
+    assert response.headers['ETag'] == first.headers['ETag']
+    # Solo el validador: la vista no se ejecuta
+    assert len(statements) == 1, statements
+
+    # El 304 contó como vista: el cuerpo ya no es el mismo y el ETag anterior deja de valer
+    assert not revalidates(client, url, first.headers['ETag'])
+    assert client.get(url).get_json()['views_count'] == first.get_json()['views_count'] + 3
+
+
+def test_buffered_views_change_the_etag_and_flushing_them_does_not(client, album):
+    album_id, _ = album
+    url = f'/api/albums/{album_id}'
+    first = client.get(url)
+    second = client.get(url)
+    assert second.get_json()['views_count'] == first.get_json()['views_count'] + 1
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert not revalidates(client, url, first.headers['ETag'])
+    # Volcar el buffer mueve las vistas a la BD sin cambiar cuántas muestra el cuerpo
+    latest = client.get(url)
+    view_counter.flush()
+    assert revalidates(client, url, latest.headers['ETag'])
+
+
+@pytest.mark.parametrize('change', ['like', 'comment', 'reorder'])
+def test_album_changes_produce_a_new_etag(client, album, make_user, auth_headers, monkeypatch, change):
+    # Sin contadores fragmentados y con ellos (los likes pendientes de fusionar también cuentan)
+    album_id, owner_headers = album
+    url = f'/api/albums/{album_id}'
+    fan_headers = auth_headers(make_user('fan'))
+    for shards in (0, 4):
+        monkeypatch.setattr(counter_shards, 'shards', shards)
+        monkeypatch.setattr(counter_shards, 'hot_threshold', 0)
+        monkeypatch.setattr(counter_shards, '_started', True)
+        before = client.get(url)
+        etag = client.get(url).headers['ETag']
+        assert revalidates(client, url, etag)
+        if change == 'like':
+            assert client.post(f'{url}/like', headers=fan_headers).status_code == 200
+        elif change == 'comment':
+            assert client.post(f'{url}/comments', json={'text': 'Hola'}, headers=fan_headers).status_code == 201
+        else:
+            media_ids = [item['id'] for item in before.get_json()['media']]
+            assert client.put(f'{url}/reorder', json={'media_ids': media_ids[::-1]}, headers=owner_headers).status_code == 200
+        assert not revalidates(client, url, etag)
+
+
+def test_if_modified_since(client, album):
+    album_id, _ = album
+    url = f'/api/albums/{album_id}'
+    last_modified = client.get(url).headers['Last-Modified']
+    assert client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get(url, headers={'If-Modified-Since': 'Mon, 01 Jan 2001 00:00:00 GMT'}).status_code == 200
+
+
+def test_signed_in_requests_are_not_validated(client, album):
+    album_id, headers = album
+    url = f'/api/albums/{album_id}'
+    etag = client.get(url).headers['ETag']
+    response = client.get(url, headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert 'ETag' not in response.headers
+
+
+def test_album_list_and_profile_revalidate_until_an_album_is_published(client, album):
+    _, owner_headers = album
+    urls = ['/api/albums?cursor=', '/api/profiles/duena']
+    etags = [client.get(url).headers['ETag'] for url in urls]
+    assert all(revalidates(client, url, etag) for url, etag in zip(urls, etags))
+    assert client.post('/api/albums', json={'title': 'Nuevo'}, headers=owner_headers).status_code == 201
+    assert not any(revalidates(client, url, etag) for url, etag in zip(urls, etags))
@@ -0,0 +1,124 @@
+"""Feed de seguidos (/api/me/feed): timelines cacheados con reparto al publicar, autores con mucha audiencia
+mezclados al leer, paginación por cursor más allá del timeline y timelines descartados cuando dejan de valer."""
+import pytest
+from app import app, MemoryTimelineStore
+
+
+@pytest.fixture(autouse=True)
+def timelines(monkeypatch):
+    # Umbral bajo: con más de 2 seguidores un autor ya no reparte sus álbumes al publicar
+    monkeypatch.setitem(app.config, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 2)
+    monkeypatch.setitem(app.config, 'TIMELINE_MAX_ITEMS', 4)
+    store = MemoryTimelineStore(100)
+    monkeypatch.setattr('app.timelines', store)
+    return store
+
+
+@pytest.fixture
+def feed(client, auth_headers):
+    def ids(user_id, per_page=50, cursor=None):
+        response = client.get('/api/me/feed', query_string={'per_page': per_page, 'cursor': cursor or ''}, headers=auth_headers(user_id))
+        assert response.status_code == 200
+        data = response.get_json()
+        return [album['id'] for album in data['albums']], data['next_cursor']
+    return ids
+
+
+@pytest.fixture
+def follow(client, auth_headers):
+    def toggle(follower_id, followed_id):
+        assert client.post(f'/api/users/{followed_id}/follow', headers=auth_headers(follower_id)).status_code == 200
+    return toggle
+
+
+def publish(client, auth_headers, user_id, title='Álbum'):
+    response = client.post('/api/albums', json={'title': title}, headers=auth_headers(user_id))
+    assert response.status_code == 201
+    return response.get_json()['album_id']
+
+
+def test_new_album_is_pushed_to_cached_timelines(client, make_user, make_album, auth_headers, feed, follow, timelines):
+    reader_id, author_id = make_user('lectora'), make_user('autora')
+    follow(reader_id, author_id)
+    old_id = make_album(author_id)
+    assert feed(reader_id)[0] == [old_id]
+    new_id = publish(client, auth_headers, author_id)
+    assert timelines.get(reader_id)[:2] == [new_id, old_id]
+    assert feed(reader_id)[0] == [new_id, old_id]
+
+
+def test_large_audience_authors_are_merged_on_read(client, make_user, make_album, auth_headers, feed, follow, timelines):
+    reader_id, small_id, large_id = make_user('lectora'), make_user('pequena'), make_user('grande')
+    for fan_id in [reader_id] + [make_user(f'fan{index}') for index in range(2)]: follow(fan_id, large_id)
+    follow(reader_id, small_id)
+    album_ids = [make_album(small_id), make_album(large_id), make_album(small_id)]
+    assert feed(reader_id)[0] == album_ids[::-1]
+    assert album_ids[1] not in timelines.get(reader_id)
+    # Publicar no reparte los álbumes del autor grande, pero el feed los mezcla al leerlo
+    new_id = publish(client, auth_headers, large_id)
+    assert new_id not in timelines.get(reader_id)
+    assert feed(reader_id)[0] == [new_id] + album_ids[::-1]
+
+
+def test_cursor_pages_continue_past_the_cached_timeline(make_user, make_album, feed, follow, timelines):
+    reader_id, author_id = make_user('lectora'), make_user('autora')
+    follow(reader_id, author_id)
+    album_ids = [make_album(author_id) for _ in range(9)]
+    pages, cursor = [], None
+    while True:
+        page, cursor = feed(reader_id, per_page=2, cursor=cursor)
+        pages.append(page)
+        if cursor is None: break
+    # El timeline guarda solo TIMELINE_MAX_ITEMS álbumes; el resto sale de la BD sin repetir ni saltar ninguno
+    assert len(timelines.get(reader_id)) == 4
+    assert [album_id for page in pages for album_id in page] == album_ids[::-1]
+    assert [len(page) for page in pages] == [2, 2, 2, 2, 1]
+
+
+def test_follow_and_unfollow_drop_the_timeline(make_user, make_album, feed, follow, timelines):
+    reader_id, first_id, second_id = make_user('lectora'), make_user('primera'), make_user('segunda')
+    follow(reader_id, first_id)
+    first_album, second_album = make_album(first_id), make_album(second_id)
+    assert feed(reader_id)[0] == [first_album]
+    follow(reader_id, second_id)
+    assert timelines.get(reader_id) is None
+    assert feed(reader_id)[0] == [second_album, first_album]
+    follow(reader_id, first_id)
+    assert timelines.get(reader_id) is None
+    assert feed(reader_id)[0] == [second_album]
+
+
+def test_author_dropping_below_the_threshold_stays_in_the_feed(make_user, make_album, feed, follow, timelines):
+    reader_id, author_id = make_user('lectora'), make_user('autora')
+    fans = [make_user(f'fan{index}') for index in range(2)]
+    for fan_id in [reader_id] + fans: follow(fan_id, author_id)
+    album_id = make_album(author_id)
+    # Con 3 seguidores el timeline cacheado no lo incluye: se mezcla al leer
+    assert feed(reader_id)[0] == [album_id]
+    assert timelines.get(reader_id) is not None
+    follow(fans[0], author_id)
+    assert timelines.get(reader_id) is None
+    assert feed(reader_id)[0] == [album_id]
+    # Y al volver a superarlo sus álbumes dejan los timelines cacheados (se mezclan otra vez al leer)
+    follow(fans[0], author_id)
+    assert timelines.get(reader_id) is None
+    assert feed(reader_id)[0] == [album_id]
+
+
+def test_deleted_album_leaves_no_gap_in_the_page(client, make_user, make_album, auth_headers, feed, follow):
+    reader_id, author_id = make_user('lectora'), make_user('autora')
+    follow(reader_id, author_id)
+    album_ids = [make_album(author_id) for _ in range(3)]
+    assert feed(reader_id, per_page=2)[0] == album_ids[:0:-1]
+    assert client.delete(f'/api/albums/{album_ids[2]}', headers=auth_headers(author_id)).status_code == 200
+    assert feed(reader_id, per_page=2)[0] == album_ids[1::-1]
+
+
+def test_deleted_user_drops_the_timelines_that_held_their_albums(client, make_user, make_album, auth_headers, feed, follow, timelines):
+    reader_id, author_id, admin_id = make_user('lectora'), make_user('autora'), make_user('admin', is_admin=True)
+    follow(reader_id, author_id)
+    album_id = make_album(author_id)
+    assert feed(reader_id)[0] == [album_id]
+    assert client.delete(f'/api/admin/users/{author_id}', headers=auth_headers(admin_id)).status_code == 200
+    assert timelines.get(reader_id) is None
+    assert feed(reader_id)[0] == []
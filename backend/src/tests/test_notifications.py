@@ -0,0 +1,46 @@
+"""Notificaciones agrupadas: una sola fila por tipo y objetivo mientras no se lee, con el texto en singular o
+plural según cuántas personas más (actor_count - 1) hicieron lo mismo."""
+import pytest
+from app import app, Notification
+
+
+@pytest.fixture
+def messages(client, auth_headers):
+    def texts(user_id):
+        response = client.get('/api/notifications', headers=auth_headers(user_id))
+        assert response.status_code == 200
+        return [(notification['message'], notification['actor_count']) for notification in response.get_json()]
+    return texts
+
+
+@pytest.mark.parametrize('action, singular, plural', [
+    ('like', 'le ha gustado tu álbum <strong>Álbum de prueba</strong>.', 'les ha gustado tu álbum <strong>Álbum de prueba</strong>.'),
+    ('comments', 'ha comentado en tu álbum <strong>Álbum de prueba</strong>.', 'han comentado en tu álbum <strong>Álbum de prueba</strong>.'),
+    ('follow', 'ha comenzado a seguirte.', 'han comenzado a seguirte.'),
+])
+def test_coalesced_text_agrees_with_the_number_of_actors(client, make_user, make_album, auth_headers, messages, action, singular, plural):
+    owner_id = make_user('duena')
+    album_id = make_album(owner_id)
+    fans = [make_user(f'fan{index}') for index in range(3)]
+    url = f'/api/users/{owner_id}/follow' if action == 'follow' else f'/api/albums/{album_id}/{action}'
+
+    def act(fan_id):
+        assert client.post(url, json={'text': 'Bonito'}, headers=auth_headers(fan_id)).status_code in (200, 201)
+
+    act(fans[0])
+    assert messages(owner_id) == [(f'<strong>fan0</strong> {singular}', 1)]
+    act(fans[1])
+    assert messages(owner_id) == [(f'<strong>fan1</strong> y 1 persona más {plural}', 2)]
+    act(fans[2])
+    assert messages(owner_id) == [(f'<strong>fan2</strong> y 2 personas más {plural}', 3)]
+    with app.app_context(): assert Notification.query.filter_by(recipient_id=owner_id).count() == 1
+
+
+def test_repeated_actor_does_not_count_twice(client, make_user, make_album, auth_headers, messages):
+    owner_id = make_user('duena')
+    album_id = make_album(owner_id)
+    first, second = auth_headers(make_user('fan0')), auth_headers(make_user('fan1'))
+    for headers in (first, second, first, first):
+        client.post(f'/api/albums/{album_id}/like', headers=headers)
+    # fan0 quitó y volvió a dar like: sigue habiendo dos personas
+    assert messages(owner_id) == [('<strong>fan0</strong> y 1 persona más les ha gustado tu álbum <strong>Álbum de prueba</strong>.', 2)]
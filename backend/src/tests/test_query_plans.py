@@ -0,0 +1,58 @@
+"""Ninguna consulta de las rutas de lectura (EXPLAIN_ROUTES) recorre una tabla entera.
+
+Por defecto se revisa el plan de SQLite (EXPLAIN QUERY PLAN); con TEST_DATABASE_URL=postgresql://...
+la prueba marcada `postgresql` revisa el de PostgreSQL con enable_seqscan=off.
+"""
+import pytest
+from flask_jwt_extended import create_access_token
+from app import app, db, EXPLAIN_ROUTES, explain_route, explain_samples
+from benchmarks.data import generate
+
+
+def dialect():
+    with app.app_context(): return db.engine.dialect.name
+
+
+def full_scans():
+    """Siembra datos sintéticos, pide cada ruta sin sesión y con sesión, y devuelve (peticiones revisadas, fallos)."""
+    with app.app_context():
+        generate(users=60, seed=1)
+        viewer_id, samples = explain_samples()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(viewer_id))}'}
+        db.session.remove()
+    client, checked, failures = app.test_client(), 0, []
+    for route in EXPLAIN_ROUTES:
+        url = route.format(**samples)
+        assert 'None' not in url, f'{route}: la siembra no genera datos de ejemplo'
+        # Sin medir: los índices en memoria (búsqueda en SQLite) se reconstruyen recorriendo tablas
+        client.get(url)
+        for mode, request_headers in (('anónimo', {}), ('con sesión', headers)):
+            with app.app_context(): status, results = explain_route(client, url, request_headers)
+            if status == 401: continue  # ruta solo para usuarios con sesión
+            assert status in (200, 304), f'{url} ({mode}): {status}'
+            checked += 1
+            failures += [(url, mode, scans, statement, plan) for statement, plan, scans in results if scans]
+    return checked, failures
+
+
+def assert_no_full_scans():
+    checked, failures = full_scans()
+    assert checked >= len(EXPLAIN_ROUTES)
+    assert not failures, '\n\n'.join(f"{url} ({mode}) recorre {', '.join(scans)}\n{statement}\n" + '\n'.join(plan)
+                                      for url, mode, scans, statement, plan in failures)
+
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    # Cada petición debe ejecutar la vista y sus consultas
+    monkeypatch.setattr('app.response_cache', None)
+
+
+def test_sqlite_plans_use_indexes():
+    if dialect() != 'sqlite': pytest.skip('la BD de pruebas no es SQLite')
+    assert_no_full_scans()
+
+
+@pytest.mark.postgresql
+def test_postgresql_plans_use_indexes():
+    assert_no_full_scans()
@@ -0,0 +1,66 @@
+"""PUT /api/albums/<id>/reorder: un solo UPDATE con el nuevo orden, la portada pasa al primer archivo y
+cualquier lista que no sea exactamente la de los archivos del álbum se rechaza sin tocar nada."""
+import pytest
+from app import app, db, Album, Media
+
+
+def media_state(album_id):
+    """(ids en el orden guardado, portada del álbum)."""
+    with app.app_context():
+        ids = [media_id for media_id, in db.session.query(Media.id).filter(Media.album_id == album_id).order_by(Media.position, Media.id)]
+        return ids, db.session.get(Album, album_id).thumbnail_path
+
+
+@pytest.fixture
+def album(make_user, make_album, auth_headers):
+    owner_id = make_user('duena')
+    album_id = make_album(owner_id, media=4)
+    return album_id, auth_headers(owner_id)
+
+
+def test_reorder_persists_order_and_cover(client, album, statements):
+    album_id, headers = album
+    (first, second, third, fourth), _ = media_state(album_id)
+    before = client.get(f'/api/albums/{album_id}').headers['ETag']
+
+    statements.clear()
+    response = client.put(f'/api/albums/{album_id}/reorder', json={'media_ids': [third, first, fourth, second]}, headers=headers)
+    assert response.status_code == 200
+    assert len([statement for statement in statements if statement.startswith('UPDATE media')]) == 1, statements
+
+    ids, cover = media_state(album_id)
+    assert ids == [third, first, fourth, second]
+    with app.app_context(): assert cover == db.session.get(Media, third).file_path
+    detail = client.get(f'/api/albums/{album_id}')
+    assert [item['id'] for item in detail.get_json()['media']] == [third, first, fourth, second]
+    # touch_albums cambia updated_at: el detalle ya no valida con el ETag anterior
+    assert detail.headers['ETag'] != before
+    assert client.get(f'/api/albums/{album_id}', headers={'If-None-Match': before}).status_code == 200
+
+
+@pytest.mark.parametrize('build', [
+    lambda ids, other: ids[:3],
+    lambda ids, other: ids[:3] + [ids[0]],
+    lambda ids, other: ids[:3] + [other],
+    lambda ids, other: ids + [other],
+    lambda ids, other: [],
+    lambda ids, other: ids[:3] + ['x'],
+], ids=['incompleta', 'repetida', 'de otro álbum', 'con uno de más', 'vacía', 'no numérica'])
+def test_invalid_lists_change_nothing(client, album, make_album, make_user, build):
+    album_id, headers = album
+    other_album_id = make_album(make_user('otra'))
+    ids, cover = media_state(album_id)
+    (other_media_id,), _ = media_state(other_album_id)
+
+    response = client.put(f'/api/albums/{album_id}/reorder', json={'media_ids': build(ids[::-1], other_media_id)}, headers=headers)
+    assert response.status_code == 400
+    assert media_state(album_id) == (ids, cover)
+    assert media_state(other_album_id)[0] == [other_media_id]
+
+
+def test_only_the_owner_can_reorder(client, album, make_user, auth_headers):
+    album_id, _ = album
+    ids, cover = media_state(album_id)
+    response = client.put(f'/api/albums/{album_id}/reorder', json={'media_ids': ids[::-1]}, headers=auth_headers(make_user('intrusa')))
+    assert response.status_code == 403
+    assert media_state(album_id) == (ids, cover)
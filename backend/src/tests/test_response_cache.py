@@ -0,0 +1,51 @@
+"""Caché de respuestas del detalle de álbum: los contadores se leen en cada acierto y los datos del dueño
+(seguidores, avatar) invalidan el detalle de todos sus álbumes."""
+import pytest
+from app import app, db, view_counter, MemoryResponseCache, User
+
+
+@pytest.fixture(autouse=True)
+def response_cache(monkeypatch):
+    monkeypatch.setattr('app.response_cache', MemoryResponseCache(1 << 20))
+
+
+def test_cached_detail_counts_every_view(client, make_user, make_album, statements):
+    album_id = make_album(make_user('duena'))
+    assert client.get(f'/api/albums/{album_id}').get_json()['views_count'] == 1
+    statements.clear()
+    views = [client.get(f'/api/albums/{album_id}').get_json()['views_count'] for _ in range(3)]
+    assert views == [2, 3, 4]
+    # Aciertos: validador y contadores vivos, sin las consultas de la vista
+    assert len(statements) == 3 * 2, statements
+
+    first = client.get(f'/api/albums/{album_id}')
+    view_counter.flush()
+    second = client.get(f'/api/albums/{album_id}')
+    assert (first.get_json()['views_count'], second.get_json()['views_count']) == (5, 6)
+    assert first.headers['ETag'] != second.headers['ETag']
+
+
+def test_follow_invalidates_cached_detail(client, make_user, make_album, auth_headers):
+    owner_id, fan_id = make_user('duena'), make_user('fan')
+    album_id = make_album(owner_id)
+    before = client.get(f'/api/albums/{album_id}')
+    assert before.get_json()['owner_followers_count'] == 0
+    assert client.post(f'/api/users/{owner_id}/follow', headers=auth_headers(fan_id)).status_code == 200
+    after = client.get(f'/api/albums/{album_id}')
+    assert after.get_json()['owner_followers_count'] == 1
+    assert after.headers['ETag'] != before.headers['ETag']
+
+    # El seguidor también es dueño de álbumes: cambia su número de seguidos
+    fan_album_id = make_album(fan_id)
+    assert client.get(f'/api/albums/{fan_album_id}').get_json()['owner_following_count'] == 1
+    client.post(f'/api/users/{owner_id}/follow', headers=auth_headers(fan_id))
+    assert client.get(f'/api/albums/{fan_album_id}').get_json()['owner_following_count'] == 0
+
+
+def test_avatar_change_invalidates_cached_detail(client, make_user, make_album, auth_headers):
+    owner_id = make_user('duena', profile_picture_path='duena/avatar.jpg')
+    album_ids = [make_album(owner_id), make_album(owner_id)]
+    assert all(client.get(f'/api/albums/{album_id}').get_json()['owner_profile_picture'] for album_id in album_ids)
+    assert client.delete('/api/my-profile/picture', headers=auth_headers(owner_id)).status_code == 200
+    with app.app_context(): assert db.session.get(User, owner_id).profile_picture_path is None
+    assert [client.get(f'/api/albums/{album_id}').get_json()['owner_profile_picture'] for album_id in album_ids] == [None, None]
@@ -0,0 +1,88 @@
+"""/api/search: orden del índice invertido en memoria (la búsqueda de SQLite) y resultados al día tras editar
+o borrar usuarios, álbumes y etiquetas."""
+import pytest
+from app import app, db, InvertedSearchIndex, Album
+
+
+@pytest.fixture(autouse=True)
+def search_index(monkeypatch):
+    # Índice vacío por prueba: la BD se recrea entre pruebas sin pasar por un commit que lo invalide
+    index = InvertedSearchIndex()
+    monkeypatch.setattr('app.search_index', index)
+    return index
+
+
+@pytest.fixture
+def search(client):
+    def results(query, **params):
+        response = client.get('/api/search', query_string={'q': query, **params})
+        assert response.status_code == 200
+        data = response.get_json()
+        return [user['username'] for user in data['users']], [album['title'] for album in data['albums']]
+    return results
+
+
+def create_album(client, headers, title, **fields):
+    response = client.post('/api/albums', json={'title': title, **fields}, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['album_id']
+
+
+def sqlite_only():
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite': pytest.skip('el orden de PostgreSQL lo da pg_trgm y ts_rank')
+
+
+def test_sqlite_ranking(client, make_user, auth_headers, search):
+    sqlite_only()
+    for username in ('juana', 'anabel', 'ana'): make_user(username)
+    headers = auth_headers(make_user('duena'))
+    album_ids = [create_album(client, headers, 'Viaje', description='Una playa tranquila'),
+                 create_album(client, headers, 'Playas del norte'),
+                 create_album(client, headers, 'Verano', tags='playa, sol'),
+                 create_album(client, headers, 'Playa')]
+    # Palabra exacta en el título (3) > etiqueta (2) > prefijo en el título (1.5) > descripción (1)
+    assert search('playa') == ([], ['Playa', 'Verano', 'Playas del norte', 'Viaje'])
+    # Los usuarios coinciden por prefijo del nombre, el exacto primero
+    assert search('ana')[0] == ['ana', 'anabel']
+    # Todas las palabras deben coincidir y sus pesos se suman
+    assert search('pla norte') == ([], ['Playas del norte'])
+    assert search('PLAYA sol')[1] == ['Verano']
+    # Empates: el álbum más reciente primero; las páginas siguen ese orden
+    album_ids.append(create_album(client, headers, 'Playa'))
+    pages = [client.get('/api/search', query_string={'q': 'playa', 'type': 'albums', 'per_page': 2, 'page': page}).get_json()
+             for page in (1, 2, 3)]
+    assert [album['id'] for data in pages for album in data['albums']] == album_ids[::-1]
+    assert [data['has_more'] for data in pages] == [True, True, False]
+
+
+def test_results_follow_edits_and_deletes(client, make_user, auth_headers, search, search_index):
+    owner_id, admin_id = make_user('montanista'), make_user('admin', is_admin=True)
+    headers = auth_headers(owner_id)
+    album_id = create_album(client, headers, 'Borrador', tags='nieve')
+    other_id = create_album(client, headers, 'Cumbre')
+    assert search('borrador')[1] == ['Borrador']
+
+    client.put(f'/api/albums/{album_id}', json={'title': 'Volcanes', 'tags': 'lava'}, headers=headers)
+    assert search('borrador')[1] == search('nieve')[1] == []
+    assert search('volcanes')[1] == search('lava')[1] == ['Volcanes']
+
+    assert client.delete(f'/api/albums/{album_id}', headers=headers).status_code == 200
+    assert search('volcanes')[1] == []
+    assert search('montanista') == (['montanista'], [])
+    # Borrar al usuario quita al usuario y sus álbumes
+    assert client.delete(f'/api/admin/users/{owner_id}', headers=auth_headers(admin_id)).status_code == 200
+    assert search('montanista') == search('cumbre') == ([], [])
+    with app.app_context(): assert db.session.get(Album, other_id) is None
+
+
+def test_unrelated_commits_keep_the_index(client, make_user, make_album, auth_headers, search, search_index):
+    sqlite_only()
+    album_id, headers = make_album(make_user('duena')), auth_headers(make_user('fan'))
+    assert search('prueba')[1] == ['Álbum de prueba']
+    assert not search_index._stale
+    # Likes, comentarios y visitas no cambian lo que se busca: no fuerzan reconstruir el índice
+    client.post(f'/api/albums/{album_id}/like', headers=headers)
+    client.post(f'/api/albums/{album_id}/comments', json={'text': 'Bonito'}, headers=headers)
+    client.get(f'/api/albums/{album_id}')
+    assert not search_index._stale
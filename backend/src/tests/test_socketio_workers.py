@@ -0,0 +1,162 @@
+"""Dos workers de app.py en procesos separados, unidos por una cola de mensajes Redis.
+
+El broker es un servidor fakeredis por TCP dentro del proceso de pruebas. El cliente de pruebas de
+Flask-SocketIO no admite cola de mensajes, así que los sockets son clientes reales de python-socketio.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+socketio_client = pytest.importorskip('socketio')
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER = "import sys; from app import app, socketio; socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)"
+WORKER_TTL = 1.5
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition(): return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def broker():
+    server = fakeredis.TcpFakeServer(('127.0.0.1', free_port()), server_type='redis')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    yield f'redis://{host}:{port}/0'
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def start_worker(broker, tmp_path):
+    """Arranca un worker (`python -c` sobre app.py) y devuelve (proceso, url) cuando ya acepta conexiones."""
+    processes = []
+    def start():
+        port = free_port()
+        env = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=broker, PRESENCE_WORKER_TTL=str(WORKER_TTL), PRESENCE_FLUSH_INTERVAL='3600')
+        with open(tmp_path / f'worker_{port}.log', 'wb') as log:
+            process = subprocess.Popen([sys.executable, '-c', WORKER, str(port)], cwd=SRC_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        processes.append(process)
+        def listening():
+            assert process.poll() is None, (tmp_path / f'worker_{port}.log').read_text()
+            with socket.socket() as sock: return sock.connect_ex(('127.0.0.1', port)) == 0
+        assert wait_until(listening, timeout=30)
+        return process, f'http://127.0.0.1:{port}'
+    yield start
+    for process in processes:
+        if process.poll() is None: process.send_signal(signal.SIGKILL)
+        process.wait()
+
+
+@pytest.fixture
+def connect(auth_headers):
+    """Conecta un cliente autenticado como `user_id` y devuelve (cliente, eventos recibidos)."""
+    clients = []
+    def open_client(url, user_id):
+        client, received = socketio_client.Client(reconnection=False), []
+        client.on('*', lambda event, data=None: received.append((event, data)))
+        token = auth_headers(user_id)['Authorization'].split()[1]
+        client.connect(url, auth={'token': token}, transports=['polling'], wait_timeout=10)
+        clients.append(client)
+        return client, received
+    yield open_client
+    for client in clients:
+        if client.connected: client.disconnect()
+
+
+def status_changes(received, user_id):
+    return [data['is_active'] for event, data in received if event == 'user_status_changed' and data['user_id'] == user_id]
+
+
+def join_admin_room(client):
+    # join_admin_room no tiene acuse: margen para que el worker procese la unión a la sala
+    client.emit('join_admin_room')
+    time.sleep(0.5)
+
+
+def test_private_message_reaches_recipient_on_another_worker(make_user, start_worker, connect):
+    sender_id, recipient_id = make_user('remitente'), make_user('destinatario')
+    _, first = start_worker()
+    _, second = start_worker()
+    sender, sent = connect(first, sender_id)
+    _, received = connect(second, recipient_id)
+
+    sender.emit('private_message', {'recipient_id': recipient_id, 'content': 'cruzando workers'})
+
+    assert wait_until(lambda: any(event == 'new_message' for event, _ in received))
+    message = next(data for event, data in received if event == 'new_message')
+    assert (message['sender_id'], message['content']) == (sender_id, 'cruzando workers')
+    assert wait_until(lambda: any(event == 'message_sent' for event, _ in sent))
+
+
+def test_user_with_tabs_on_two_workers_goes_offline_with_the_last(make_user, start_worker, connect):
+    admin_id, user_id = make_user('admin', is_admin=True), make_user('usuario')
+    _, first = start_worker()
+    _, second = start_worker()
+    admin, admin_events = connect(first, admin_id)
+    join_admin_room(admin)
+
+    tab_one, _ = connect(first, user_id)
+    tab_two, _ = connect(second, user_id)
+    assert wait_until(lambda: status_changes(admin_events, user_id) == [True])
+
+    tab_one.disconnect()
+    time.sleep(0.5)
+    assert status_changes(admin_events, user_id) == [True]
+    tab_two.disconnect()
+    assert wait_until(lambda: status_changes(admin_events, user_id) == [True, False])
+
+
+def test_sids_of_a_crashed_worker_expire(make_user, start_worker, connect):
+    admin_id, user_id = make_user('admin', is_admin=True), make_user('usuario')
+    crashed, first = start_worker()
+    _, second = start_worker()
+    admin, admin_events = connect(second, admin_id)
+    join_admin_room(admin)
+    connect(first, user_id)
+    assert wait_until(lambda: status_changes(admin_events, user_id) == [True])
+
+    # Sin desconexión limpia: el sid queda en Redis hasta que caduca el latido del worker
+    crashed.send_signal(signal.SIGKILL)
+    crashed.wait()
+    assert wait_until(lambda: status_changes(admin_events, user_id) == [True, False], timeout=WORKER_TTL * 4)
+
+    # El usuario vuelve por el worker vivo y se notifica de nuevo que está online
+    connect(second, user_id)
+    assert wait_until(lambda: status_changes(admin_events, user_id) == [True, False, True])
+
+
+def test_worker_without_clients_reaps_a_crashed_worker(make_user, broker, start_worker, connect):
+    import redis
+    user_id = make_user('usuario')
+    crashed, first = start_worker()
+    start_worker()
+    connect(first, user_id)
+    store = redis.Redis.from_url(broker)
+    assert wait_until(lambda: store.exists(f'presence:sids:{user_id}'))
+
+    # Solo queda el otro worker, que nunca tuvo sockets: su latido arranca con el proceso y retira los sids huérfanos
+    crashed.send_signal(signal.SIGKILL)
+    crashed.wait()
+    assert wait_until(lambda: not store.exists(f'presence:sids:{user_id}'), timeout=WORKER_TTL * 4)
+    # Del registro de workers solo queda el vivo
+    assert wait_until(lambda: store.scard('presence:workers') == 1)
@@ -0,0 +1,85 @@
+"""Etiquetas: alta en bloque con INSERT ... ON CONFLICT, sin duplicados aunque varias peticiones creen la misma
+a la vez, y Tag.albums_count al día con album_tags (lo mismo que recalcula `flask recompute-tag-counts`)."""
+import threading
+import pytest
+from app import app, db, album_tags, parse_tag_names, Tag
+
+
+def tag_counts():
+    """({nombre: albums_count}, {nombre: álbumes según album_tags})."""
+    with app.app_context():
+        links = db.select(db.func.count()).where(album_tags.c.tag_id == Tag.id).scalar_subquery()
+        rows = db.session.query(Tag.name, Tag.albums_count, links).all()
+        return {name: count for name, count, _ in rows}, {name: count for name, _, count in rows}
+
+
+def create_album(client, headers, tags):
+    response = client.post('/api/albums', json={'title': 'Con etiquetas', 'tags': tags}, headers=headers)
+    assert response.status_code == 201
+    return response.get_json()['album_id']
+
+
+def test_parse_tag_names():
+    assert parse_tag_names('Foto, Tacna ,foto,, ') == ['foto', 'tacna']
+    assert parse_tag_names(' , ') == []
+    assert parse_tag_names('x' * 60) == ['x' * 50]
+
+
+def test_missing_tags_are_inserted_in_one_statement(client, make_user, auth_headers, statements):
+    headers = auth_headers(make_user('duena'))
+    create_album(client, headers, 'playa')
+    statements.clear()
+    create_album(client, headers, 'Playa, sol, arena, sol')
+    assert len([statement for statement in statements if statement.startswith('INSERT INTO tag ')]) == 1, statements
+    assert tag_counts()[0] == {'playa': 2, 'sol': 1, 'arena': 1}
+
+
+def test_counts_follow_edits_and_deletes(client, make_user, auth_headers):
+    owner_id, admin_id = make_user('duena'), make_user('admin', is_admin=True)
+    headers, other_headers = auth_headers(owner_id), auth_headers(make_user('otra'))
+    first = create_album(client, headers, 'playa, sol')
+    second = create_album(client, headers, 'playa')
+    create_album(client, other_headers, 'sol, nieve')
+    assert client.put(f'/api/albums/{first}', json={'tags': 'sol, arena'}, headers=headers).status_code == 200
+    assert client.delete(f'/api/albums/{second}', headers=headers).status_code == 200
+    counts, links = tag_counts()
+    assert counts == links == {'playa': 0, 'sol': 2, 'nieve': 1, 'arena': 1}
+    assert [tag['name'] for tag in client.get('/api/tags/popular').get_json()] == ['sol', 'arena', 'nieve']
+    # Borrar al usuario descuenta las etiquetas de todos sus álbumes
+    assert client.delete(f'/api/admin/users/{owner_id}', headers=auth_headers(admin_id)).status_code == 200
+    counts, links = tag_counts()
+    assert counts == links == {'playa': 0, 'sol': 1, 'nieve': 1, 'arena': 0}
+
+
+def test_recompute_tag_counts_matches_incremental_counts(client, make_user, auth_headers):
+    headers = auth_headers(make_user('duena'))
+    album_id = create_album(client, headers, 'playa, sol')
+    create_album(client, headers, 'sol')
+    client.put(f'/api/albums/{album_id}', json={'tags': 'arena'}, headers=headers)
+    incremental = tag_counts()[0]
+    # Un desajuste (p. ej. de antes de los contadores) que el comando repara
+    with app.app_context():
+        Tag.query.update({Tag.albums_count: 7})
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['recompute-tag-counts'])
+    assert result.exit_code == 0, result.output
+    assert tag_counts()[0] == incremental == {'playa': 0, 'sol': 1, 'arena': 1}
+
+
+@pytest.mark.postgresql
+def test_concurrent_creates_share_one_tag_row(make_user, auth_headers):
+    writers = [auth_headers(make_user(f'autora{index}')) for index in range(20)]
+    start, errors = threading.Barrier(len(writers)), []
+
+    def create(headers):
+        client = app.test_client()
+        start.wait()
+        response = client.post('/api/albums', json={'title': 'Simultáneo', 'tags': 'nueva, compartida, otra'}, headers=headers)
+        if response.status_code != 201: errors.append(response.status_code)
+
+    threads = [threading.Thread(target=create, args=(headers,)) for headers in writers]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert errors == []
+    counts, links = tag_counts()
+    assert counts == links == {'nueva': 20, 'compartida': 20, 'otra': 20}
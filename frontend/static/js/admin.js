@@ -30,9 +30,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const allUsersList = document.getElementById('all-users-list');
 
     // --- Socket.IO para actualizaciones en tiempo real ---
-    const socket = io(window.backendUrl);
+    const socket = io(window.backendUrl, { auth: (cb) => cb({ token: localStorage.getItem('accessToken') }) });
     socket.on('connect', () => {
-        socket.emit('authenticate', { token });
         socket.emit('join_admin_room'); // Unirse a la sala de administradores
     });
 
@@ -11,7 +11,8 @@ document.addEventListener('DOMContentLoaded', () => {
         albumOwnerId: null,
         albumData: null,
         sortableInstance: null,
-        isLoggedIn: !!token
+        isLoggedIn: !!token,
+        commentsCursor: null
     };
 
     let activeCommentReportId = null;
@@ -83,8 +84,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
             renderAlbumDetails(state.albumData);
             renderMediaFeed(state.albumData.media);
-            renderComments(state.albumData.comments, elements.commentsList);
             updateInteractionState(state.albumData);
+            loadComments();
         } catch (error) {
             console.error(error);
             document.body.innerHTML = `<h1>Error al cargar el álbum. Es posible que no exista o haya sido eliminado.</h1>`;
@@ -102,7 +103,7 @@ document.addEventListener('DOMContentLoaded', () => {
         elements.photosVideosCount.textContent = `${album.photos_count} fotos / ${album.videos_count} videos`;
         elements.likesCount.textContent = album.likes_count;
         elements.savesCount.textContent = album.saves_count;
-        elements.commentsCount.textContent = countTotalComments(album.comments);
+        elements.commentsCount.textContent = album.comments_count;
         elements.ownerStats.innerHTML = `<span><strong>${album.owner_followers_count}</strong> seguidores</span> <span><strong>${album.owner_following_count}</strong> seguidos</span>`;
         elements.albumTagsContainer.innerHTML = '';
         album.tags.forEach(tag => {
@@ -113,16 +114,6 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    function countTotalComments(comments) {
-        let count = comments.length;
-        for (const comment of comments) {
-            if (comment.replies && comment.replies.length > 0) {
-                count += countTotalComments(comment.replies);
-            }
-        }
-        return count;
-    }
-
     function renderMediaFeed(media) {
         elements.mediaFeed.innerHTML = '';
         media.forEach(item => {
@@ -137,6 +128,12 @@ document.addEventListener('DOMContentLoaded', () => {
             } else {
                 mediaElement = document.createElement('img');
                 mediaElement.src = item.file_path;
+                if (item.variants && item.variants.srcset.webp) {
+                    // Variantes reducidas generadas en el servidor; el navegador elige según el ancho de pantalla
+                    mediaElement.srcset = item.variants.srcset.webp;
+                    mediaElement.sizes = '(max-width: 800px) 100vw, 800px';
+                    if (item.variants.placeholder) mediaElement.style.backgroundImage = `url('${item.variants.placeholder}')`;
+                }
                 mediaElement.alt = "Contenido del álbum";
                 mediaElement.loading = "lazy";
             }
@@ -145,66 +142,106 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    function flattenComments(comments, depth = 0) {
-        let flatList = [];
-        const sortedComments = comments.sort((a, b) => new Date(a.created_at) - new Date(b.created_at));
-        for (const comment of sortedComments) {
-            flatList.push({ ...comment, depth });
-            if (comment.replies && comment.replies.length > 0) {
-                flatList = flatList.concat(flattenComments(comment.replies, depth + 1));
-            }
+    // Los comentarios llegan paginados: primero los de nivel superior (con sus primeras respuestas)
+    // y el resto de respuestas se pide bajo demanda con /api/comments/<id>/replies.
+    const loadComments = async () => {
+        state.commentsCursor = null;
+        elements.commentsList.innerHTML = '';
+        await loadMoreComments();
+        if (!elements.commentsList.querySelector('.comment')) {
+            elements.commentsList.innerHTML = '<p>No hay comentarios. ¡Sé el primero!</p>';
         }
-        return flatList;
+    };
+
+    async function loadMoreComments() {
+        const query = state.commentsCursor ? `?cursor=${encodeURIComponent(state.commentsCursor)}` : '';
+        const response = await fetchWithAuth(`/api/albums/${albumId}/comments${query}`);
+        if (!response.ok) return showToast('No se pudieron cargar los comentarios.', 'error');
+        const data = await response.json();
+        state.commentsCursor = data.next_cursor;
+        elements.commentsList.querySelector('[data-action="load-more-comments"]')?.remove();
+        data.comments.forEach(comment => elements.commentsList.appendChild(buildCommentThread(comment, 0)));
+        if (data.next_cursor) elements.commentsList.appendChild(buildLoadMoreButton('load-more-comments', 'Ver más comentarios'));
     }
-    
-    function renderComments(comments, container) {
-        container.innerHTML = '';
-        const topLevelComments = comments.filter(c => !c.parent_id);
-        
-        if (topLevelComments && topLevelComments.length > 0) {
-            const flatCommentList = flattenComments(topLevelComments);
-            
-            flatCommentList.forEach(comment => {
-                const commentEl = document.createElement('div');
-                commentEl.className = 'comment';
-                if (comment.depth > 0) {
-                    commentEl.classList.add('is-reply');
-                }
-                commentEl.dataset.commentId = comment.id;
-
-                let actionsMenu = '';
-                const isOwnerOfComment = state.currentUserId === comment.author_id;
-                const isOwnerOfAlbum = state.currentUserId === state.albumOwnerId;
-                if (state.isLoggedIn) {
-                    let menuButtons = '';
-                    if (isOwnerOfComment || isOwnerOfAlbum) {
-                        const buttonText = isOwnerOfComment ? 'Eliminar' : 'Eliminar (Dueño)';
-                        menuButtons += `<button class="delete" data-action="delete-comment">${buttonText}</button>`;
-                    } else {
-                        menuButtons += '<button data-action="report-comment">Reportar</button>';
-                    }
-                    actionsMenu = `<div class="comment-actions"><button class="comment-actions-btn" data-action="toggle-menu"><i class="fas fa-ellipsis-v"></i></button><div class="comment-actions-menu">${menuButtons}</div></div>`;
-                }
 
-                let mentionHtml = '';
-                if (comment.replying_to) {
-                    mentionHtml = `<a href="/profile.html?user=${comment.replying_to}" class="comment-reply-mention">@${comment.replying_to}</a> `;
-                }
+    async function loadMoreReplies(button) {
+        const thread = button.closest('.comment-thread');
+        const query = button.dataset.cursor ? `?cursor=${encodeURIComponent(button.dataset.cursor)}` : '';
+        button.disabled = true;
+        const response = await fetchWithAuth(`/api/comments/${thread.dataset.commentId}/replies${query}`);
+        if (!response.ok) { button.disabled = false; return showToast('No se pudieron cargar las respuestas.', 'error'); }
+        const data = await response.json();
+        const repliesContainer = button.parentElement;
+        button.remove();
+        data.replies.forEach(reply => repliesContainer.appendChild(buildCommentThread(reply, 1)));
+        if (data.next_cursor) repliesContainer.appendChild(buildLoadMoreButton('load-replies', 'Ver más respuestas', data.next_cursor));
+    }
 
-                commentEl.innerHTML = `
-                    <p class="comment-text">${mentionHtml}${comment.text}</p>
-                    <span class="comment-meta">
-                        por <a href="/profile.html?user=${comment.author_username}" class="profile-link"><strong>@${comment.author_username}</strong></a> - ${new Date(comment.created_at).toLocaleString('es-PE', { dateStyle: 'short', timeStyle: 'short' })}
-                        ${state.isLoggedIn ? `<button class="reply-btn" data-action="show-reply-form" data-reply-to="${comment.author_username}">Responder</button>` : ''}
-                    </span>
-                    ${actionsMenu}
-                    <div class="reply-form-container"></div>
-                `;
-                container.appendChild(commentEl);
-            });
-        } else if (container === elements.commentsList) {
-            container.innerHTML = '<p>No hay comentarios. ¡Sé el primero!</p>';
+    function buildLoadMoreButton(action, text, cursor = null) {
+        const button = document.createElement('button');
+        button.className = 'btn btn-secondary load-more-btn';
+        button.dataset.action = action;
+        if (cursor) button.dataset.cursor = cursor;
+        button.textContent = text;
+        return button;
+    }
+
+    // Un hilo = el comentario + un contenedor con sus respuestas ya cargadas y, si faltan, un botón para pedirlas
+    function buildCommentThread(comment, depth) {
+        const thread = document.createElement('div');
+        thread.className = 'comment-thread';
+        thread.dataset.commentId = comment.id;
+        thread.appendChild(buildCommentElement(comment, depth));
+
+        const repliesContainer = document.createElement('div');
+        repliesContainer.className = 'comment-thread-replies';
+        (comment.replies || []).forEach(reply => repliesContainer.appendChild(buildCommentThread(reply, depth + 1)));
+        const loaded = (comment.replies || []).length;
+        if (comment.reply_count > loaded) {
+            const pending = comment.reply_count - loaded;
+            repliesContainer.appendChild(buildLoadMoreButton('load-replies', `Ver ${pending} ${pending === 1 ? 'respuesta' : 'respuestas'}`, comment.replies_cursor));
+        }
+        thread.appendChild(repliesContainer);
+        return thread;
+    }
+
+    function buildCommentElement(comment, depth) {
+        const commentEl = document.createElement('div');
+        commentEl.className = 'comment';
+        if (depth > 0) {
+            commentEl.classList.add('is-reply');
         }
+        commentEl.dataset.commentId = comment.id;
+
+        let actionsMenu = '';
+        const isOwnerOfComment = state.currentUserId === comment.author_id;
+        const isOwnerOfAlbum = state.currentUserId === state.albumOwnerId;
+        if (state.isLoggedIn) {
+            let menuButtons = '';
+            if (isOwnerOfComment || isOwnerOfAlbum) {
+                const buttonText = isOwnerOfComment ? 'Eliminar' : 'Eliminar (Dueño)';
+                menuButtons += `<button class="delete" data-action="delete-comment">${buttonText}</button>`;
+            } else {
+                menuButtons += '<button data-action="report-comment">Reportar</button>';
+            }
+            actionsMenu = `<div class="comment-actions"><button class="comment-actions-btn" data-action="toggle-menu"><i class="fas fa-ellipsis-v"></i></button><div class="comment-actions-menu">${menuButtons}</div></div>`;
+        }
+
+        let mentionHtml = '';
+        if (comment.replying_to) {
+            mentionHtml = `<a href="/profile.html?user=${comment.replying_to}" class="comment-reply-mention">@${comment.replying_to}</a> `;
+        }
+
+        commentEl.innerHTML = `
+            <p class="comment-text">${mentionHtml}${comment.text}</p>
+            <span class="comment-meta">
+                por <a href="/profile.html?user=${comment.author_username}" class="profile-link"><strong>@${comment.author_username}</strong></a> - ${new Date(comment.created_at).toLocaleString('es-PE', { dateStyle: 'short', timeStyle: 'short' })}
+                ${state.isLoggedIn && depth === 0 ? `<button class="reply-btn" data-action="show-reply-form" data-reply-to="${comment.author_username}">Responder</button>` : ''}
+            </span>
+            ${actionsMenu}
+            <div class="reply-form-container"></div>
+        `;
+        return commentEl;
     }
 
     function updateInteractionState(album) {
@@ -399,6 +436,9 @@ document.addEventListener('DOMContentLoaded', () => {
         const commentEl = target.closest('.comment');
         
         if (action !== 'submit-reply') e.preventDefault();
+
+        if (action === 'load-more-comments') return loadMoreComments();
+        if (action === 'load-replies') return loadMoreReplies(target);
         
         if (action === 'toggle-menu') {
             const menu = commentEl.querySelector('.comment-actions-menu');
@@ -23,6 +23,8 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentUserId = null;
     let activeChatUserId = null;
     let allConversations = [];
+    let olderMessagesCursor = null;
+    let loadingOlderMessages = false;
     
     try {
         currentUserId = parseInt(JSON.parse(atob(token.split('.')[1])).sub, 10);
@@ -95,7 +97,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 userSearchResults.innerHTML = '<p style="text-align:center; color: var(--text-muted); padding: 2rem;">Escribe al menos 2 letras.</p>';
                 return;
             }
-            const response = await fetchWithAuth(`/api/search?q=${query}`);
+            const response = await fetchWithAuth(`/api/search?q=${encodeURIComponent(query)}&type=users`);
             const results = await response.json();
             renderUserSearchResults(results.users);
         }, 300);
@@ -137,8 +139,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    const socket = io(window.backendUrl);
-    socket.on('connect', () => socket.emit('authenticate', { token }));
+    const socket = io(window.backendUrl, { auth: (cb) => cb({ token: localStorage.getItem('accessToken') }) });
+    socket.on('auth_expired', () => socket.emit('authenticate', { token: localStorage.getItem('accessToken') }));
     socket.on('new_message', (message) => {
         if (message.sender_id === activeChatUserId) appendMessage(message);
         loadConversations();
@@ -183,9 +185,41 @@ document.addEventListener('DOMContentLoaded', () => {
         if (partnerEl) partnerEl.classList.add('active');
 
         const response = await fetchWithAuth(`/api/chats/${otherUser.id}`);
-        const messages = await response.json();
-        renderMessages(messages);
+        const data = await response.json();
+        olderMessagesCursor = data.next_cursor;
+        renderMessages(data.messages);
     };
+
+    // Al llegar arriba del historial se pide la página anterior y se inserta antes de lo ya mostrado
+    const loadOlderMessages = async () => {
+        if (!olderMessagesCursor || loadingOlderMessages || !activeChatUserId) return;
+        loadingOlderMessages = true;
+        const chatUserId = activeChatUserId;
+        try {
+            const response = await fetchWithAuth(`/api/chats/${chatUserId}?before=${encodeURIComponent(olderMessagesCursor)}`);
+            if (!response.ok) throw new Error('No se pudieron cargar mensajes anteriores.');
+            const data = await response.json();
+            if (chatUserId !== activeChatUserId) return;
+            olderMessagesCursor = data.next_cursor;
+            const previousHeight = messagesArea.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            let lastSenderId = null;
+            data.messages.forEach(msg => {
+                fragment.appendChild(buildMessageElement(msg, msg.sender_id !== lastSenderId));
+                lastSenderId = msg.sender_id;
+            });
+            messagesArea.insertBefore(fragment, messagesArea.firstChild);
+            messagesArea.scrollTop = messagesArea.scrollHeight - previousHeight;
+        } catch (error) {
+            console.error('Error cargando mensajes anteriores:', error);
+        } finally {
+            loadingOlderMessages = false;
+        }
+    };
+
+    if (messagesArea) messagesArea.addEventListener('scroll', () => {
+        if (messagesArea.scrollTop === 0) loadOlderMessages();
+    });
     
     const renderConversations = (conversations) => {
         if (conversations.length === 0) {
@@ -221,7 +255,16 @@ document.addEventListener('DOMContentLoaded', () => {
     const appendMessage = (message, showHeader = true) => {
         const welcome = messagesArea.querySelector('.chat-welcome');
         if (welcome) welcome.remove();
-        
+
+        const lastMessage = messagesArea.lastElementChild;
+        if (lastMessage && lastMessage.dataset.senderId == message.sender_id) {
+            showHeader = false;
+        }
+        messagesArea.appendChild(buildMessageElement(message, showHeader));
+        scrollToBottom();
+    };
+
+    const buildMessageElement = (message, showHeader) => {
         const isSent = message.sender_id === currentUserId;
         
         let sender, senderName, senderAvatar;
@@ -234,11 +277,6 @@ document.addEventListener('DOMContentLoaded', () => {
             senderAvatar = sender?.profile_picture_url || '/static/img/placeholder-default.jpg';
         }
 
-        const lastMessage = messagesArea.lastElementChild;
-        if (lastMessage && lastMessage.dataset.senderId == message.sender_id) {
-            showHeader = false;
-        }
-
         const messageEl = document.createElement('div');
         messageEl.classList.add('message-group');
         if (!showHeader) messageEl.classList.add('compact');
@@ -254,8 +292,7 @@ document.addEventListener('DOMContentLoaded', () => {
         } else {
             messageEl.innerHTML = `<div class="message-body compact-body"><div class="message-text">${message.content}</div></div>`;
         }
-        messagesArea.appendChild(messageEl);
-        scrollToBottom();
+        return messageEl;
     };
 
     const scrollToBottom = () => { messagesArea.scrollTop = messagesArea.scrollHeight; };
@@ -263,7 +300,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const sendMessage = () => {
         const content = messageInput.innerText.trim();
         if (content && activeChatUserId) {
-            socket.emit('private_message', { token, recipient_id: activeChatUserId, content });
+            socket.emit('private_message', { recipient_id: activeChatUserId, content });
             appendMessage({ sender_id: currentUserId, content, created_at: new Date().toISOString() });
             messageInput.innerHTML = '';
             messageInput.focus();
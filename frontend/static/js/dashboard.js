@@ -18,9 +18,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- Selectores del DOM ---
     const exploreGrid = document.getElementById('explore-grid');
+    const followingFeedGrid = document.getElementById('following-feed-grid');
     const myAlbumsGrid = document.getElementById('my-albums-grid');
     const savedAlbumsGrid = document.getElementById('saved-albums-grid');
-    const paginationControls = document.getElementById('pagination-controls');
     const tabs = document.querySelectorAll('.tab-link');
     const tabContents = document.querySelectorAll('.tab-content');
     const createAlbumModal = document.getElementById('create-album-modal');
@@ -42,7 +42,9 @@ document.addEventListener('DOMContentLoaded', () => {
             target.classList.add('active');
 
             // Cargar contenido de la pestaña solo si es la primera vez que se visita
-            if (targetId === 'saved-albums' && savedAlbumsGrid.innerHTML.trim() === '') {
+            if (targetId === 'following-feed' && followingFeedGrid.innerHTML.trim() === '') {
+                loadFollowingFeed();
+            } else if (targetId === 'saved-albums' && savedAlbumsGrid.innerHTML.trim() === '') {
                 loadSavedAlbums();
             } else if (targetId === 'my-albums' && myAlbumsGrid.innerHTML.trim() === '') {
                 loadMyAlbums();
@@ -51,24 +53,64 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // --- Lógica de Carga de Álbumes ---
-    const loadAlbums = async (page = 1) => {
-        exploreGrid.innerHTML = '<p>Cargando álbumes...</p>';
+    // Paginado por cursor (sin OFFSET ni COUNT en el servidor): "Cargar más" pide la página siguiente
+    const loadAlbums = async (cursor = null) => {
+        if (!cursor) exploreGrid.innerHTML = '<p>Cargando álbumes...</p>';
         try {
             // fetchWithAuth no es necesario aquí, ya que es una ruta pública
-            const response = await fetch(`${backendUrl}/api/albums?page=${page}&per_page=16`);
+            const params = new URLSearchParams({ per_page: 16, cursor: cursor || '' });
+            const response = await fetch(`${backendUrl}/api/albums?${params}`);
             if (!response.ok) throw new Error('No se pudieron cargar los álbumes.');
             
             const data = await response.json();
-            exploreGrid.innerHTML = '';
+            if (!cursor) exploreGrid.innerHTML = '';
+            exploreGrid.parentElement.querySelector('.load-more-btn')?.remove();
             data.albums.forEach(album => {
                 exploreGrid.insertAdjacentHTML('beforeend', createAlbumCard(album, album.user_id === currentUserId));
             });
-            renderPagination(data);
+            if (data.next_cursor) {
+                const button = document.createElement('button');
+                button.className = 'btn btn-secondary load-more-btn';
+                button.textContent = 'Cargar más';
+                button.addEventListener('click', () => loadAlbums(data.next_cursor));
+                exploreGrid.after(button);
+            }
         } catch (error) {
-            exploreGrid.innerHTML = `<p>No se pudieron cargar los álbumes. Intenta de nuevo más tarde.</p>`;
+            if (!cursor) exploreGrid.innerHTML = `<p>No se pudieron cargar los álbumes. Intenta de nuevo más tarde.</p>`;
+            else showToast(error.message, 'error');
         }
     };
     
+    // Feed de seguidos paginado por cursor: "Cargar más" pide la página siguiente a /api/me/feed
+    const loadFollowingFeed = async (cursor = null) => {
+        if (!cursor) followingFeedGrid.innerHTML = '<p>Cargando novedades...</p>';
+        try {
+            const params = new URLSearchParams({ per_page: 16 });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetchWithAuth(`/api/me/feed?${params}`);
+            if (!response.ok) throw new Error('No se pudo cargar el feed.');
+
+            const data = await response.json();
+            if (!cursor) followingFeedGrid.innerHTML = '';
+            followingFeedGrid.parentElement.querySelector('.load-more-btn')?.remove();
+            if (!cursor && data.albums.length === 0) {
+                followingFeedGrid.innerHTML = '<p>Aún no hay álbumes de las personas que sigues.</p>';
+                return;
+            }
+            data.albums.forEach(album => followingFeedGrid.insertAdjacentHTML('beforeend', createAlbumCard(album, album.user_id === currentUserId)));
+            if (data.next_cursor) {
+                const button = document.createElement('button');
+                button.className = 'btn btn-secondary load-more-btn';
+                button.textContent = 'Cargar más';
+                button.addEventListener('click', () => loadFollowingFeed(data.next_cursor));
+                followingFeedGrid.after(button);
+            }
+        } catch (error) {
+            if (!cursor) followingFeedGrid.innerHTML = `<p>No se pudo cargar el feed.</p>`;
+            else showToast(error.message, 'error');
+        }
+    };
+
     // CAMBIO: Usa el nuevo endpoint optimizado /api/me/albums
     const loadMyAlbums = async () => {
         myAlbumsGrid.innerHTML = '<p>Cargando tus álbumes...</p>';
@@ -135,29 +177,6 @@ document.addEventListener('DOMContentLoaded', () => {
             </div>`;
     };
 
-    const renderPagination = (paginationData) => {
-        const { current_page, total_pages } = paginationData;
-        paginationControls.innerHTML = '';
-        if (total_pages <= 1) { 
-            paginationControls.style.display = 'none'; 
-            return; 
-        }
-        paginationControls.style.display = 'flex';
-        let html = '';
-        html += `<a href="#" class="page-btn ${current_page === 1 ? 'disabled' : ''}" data-page="${current_page - 1}">‹ Anterior</a>`;
-        for (let i = 1; i <= total_pages; i++) {
-            if (i === current_page) {
-                html += `<a href="#" class="page-number active" data-page="${i}">${i}</a>`;
-            } else if (Math.abs(i - current_page) < 2 || i === 1 || i === total_pages) {
-                html += `<a href="#" class="page-number" data-page="${i}">${i}</a>`;
-            } else if (Math.abs(i - current_page) === 2) {
-                html += `<span class="ellipsis">...</span>`;
-            }
-        }
-        html += `<a href="#" class="page-btn ${current_page === total_pages ? 'disabled' : ''}" data-page="${current_page + 1}">Siguiente ›</a>`;
-        paginationControls.innerHTML = html;
-    };
-
     // --- Lógica de Eventos de la Página ---
     document.body.addEventListener('click', async (e) => {
         const deleteBtn = e.target.closest('.btn-control.delete');
@@ -172,7 +191,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (response.ok) {
                     showToast('Álbum eliminado.'); // Usa showToast de utils.js
                     // Recargar las dos vistas donde podría aparecer el álbum
-                    loadAlbums(1);
+                    loadAlbums();
                     loadMyAlbums();
                 } else {
                     showToast('Error al eliminar el álbum.', 'error'); // Usa showToast de utils.js
@@ -181,14 +200,6 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    paginationControls.addEventListener('click', (e) => {
-        e.preventDefault();
-        const pageBtn = e.target.closest('[data-page]');
-        if (pageBtn && !pageBtn.classList.contains('disabled') && !pageBtn.classList.contains('active')) {
-            loadAlbums(parseInt(pageBtn.dataset.page, 10));
-        }
-    });
-
     createAlbumFilesInput.addEventListener('change', () => {
         const numFiles = createAlbumFilesInput.files.length;
         createAlbumStatus.textContent = numFiles > 0 ? `${numFiles} archivo(s) seleccionado(s).` : '';
@@ -251,12 +262,12 @@ document.addEventListener('DOMContentLoaded', () => {
             e.target.reset();
             createAlbumStatus.textContent = '';
             // Recargar ambas vistas para que el nuevo álbum aparezca inmediatamente
-            loadAlbums(1);
+            loadAlbums();
             loadMyAlbums();
         }
     });
 
     // Carga inicial
-    loadAlbums(1); // Carga la pestaña "Explorar"
+    loadAlbums(); // Carga la pestaña "Explorar"
     loadMyAlbums(); // Carga "Mis Álbumes" en segundo plano
 });
\ No newline at end of file
@@ -103,7 +103,7 @@ function setupForms() {
 
 function loadMostViewedAlbums() {
     const gridContainer = document.getElementById('album-grid-container');
-    const apiUrl = `${window.backendUrl}/api/albums?sort_by=views_count&sort_order=desc&per_page=6`;
+    const apiUrl = `${window.backendUrl}/api/albums?sort_by=views_count&sort_order=desc&per_page=6&cursor=`;
     fetch(apiUrl)
         .then(response => response.ok ? response.json() : Promise.reject('Error de red'))
         .then(data => {
@@ -3,12 +3,13 @@
 // La lógica de Socket.IO se mantiene global y se ejecuta una sola vez.
 const token = localStorage.getItem('accessToken');
 if (token && typeof io !== 'undefined') {
-    const socket = io(window.backendUrl); 
+    // El token viaja una sola vez, al conectar; el servidor lo guarda en la sesión del socket
+    const socket = io(window.backendUrl, { auth: (cb) => cb({ token: localStorage.getItem('accessToken') }) });
 
     socket.on('connect', () => {
         console.log('Socket conectado globalmente.');
-        socket.emit('authenticate', { token });
     });
+    socket.on('auth_expired', () => socket.emit('authenticate', { token: localStorage.getItem('accessToken') }));
 
     socket.on('new_notification', (data) => {
         const notificationsButton = document.getElementById('notifications-btn');
@@ -64,7 +65,7 @@ function initializeGlobalEventListeners() {
             return;
         }
         try {
-            const response = await fetchWithAuth(`/api/search?q=${query}`);
+            const response = await fetchWithAuth(`/api/search?q=${encodeURIComponent(query)}`);
             const results = await response.json();
             renderSearchResults(results);
         } catch (error) {